@@ -28,10 +28,12 @@ from __future__ import division
 import logging
 import operator
 
-from numpy import exp, ones, zeros, unique, array, dot, float64
+from numpy import abs as absolute, argsort, array, bincount, concatenate, dot, exp, float64, isfinite, minimum, ones, \
+    searchsorted, sqrt, unique, where, zeros
+from numpy.linalg import LinAlgError, lstsq, solve
 try:
     from scipy.optimize import fsolve
-except:
+except ImportError:
     pass
 
 
@@ -77,6 +79,142 @@ def build_dummies_dict(data):
     return output
 
 
+def build_codes(data, categories):
+    '''
+    return the integer codes of data: the index of each value in categories, or -1 when the value is not a category
+    '''
+    categories = array(categories)
+    order = argsort(categories, kind = 'mergesort')
+    sorted_categories = categories[order]
+    indexes = minimum(searchsorted(sorted_categories, data), len(categories) - 1)
+    return where(sorted_categories[indexes] == data, order[indexes], -1)
+
+
+class DesignMatrix(object):
+    '''
+    nk x nj matrix of the constraints, that never materializes the dummies of categorical margins
+
+    A categorical margin is stored as a vector of integer codes (one per observation) and its products are computed
+    with bincount, so that memory doesn't depend on the number of categories.
+    '''
+    blocks = None  # list of (first column, codes or None, categories count or None, values or None)
+    nj = 0
+    nk = None
+
+    def __init__(self, nk):
+        self.blocks = []
+        self.nk = nk
+
+    def add_categorical(self, codes, categories_count):
+        self.blocks.append((self.nj, codes, categories_count, None))
+        self.nj += categories_count
+
+    def add_numeric(self, values):
+        self.blocks.append((self.nj, None, None, values))
+        self.nj += 1
+
+    def dot(self, lambda_):
+        '''
+        return x.lambda
+        '''
+        u = zeros(self.nk)
+        for j, codes, categories_count, values in self.blocks:
+            if codes is None:
+                u += lambda_[j] * values
+            else:
+                u += concatenate((lambda_[j:j + categories_count], [0]))[codes]
+        return u
+
+    def transpose_dot(self, w):
+        '''
+        return x'.w
+        '''
+        result = zeros(self.nj)
+        for j, codes, categories_count, values in self.blocks:
+            if codes is None:
+                result[j] = dot(values, w)
+            else:
+                result[j:j + categories_count] = bincount_codes(codes, w, categories_count)
+        return result
+
+    def weighted_gram(self, w):
+        '''
+        return x' diag(w) x
+        '''
+        gram = zeros((self.nj, self.nj))
+        for block_index, (j, codes, categories_count, values) in enumerate(self.blocks):
+            if codes is None:
+                gram[j, j] = dot(w * values, values)
+            else:
+                gram[range(j, j + categories_count), range(j, j + categories_count)] = bincount_codes(codes, w,
+                    categories_count)
+            for other_j, other_codes, other_categories_count, other_values in self.blocks[:block_index]:
+                if codes is None and other_codes is None:
+                    cross = dot(w * values, other_values)
+                elif codes is None:
+                    cross = bincount_codes(other_codes, w * values, other_categories_count)
+                elif other_codes is None:
+                    cross = bincount_codes(codes, w * other_values, categories_count)
+                else:
+                    is_coded = (codes >= 0) & (other_codes >= 0)
+                    cross = bincount(
+                        codes[is_coded] * other_categories_count + other_codes[is_coded],
+                        weights = w[is_coded],
+                        minlength = categories_count * other_categories_count,
+                        ).reshape(categories_count, other_categories_count)
+                cross = array(cross).reshape(categories_count or 1, other_categories_count or 1)
+                gram[j:j + (categories_count or 1), other_j:other_j + (other_categories_count or 1)] = cross
+                gram[other_j:other_j + (other_categories_count or 1), j:j + (categories_count or 1)] = cross.T
+        return gram
+
+
+def bincount_codes(codes, w, categories_count):
+    is_coded = codes >= 0
+    return bincount(codes[is_coded], weights = w[is_coded], minlength = categories_count)
+
+
+def newton(constraint, constraint_prime, lambda0, xtol = 1.49012e-08, maxiter = 100):
+    '''
+    solve constraint(lambda) = 0 by Newton-Raphson iterations, using the jacobian constraint_prime
+
+    Each Newton step is damped by backtracking until the norm of the constraint decreases: this keeps the iterations
+    inside the domain of bounded methods (logit) instead of restarting the solver.
+    Return the solution and a dict of diagnostics (converged, iterations, residual norms).
+    '''
+    lambda_ = array(lambda0, dtype = float64)
+    g = constraint(lambda_)
+    norm = sqrt(dot(g, g))
+    norms = [norm]
+    converged = False
+    iteration = 0
+    while iteration < maxiter:
+        iteration += 1
+        jacobian = constraint_prime(lambda_)
+        try:
+            step = solve(jacobian, -g)
+        except LinAlgError:
+            step = lstsq(jacobian, -g, rcond = None)[0]
+        t = 1.0
+        while True:
+            new_lambda = lambda_ + t * step
+            new_g = constraint(new_lambda)
+            new_norm = sqrt(dot(new_g, new_g))
+            if isfinite(new_norm) and new_norm <= (1 - 1e-4 * t) * norm or t < 1e-10:
+                break
+            t /= 2
+        if not isfinite(new_norm):
+            break
+        lambda_, g, norm = new_lambda, new_g, new_norm
+        norms.append(norm)
+        if absolute(t * step).max() <= xtol * (xtol + absolute(lambda_).max()):
+            converged = True
+            break
+        if t < 1e-10:
+            # No progress along the Newton direction: the constraints can't be reached (too narrow bounds...).
+            break
+    return lambda_, dict(converged = converged, iterations = iteration, norms = norms)
+
+
 def calmar(data_in, margins, parameters = {}, pondini='wprm_init'):
     '''
     Calibraters weights according to some margins
@@ -92,19 +230,25 @@ def calmar(data_in, margins, parameters = {}, pondini='wprm_init'):
       - up     : upper bound on weights ration >1
       - use_proportions : default FALSE; if TRUE use proportions if total population from margins doesn't match total
         population
+      - solver : 'fsolve' (default) or 'newton' (damped Newton-Raphson iterations, faster on large samples)
       - param xtol  : relative precision on lagrangian multipliers. By default xtol = 1.49012e-08 (default fsolve xtol)
+      - param maxiter : maximum number of Newton iterations (default 100)
       - param maxfev :  maximum number of function evaluation TODO
+      - return_diagnostics : default False; if True, a dict of convergence diagnostics (solver, converged, iterations,
+        max_rel_error) is returned as a fourth item
     '''
 
-    # remove null weights and keep original data
-    data = dict()
-    is_weight_not_null = (data_in[pondini] > 0)
-    for a in data_in:
-        data[a] = data_in[a][is_weight_not_null]
-
     if not margins:
         raise Exception("Calmar requires non empty dict of margins")
 
+    # remove null weights and keep original data, copying only the variables used by margins
+    data = dict()
+    is_weight_not_null = (data_in[pondini] > 0)
+    all_weights_not_null = is_weight_not_null.all()
+    for a in set(margins).union([pondini]):
+        if a in data_in:
+            data[a] = data_in[a] if all_weights_not_null else data_in[a][is_weight_not_null]
+
     # choice of method
     if 'method' not in parameters:
         parameters['method'] = 'linear'
@@ -142,25 +286,14 @@ def calmar(data_in, margins, parameters = {}, pondini='wprm_init'):
 
     nk = len(data[pondini])
 
-    # number of Lagrange parameters (at least total population)
-    nj = 1
-
-    margins_new = {}
+    # matrix of constraints: one block of integer codes by categorical margin, one column by numeric margin
+    x = DesignMatrix(nk)  # nb obs x nb constraints
+    margins_new = []  # (constraint name, margin) couples, in the order of the columns of x
     margins_new_dict = {}
     for var, val in margins.iteritems():
         if isinstance(val, dict):
-            dummies_dict = build_dummies_dict(data[var])
-            k, pop = 0, 0
-            for cat, nb in val.iteritems():
-                cat_varname = var + '_' + str(cat)
-                data[cat_varname] = dummies_dict[cat]
-                margins_new[cat_varname] = nb
-                if var not in margins_new_dict:
-                    margins_new_dict[var] = {}
-                margins_new_dict[var][cat] = nb
-                pop += nb
-                k += 1
-                nj += 1
+            categories = list(val.keys())
+            pop = sum(val.itervalues())
             # Check total popualtion
             if pop != total_population:
                 if use_proportions:
@@ -169,42 +302,33 @@ def calmar(data_in, margins, parameters = {}, pondini='wprm_init'):
                             var
                             )
                         )
-                    for cat, nb in val.iteritems():
-                        cat_varname = var + '_' + str(cat)
-                        margins_new[cat_varname] = nb * total_population / pop
-                        margins_new_dict[var][cat] = nb * total_population / pop
                 else:
                     raise Exception('calmar: categorical variable ', var, ' is inconsistent with population')
+            margins_new_dict[var] = {}
+            for cat in categories:
+                nb = val[cat] * total_population / pop if pop != total_population else val[cat]
+                margins_new.append((var + '_' + str(cat), nb))
+                margins_new_dict[var][cat] = nb
+            x.add_categorical(build_codes(data[var], categories), len(categories))
         else:
-            margins_new[var] = val
+            margins_new.append((var, val))
             margins_new_dict[var] = val
-            nj += 1
+            x.add_numeric(data[var])
 
     # On conserve systematiquement la population
-    if hasattr(data, 'dummy_is_in_pop'):
-        raise Exception('dummy_is_in_pop is not a valid variable name')
-
-    data['dummy_is_in_pop'] = ones(nk)
-    margins_new['dummy_is_in_pop'] = total_population
+    x.add_numeric(ones(nk))
+    margins_new.append(('dummy_is_in_pop', total_population))
 
     # paramètres de Lagrange initialisés à zéro
-    lambda0 = zeros(nj)
+    lambda0 = zeros(x.nj)
 
     # initial weights
     d = data[pondini]
-    x = zeros((nk, nj))  # nb obs x nb constraints
-    xmargins = zeros(nj)
-    margins_dict = {}
-    j = 0
-    for var, val in margins_new.iteritems():
-        x[:, j] = data[var]
-        xmargins[j] = val
-        margins_dict[var] = val
-        j += 1
+    xmargins = array([val for var, val in margins_new], dtype = float64)
 
     # Résolution des équations du premier ordre
-    constraint = lambda l: dot(d * F(dot(x, l)), x) - xmargins
-    constraint_prime = lambda l: dot(d * (x.T * F_prime(dot(x, l))), x)
+    constraint = lambda lambda_: x.transpose_dot(d * F(x.dot(lambda_))) - xmargins
+    constraint_prime = lambda lambda_: x.weighted_gram(d * F_prime(x.dot(lambda_)))
     # le jacobien celui ci-dessus est constraintprime = @(l) x*(d.*Fprime(x'*l)*x');
 
     tries, ier = 0, 2
@@ -213,6 +337,26 @@ def calmar(data_in, margins, parameters = {}, pondini='wprm_init'):
     else:
         xtol = 1.49012e-08
 
+    solver = parameters.get('solver', 'fsolve')
+    if solver == 'newton':
+        lambdasol, diagnostics = newton(constraint, constraint_prime, lambda0, xtol = xtol,
+            maxiter = parameters.get('maxiter', 100))
+        pondfin = d * F(x.dot(lambdasol))
+        max_rel_error = (absolute(x.transpose_dot(pondfin) - xmargins) / xmargins).max()
+        if diagnostics['converged']:
+            log.info("calmar: converged after {} Newton iterations, maximal relative error on margins: {}".format(
+                diagnostics['iterations'], max_rel_error))
+        else:
+            log.warning("calmar: not converged after {} Newton iterations, maximal relative error on margins: {}"
+                .format(diagnostics['iterations'], max_rel_error))
+        pondfin_out = array(data_in[pondini], dtype = float64)
+        pondfin_out[is_weight_not_null] = pondfin
+        if parameters.get('return_diagnostics'):
+            diagnostics.update(max_rel_error = max_rel_error, solver = solver)
+            return pondfin_out, lambdasol, margins_new_dict, diagnostics
+        return pondfin_out, lambdasol, margins_new_dict
+    assert solver == 'fsolve', "solver should be 'fsolve' or 'newton'"
+
     err_max = 1
     conv = 1
     while (ier == 2 or ier == 5 or ier == 4) and not (tries >= 10 or (err_max < 1e-6 and conv < 1e-8)):
@@ -226,10 +370,11 @@ def calmar(data_in, margins, parameters = {}, pondini='wprm_init'):
         lambda0 = 1 * lambdasol
         tries += 1
 
-        pondfin = d * F(dot(x, lambdasol))
-        rel_error = {}
-        for var, val in margins_new.iteritems():
-            rel_error[var] = abs((data[var] * pondfin).sum() - margins_dict[var]) / margins_dict[var]
+        pondfin = d * F(x.dot(lambdasol))
+        rel_error = dict(
+            (var, rel_error)
+            for (var, val), rel_error in zip(margins_new, absolute(x.transpose_dot(pondfin) - xmargins) / xmargins)
+            )
         sorted_err = sorted(rel_error.iteritems(), key = operator.itemgetter(1), reverse = True)
 
         conv = abs(err_max - sorted_err[0][1])
@@ -240,4 +385,12 @@ def calmar(data_in, margins, parameters = {}, pondini='wprm_init'):
     # rebuilding a weight vector with the same size of the initial one
     pondfin_out = array(data_in[pondini], dtype = float64)
     pondfin_out[is_weight_not_null] = pondfin
+    if parameters.get('return_diagnostics'):
+        return pondfin_out, lambdasol, margins_new_dict, dict(
+            converged = ier == 1 or (err_max < 1e-6 and conv < 1e-8),
+            iterations = tries,
+            max_rel_error = err_max,
+            message = mesg,
+            solver = solver,
+            )
     return pondfin_out, lambdasol, margins_new_dict
@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+
+
+# OpenFisca -- A versatile microsimulation software
+# By: OpenFisca Team <contact@openfisca.fr>
+#
+# Copyright (C) 2011, 2012, 2013, 2014, 2015 OpenFisca Team
+# https://github.com/openfisca
+#
+# This file is part of OpenFisca.
+#
+# OpenFisca is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# OpenFisca is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""Simulate a population larger than memory, chunk by chunk
+
+The persons of a column store are split into chunks that never break an entity (a family, a household...): every
+member of an entity belongs to the same chunk. A simulation is built for each chunk, its results are given to
+consumers (reducers, writers...) and the simulation is dropped before moving to the next chunk, so that peak memory
+only depends on the size of a chunk.
+"""
+
+
+import numpy as np
+
+from . import columnstores, simulations
+
+
+__all__ = [
+    'Chunk',
+    'ChunkWriter',
+    'iter_chunks',
+    'simulate_by_chunk',
+    ]
+
+
+class Chunk(object):
+    """A subset of the population of a column store, containing only whole entities"""
+    index = None  # Rank of chunk
+    index_array_by_entity_key_plural = None  # Index of entity of each person of chunk, renumbered inside chunk
+    rows_by_entity_key_plural = None  # Rows (a slice or an array of indexes) of each entity in the column store
+
+    def __init__(self, index = None, index_array_by_entity_key_plural = None, rows_by_entity_key_plural = None):
+        self.index = index
+        self.index_array_by_entity_key_plural = index_array_by_entity_key_plural
+        self.rows_by_entity_key_plural = rows_by_entity_key_plural
+
+    def fill_simulation(self, column_store, simulation, variables_name = None):
+        """Give the rows of the chunk to the holders of a new simulation.
+
+        When rows are contiguous, holders get memory-mapped views of the column store. Otherwise, only the rows of the
+        chunk are copied.
+        """
+        entity_by_key_plural = simulation.entity_by_key_plural
+        for entity_key_plural, entity in entity_by_key_plural.iteritems():
+            entity.count = count_rows(self.rows_by_entity_key_plural[entity_key_plural])
+        persons = simulation.persons
+        index_variable_name_by_entity_key_plural = dict(
+            (entity.key_plural, entity.index_for_person_variable_name)
+            for entity in entity_by_key_plural.itervalues()
+            if not entity.is_persons_entity
+            )
+        for entity_key_plural, index_variable_name in index_variable_name_by_entity_key_plural.iteritems():
+            holder = persons.get_or_new_holder(index_variable_name)
+            holder.array = self.index_array_by_entity_key_plural[entity_key_plural].astype(holder.dtype)
+        if variables_name is not None:
+            variables_name = set(variables_name)
+            for entity in entity_by_key_plural.itervalues():
+                if not entity.is_persons_entity:
+                    variables_name.add(entity.role_for_person_variable_name)
+
+        index_variables_name = set(index_variable_name_by_entity_key_plural.itervalues())
+        for variable_name in sorted(column_store.variable_json_by_name):
+            if variable_name in index_variables_name \
+                    or variables_name is not None and variable_name not in variables_name:
+                continue
+            holder = simulation.get_or_new_holder(variable_name)
+            rows = self.rows_by_entity_key_plural[holder.entity.key_plural]
+            # Note: For set_input to work, handle days, before months, before years => use sorted().
+            for period, array in sorted(column_store.iter_arrays(variable_name), key = lambda couple: couple[0]):
+                holder.set_input(simulation.period if period is None else period, array[rows])
+
+        for entity in entity_by_key_plural.itervalues():
+            if not entity.is_persons_entity:
+                entity.roles_count = int(persons.get_or_new_holder(entity.role_for_person_variable_name).array.max()) \
+                    + 1
+
+    def new_simulation(self, column_store, tax_benefit_system = None, period = None, variables_name = None):
+        simulation = simulations.Simulation(period = period, tax_benefit_system = tax_benefit_system)
+        self.fill_simulation(column_store, simulation, variables_name = variables_name)
+        return simulation
+
+
+class ChunkWriter(object):
+    """A consumer writing variables computed for each chunk into a new column store, at the rows of the chunk"""
+    count_by_entity_key_plural = None
+    period = None
+    variables_name = None
+    writer = None
+
+    def __init__(self, directory = None, column_store = None, period = None, tax_benefit_system = None,
+            variables_name = None):
+        self.count_by_entity_key_plural = dict(
+            (entity_key_plural, column_store.get_count(entity_class))
+            for entity_key_plural, entity_class in tax_benefit_system.entity_class_by_key_plural.iteritems()
+            )
+        self.period = period
+        self.variables_name = variables_name
+        self.writer = columnstores.ColumnStoreWriter(directory = directory, tax_benefit_system = tax_benefit_system)
+
+    def close(self):
+        self.writer.close()
+        return columnstores.ColumnStore(directory = self.writer.directory)
+
+    def update(self, simulation, chunk = None):
+        period = self.period or simulation.period
+        for variable_name in self.variables_name:
+            dated_holder = simulation.compute(variable_name, period)
+            entity_key_plural = dated_holder.entity.key_plural
+            self.writer.write_rows(variable_name, dated_holder.array,
+                chunk.rows_by_entity_key_plural[entity_key_plural],
+                count = self.count_by_entity_key_plural[entity_key_plural], period = period)
+
+
+def count_rows(rows):
+    if isinstance(rows, slice):
+        return rows.stop - rows.start
+    return len(rows)
+
+
+def iter_chunks(column_store, tax_benefit_system, max_persons_count = 100000):
+    """Split the persons of a column store into chunks of whole entities, containing at most max_persons_count persons.
+
+    Only the chunks containing an entity bigger than max_persons_count are allowed to exceed this size.
+    """
+    assert max_persons_count >= 1, max_persons_count
+    entity_class_by_key_plural = tax_benefit_system.entity_class_by_key_plural
+    persons_key_plural = tax_benefit_system.person_key_plural
+    persons_count = column_store.count_by_entity_key_plural[persons_key_plural]
+    index_array_by_entity_key_plural = dict(
+        (key_plural, np.asarray(column_store.get_array(entity_class.index_for_person_variable_name)))
+        for key_plural, entity_class in entity_class_by_key_plural.iteritems()
+        if not entity_class.is_persons_entity
+        )
+
+    group_array = group_persons_by_entities(persons_count, index_array_by_entity_key_plural.values())
+    is_sorted = bool(np.all(group_array[1:] >= group_array[:-1]))
+    if is_sorted:
+        # Persons of each entity are contiguous => Chunks are slices of the column store.
+        sorted_group_array = group_array
+        order = None
+    else:
+        order = np.argsort(group_array, kind = 'mergesort')
+        sorted_group_array = group_array[order]
+    bounds = np.concatenate((
+        np.flatnonzero(sorted_group_array[1:] != sorted_group_array[:-1]) + 1,
+        [persons_count],
+        ))
+
+    chunk_index = 0
+    start = 0
+    while start < persons_count:
+        bound_index = np.searchsorted(bounds, start + max_persons_count, side = 'right') - 1
+        stop = bounds[bound_index] if bound_index >= 0 else 0
+        if stop <= start:
+            # A single group of persons is bigger than max_persons_count.
+            stop = bounds[np.searchsorted(bounds, start, side = 'right')]
+        persons_rows = slice(start, int(stop)) if is_sorted else np.sort(order[start:stop])
+        rows_by_entity_key_plural = {persons_key_plural: persons_rows}
+        chunk_index_array_by_entity_key_plural = {}
+        for entity_key_plural, index_array in index_array_by_entity_key_plural.iteritems():
+            persons_entity_index_array = index_array[persons_rows]
+            entity_index_array = np.unique(persons_entity_index_array)
+            first_entity_index = entity_index_array[0]
+            if entity_index_array[-1] - first_entity_index + 1 == len(entity_index_array):
+                rows_by_entity_key_plural[entity_key_plural] = slice(int(first_entity_index),
+                    int(entity_index_array[-1]) + 1)
+                chunk_index_array_by_entity_key_plural[entity_key_plural] = \
+                    persons_entity_index_array - first_entity_index
+            else:
+                rows_by_entity_key_plural[entity_key_plural] = entity_index_array
+                chunk_index_array_by_entity_key_plural[entity_key_plural] = np.searchsorted(entity_index_array,
+                    persons_entity_index_array)
+        yield Chunk(
+            index = chunk_index,
+            index_array_by_entity_key_plural = chunk_index_array_by_entity_key_plural,
+            rows_by_entity_key_plural = rows_by_entity_key_plural,
+            )
+        chunk_index += 1
+        start = stop
+
+
+def group_persons_by_entities(persons_count, index_arrays):
+    """Return for each person the lowest index of the persons linked to it through entities (directly or not).
+
+    Two persons have the same group when they can't be separated without breaking an entity.
+    """
+    group_array = np.arange(persons_count)
+    sorted_index_arrays = []
+    for index_array in index_arrays:
+        order = np.argsort(index_array, kind = 'mergesort')
+        sorted_index_array = index_array[order]
+        starts = np.concatenate(([0], np.flatnonzero(sorted_index_array[1:] != sorted_index_array[:-1]) + 1))
+        sorted_index_arrays.append((index_array, order, sorted_index_array[starts], starts))
+    while True:
+        new_group_array = group_array
+        for index_array, order, entities_index, starts in sorted_index_arrays:
+            entity_group_array = np.empty(entities_index[-1] + 1, dtype = group_array.dtype)
+            entity_group_array[entities_index] = np.minimum.reduceat(new_group_array[order], starts)
+            new_group_array = np.minimum(new_group_array, entity_group_array[index_array])
+        if np.array_equal(new_group_array, group_array):
+            return group_array
+        group_array = new_group_array
+
+
+def simulate_by_chunk(column_store, tax_benefit_system = None, period = None, consumers = None,
+        max_persons_count = 100000, variables_name = None):
+    """Build a simulation for each chunk of the population of a column store and give it to each consumer.
+
+    A consumer is an object with an ``update(simulation, chunk)`` method: a reducer, a ChunkWriter...
+    The compact legislations are computed once and shared by the simulations of every chunk.
+    """
+    assert consumers
+    compact_legislation_by_instant_cache = {}
+    reference_compact_legislation_by_instant_cache = {}
+    for chunk in iter_chunks(column_store, tax_benefit_system, max_persons_count = max_persons_count):
+        simulation = simulations.Simulation(period = period, tax_benefit_system = tax_benefit_system)
+        simulation.compact_legislation_by_instant_cache = compact_legislation_by_instant_cache
+        simulation.reference_compact_legislation_by_instant_cache = reference_compact_legislation_by_instant_cache
+        chunk.fill_simulation(column_store, simulation, variables_name = variables_name)
+        for consumer in consumers:
+            consumer.update(simulation, chunk)
+        del simulation
+    return consumers
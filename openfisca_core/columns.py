@@ -25,12 +25,13 @@
 
 import collections
 import datetime
+import json
 import re
 
 from biryani import strings
 import numpy as np
 
-from . import conv, periods
+from . import conv, dates, periods
 from .enumerations import Enum
 
 
@@ -43,6 +44,7 @@ year_or_month_or_day_re = re.compile(ur'(18|19|20)\d{2}(-(0[1-9]|1[0-2])(-([0-2]
 
 class Column(object):
     cerfa_field = None
+    compact_dtype = None  # Smaller dtype used by simulations optimizing memory (None when dtype is already compact)
     default = 0
     dtype = float
     end = None
@@ -97,6 +99,30 @@ class Column(object):
     def json_default(self):
         return self.default
 
+    def iter_array_json_fragments(self, array, chunk_size = 10000, decimals = None):
+        """Iterate the fragments of the JSON text of an array, converting it chunk by chunk to bound memory."""
+        yield '['
+        for start in xrange(0, len(array), chunk_size):
+            if start > 0:
+                yield ', '
+            yield json.dumps(self.transform_array_to_json(array[start:start + chunk_size], decimals = decimals))[1:-1]
+        yield ']'
+
+    @property
+    def json_to_array(self):
+        """Convert a JSON value (or list of values) to an array.
+
+        Columns whose cells can be converted all at once (without a converter by cell) may override this property.
+        """
+        return conv.pipe(
+            conv.make_item_to_singleton(),
+            conv.uniform_sequence(
+                self.json_to_dated_python,
+                ),
+            conv.empty_to_none,
+            conv.function(lambda cells_list: np.array(cells_list, dtype = self.dtype)),
+            )
+
     def make_json_to_array_by_period(self, period):
         return conv.condition(
             conv.test_isinstance(dict),
@@ -107,25 +133,13 @@ class Column(object):
                         periods.json_or_python_to_period,
                         conv.not_none,
                         ),
-                    conv.pipe(
-                        conv.make_item_to_singleton(),
-                        conv.uniform_sequence(
-                            self.json_to_dated_python,
-                            ),
-                        conv.empty_to_none,
-                        conv.function(lambda cells_list: np.array(cells_list, dtype = self.dtype)),
-                        ),
+                    self.json_to_array,
                     drop_none_values = True,
                     ),
                 conv.empty_to_none,
                 ),
             conv.pipe(
-                conv.make_item_to_singleton(),
-                conv.uniform_sequence(
-                    self.json_to_dated_python,
-                    ),
-                conv.empty_to_none,
-                conv.function(lambda cells_list: np.array(cells_list, dtype = self.dtype)),
+                self.json_to_array,
                 conv.function(lambda array: {period: array}),
                 ),
             )
@@ -181,6 +195,22 @@ class Column(object):
             self_json['val_type'] = self.val_type
         return self_json
 
+    def transform_array_to_json(self, array, decimals = None):
+        """Convert a NumPy array to a list of JSON values.
+
+        Columns converting values to JSON cell by cell must override this method with a vectorized conversion.
+        When ``decimals`` is given, float values are rounded.
+        """
+        if decimals is not None and array.dtype.kind == 'f':
+            array = np.round(array.astype(np.float64), decimals)
+        if self.__class__.transform_dated_value_to_json.im_func is Column.transform_dated_value_to_json.im_func:
+            return array.tolist()
+        transform_dated_value_to_json = self.transform_dated_value_to_json
+        return [
+            transform_dated_value_to_json(cell)
+            for cell in array.tolist()
+            ]
+
     def transform_dated_value_to_json(self, value):
         # Convert a non-NumPy Python value to JSON.
         return value
@@ -239,6 +269,22 @@ class DateCol(Column):
     def json_default(self):
         return unicode(np.array(self.default, self.dtype))  # 0 = 1970-01-01
 
+    @property
+    def json_to_array(self):
+        cells_json_to_array = super(DateCol, self).json_to_array
+
+        def json_to_array(value, state = None):
+            # Lists of ISO 8601 strings are parsed by NumPy in a single operation. Other values (and invalid strings,
+            # to report their errors) are converted cell by cell.
+            if isinstance(value, list) and value:
+                array = dates.parse_dates(value)
+                if array is not None and (array >= np.datetime64('1870-01-01')).all() \
+                        and (array <= np.datetime64('2099-12-31')).all():
+                    return array, None
+            return cells_json_to_array(value, state = state)
+
+        return json_to_array
+
     @property
     def json_to_dated_python(self):
         return conv.pipe(
@@ -262,6 +308,14 @@ class DateCol(Column):
             conv.test_between(datetime.date(1870, 1, 1), datetime.date(2099, 12, 31)),
             )
 
+    def transform_array_to_json(self, array, decimals = None):
+        values_json = np.datetime_as_string(array).tolist()
+        not_a_time_array = np.isnat(array)
+        if not_a_time_array.any():
+            for index in np.flatnonzero(not_a_time_array).tolist():
+                values_json[index] = None
+        return values_json
+
     def transform_dated_value_to_json(self, value):
         # Convert a non-NumPy Python value to JSON.
         return value.isoformat() if value is not None else value
@@ -367,6 +421,7 @@ class AgeCol(IntCol):
     '''
     A column of Int to store ages of people
     '''
+    compact_dtype = np.int16
     default = -9999
     is_period_size_independent = True
 
@@ -405,6 +460,11 @@ class EnumCol(IntCol):
         super(EnumCol, self).__init__(**kwargs)
         assert isinstance(enum, Enum)
         self.enum = enum
+        if all(
+                np.iinfo(np.int8).min <= index <= np.iinfo(np.int8).max
+                for index in enum._vars.iterkeys()
+                ):
+            self.compact_dtype = np.int8
 
     def empty_clone(self):
         return self.__class__(enum = self.enum)
@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+
+
+# OpenFisca -- A versatile microsimulation software
+# By: OpenFisca Team <contact@openfisca.fr>
+#
+# Copyright (C) 2011, 2012, 2013, 2014, 2015 OpenFisca Team
+# https://github.com/openfisca
+#
+# This file is part of OpenFisca.
+#
+# OpenFisca is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# OpenFisca is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""On-disk column store of survey input variables, read through memory-mapped arrays
+
+A column store is a directory containing one raw binary file per (variable, period) array and an ``index.json`` file
+describing them. Arrays are written with the dtype of their column, so that they can be given to holders without any
+conversion: the holders are then backed by read-only ``numpy.memmap`` arrays and the residency of the survey data is
+left to the page cache of the operating system.
+"""
+
+
+import collections
+import json
+import os
+
+import numpy as np
+
+from . import periods
+
+
+__all__ = [
+    'ColumnStore',
+    'ColumnStoreWriter',
+    'write_column_store',
+    ]
+
+
+index_file_name = 'index.json'
+
+
+class ColumnStore(object):
+    """A read-only column store of input variables"""
+    count_by_entity_key_plural = None
+    directory = None
+    variable_json_by_name = None
+
+    def __init__(self, directory = None):
+        assert directory is not None
+        self.directory = directory
+        with open(os.path.join(directory, index_file_name)) as index_file:
+            index_json = json.load(index_file)
+        self.count_by_entity_key_plural = index_json['count_by_entity_key_plural']
+        self.variable_json_by_name = index_json['variables']
+
+    def __contains__(self, variable_name):
+        return variable_name in self.variable_json_by_name
+
+    def fill_simulation(self, simulation, variables_name = None):
+        """Give the memory-mapped arrays of the store to the holders of a new simulation.
+
+        When ``variables_name`` is given, only these input variables (and the variables giving the composition of the
+        entities) are used.
+        """
+        persons = simulation.persons
+        for entity in simulation.entity_by_key_plural.itervalues():
+            entity.count = self.get_count(entity)
+        if variables_name is not None:
+            variables_name = set(variables_name)
+            for entity in simulation.entity_by_key_plural.itervalues():
+                if not entity.is_persons_entity:
+                    variables_name.add(entity.index_for_person_variable_name)
+                    variables_name.add(entity.role_for_person_variable_name)
+
+        for variable_name in sorted(self.variable_json_by_name):
+            if variables_name is not None and variable_name not in variables_name:
+                continue
+            holder = simulation.get_or_new_holder(variable_name)
+            # Note: For set_input to work, handle days, before months, before years => use sorted().
+            for period, array in sorted(self.iter_arrays(variable_name), key = lambda couple: couple[0]):
+                holder.set_input(simulation.period if period is None else period, array)
+
+        for entity in simulation.entity_by_key_plural.itervalues():
+            if entity.is_persons_entity:
+                continue
+            role_array = persons.get_or_new_holder(entity.role_for_person_variable_name).array
+            assert role_array is not None, u'Missing variable {} in column store {}'.format(
+                entity.role_for_person_variable_name, self.directory).encode('utf-8')
+            entity.roles_count = int(role_array.max()) + 1
+
+    def get_count(self, entity):
+        """Return the number of members of an entity (or entity class).
+
+        When the store has no variable of the entity, its count is deduced from the index of the persons in it.
+        """
+        count = self.count_by_entity_key_plural.get(entity.key_plural)
+        if count is None:
+            assert not entity.is_persons_entity, u'Missing variables of persons in column store {}'.format(
+                self.directory).encode('utf-8')
+            index_array = self.get_array(entity.index_for_person_variable_name)
+            count = int(index_array.max()) + 1 if index_array.size else 0
+        return count
+
+    def get_array(self, variable_name, period = None, start = None, stop = None):
+        """Return the memory-mapped array of a variable, optionally restricted to the rows in [start, stop[."""
+        variable_json = self.variable_json_by_name[variable_name]
+        if period is not None and not isinstance(period, periods.Period):
+            period = periods.period(period)
+        period_str = None if period is None else unicode(period)
+        for array_json in variable_json['arrays']:
+            if array_json['period'] == period_str:
+                return self.open_array(variable_json, array_json, start = start, stop = stop)
+        raise KeyError((variable_name, period_str))
+
+    def iter_arrays(self, variable_name, start = None, stop = None):
+        """Iterate the (period, memory-mapped array) couples of a variable. Period is None for permanent variables."""
+        variable_json = self.variable_json_by_name[variable_name]
+        for array_json in variable_json['arrays']:
+            period_str = array_json['period']
+            yield (
+                None if period_str is None else periods.period(period_str),
+                self.open_array(variable_json, array_json, start = start, stop = stop),
+                )
+
+    def open_array(self, variable_json, array_json, start = None, stop = None):
+        count = array_json['count']
+        dtype = np.dtype(str(variable_json['dtype']))
+        start = 0 if start is None else start
+        stop = count if stop is None else min(stop, count)
+        assert 0 <= start <= stop, (start, stop)
+        if start == stop:
+            # NumPy can't memory-map an empty range (nor an empty file).
+            return np.empty(0, dtype = dtype)
+        return np.memmap(
+            os.path.join(self.directory, array_json['file']),
+            dtype = dtype,
+            mode = 'r',
+            offset = start * dtype.itemsize,
+            shape = (stop - start,),
+            )
+
+
+class ColumnStoreWriter(object):
+    """Write input variables to a column store, appending arrays chunk by chunk to keep memory bounded"""
+    array_json_by_period_by_variable_name = None
+    column_by_name = None
+    directory = None
+    variable_json_by_name = None
+
+    def __init__(self, directory = None, tax_benefit_system = None):
+        assert directory is not None
+        assert tax_benefit_system is not None
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        self.array_json_by_period_by_variable_name = {}
+        self.column_by_name = tax_benefit_system.column_by_name
+        self.directory = directory
+        self.variable_json_by_name = collections.OrderedDict()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+
+    def append(self, variable_name, array, period = None):
+        """Append an array at the end of the (variable, period) array of the store.
+
+        Period may only be None for permanent variables.
+        """
+        array_json, dtype, is_new = self.get_or_new_array_json(variable_name, period)
+        array = np.asarray(array).astype(dtype, copy = False)
+        with open(os.path.join(self.directory, array_json['file']), 'wb' if is_new else 'ab') as array_file:
+            array.tofile(array_file)
+        array_json['count'] += array.size
+
+    def get_or_new_array_json(self, variable_name, period):
+        column = self.column_by_name[variable_name]
+        dtype = np.dtype(column.dtype)
+        assert dtype != np.object_, u'Variable {} of type {} can not be memory-mapped'.format(variable_name,
+            column.__class__.__name__).encode('utf-8')
+        assert period is not None or column.is_permanent, u'Missing period for variable {}'.format(
+            variable_name).encode('utf-8')
+        if period is not None and not isinstance(period, periods.Period):
+            period = periods.period(period)
+        period_str = None if period is None else unicode(period)
+
+        variable_json = self.variable_json_by_name.get(variable_name)
+        if variable_json is None:
+            self.variable_json_by_name[variable_name] = variable_json = collections.OrderedDict((
+                ('dtype', dtype.str),
+                ('entity', column.entity_key_plural),
+                ('arrays', []),
+                ))
+        array_json_by_period = self.array_json_by_period_by_variable_name.setdefault(variable_name, {})
+        array_json = array_json_by_period.get(period_str)
+        if array_json is not None:
+            return array_json, dtype, False
+        array_json_by_period[period_str] = array_json = collections.OrderedDict((
+            ('period', period_str),
+            ('file', u'{}.{}.bin'.format(variable_name, len(variable_json['arrays']))),
+            ('count', 0),
+            ))
+        variable_json['arrays'].append(array_json)
+        return array_json, dtype, True
+
+    def write_rows(self, variable_name, array, rows, count = None, period = None):
+        """Write an array into some rows (a slice or an array of indexes) of a (variable, period) array of the store.
+
+        On first write, the file of the (variable, period) array is preallocated with ``count`` rows, so that the rows
+        can be written in any order.
+        """
+        array_json, dtype, is_new = self.get_or_new_array_json(variable_name, period)
+        file_path = os.path.join(self.directory, array_json['file'])
+        if is_new:
+            assert count is not None and count > 0, count
+            with open(file_path, 'wb') as array_file:
+                array_file.truncate(count * dtype.itemsize)
+            array_json['count'] = count
+        else:
+            assert count is None or count == array_json['count'], (count, array_json['count'])
+        target_array = np.memmap(file_path, dtype = dtype, mode = 'r+', shape = (array_json['count'],))
+        target_array[rows] = array
+        target_array.flush()
+        del target_array
+
+    def close(self):
+        """Check that arrays of each entity have the same length and write the index of the store."""
+        count_by_entity_key_plural = {}
+        for variable_name, variable_json in self.variable_json_by_name.iteritems():
+            entity_key_plural = variable_json['entity']
+            for array_json in variable_json['arrays']:
+                entity_count = count_by_entity_key_plural.setdefault(entity_key_plural, array_json['count'])
+                assert array_json['count'] == entity_count, \
+                    u'Array of variable {} has not the same length as other variables of entity {}: {} != {}'.format(
+                        variable_name, entity_key_plural, array_json['count'], entity_count).encode('utf-8')
+        with open(os.path.join(self.directory, index_file_name), 'w') as index_file:
+            json.dump(
+                collections.OrderedDict((
+                    ('count_by_entity_key_plural', count_by_entity_key_plural),
+                    ('variables', self.variable_json_by_name),
+                    )),
+                index_file,
+                indent = 2,
+                )
+
+
+def write_column_store(directory, tax_benefit_system, input_variables):
+    """Write a column store from survey data and return it.
+
+    ``input_variables`` has the same structure as the ``input_variables`` of a scenario: a dictionary mapping each
+    variable name to a dictionary of arrays by period (period being None for permanent variables).
+    """
+    with ColumnStoreWriter(directory = directory, tax_benefit_system = tax_benefit_system) as writer:
+        for variable_name, array_by_period in input_variables.iteritems():
+            for period, array in array_by_period.iteritems():
+                writer.append(variable_name, array, period = period)
+    return ColumnStore(directory = directory)
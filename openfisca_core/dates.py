@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+
+
+# OpenFisca -- A versatile microsimulation software
+# By: OpenFisca Team <contact@openfisca.fr>
+#
+# Copyright (C) 2011, 2012, 2013, 2014, 2015 OpenFisca Team
+# https://github.com/openfisca
+#
+# This file is part of OpenFisca.
+#
+# OpenFisca is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# OpenFisca is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""Vectorized computations on arrays of dates (``datetime64[D]``), such as ages at an instant
+
+These functions work on whole arrays, without converting their cells to Python ``datetime.date`` objects.
+"""
+
+
+import numpy as np
+
+
+__all__ = [
+    'get_age',
+    'get_months_between',
+    'is_in_period',
+    'parse_dates',
+    ]
+
+
+def get_age(birth, instant, unit = u'year'):
+    """Return the ages in completed years (or months, when unit is "month") at instant of the given birth dates.
+
+    >>> from openfisca_core import periods
+    >>> birth = np.array(['1973-05-14', '1973-05-15', '2012-02-29'], dtype = 'datetime64[D]')
+    >>> get_age(birth, periods.instant('2013-05-14'))
+    array([40, 39,  1])
+    >>> get_age(birth, periods.instant('2013-05-14'), unit = u'month')
+    array([480, 479,  14])
+    """
+    months = get_months_between(birth, np.datetime64(instant.date, 'D'))
+    if unit == u'month':
+        return months
+    assert unit == u'year', 'Invalid unit: {} of type {}'.format(unit, type(unit))
+    return months // 12
+
+
+def get_months_between(start, stop):
+    """Return the numbers of completed months from start dates to stop dates (negative when stop is before start).
+
+    A month is completed on the same day of the following month, or on the day after its end when it is shorter.
+
+    >>> get_months_between(np.array(['2014-01-31', '2014-01-31', '2014-03-15'], dtype = 'datetime64[D]'),
+    ...     np.array(['2014-02-28', '2014-03-01', '2014-01-20'], dtype = 'datetime64[D]'))
+    array([ 0,  1, -1])
+    """
+    start = np.asarray(start, dtype = 'datetime64[D]')
+    stop = np.asarray(stop, dtype = 'datetime64[D]')
+    start_month = start.astype('datetime64[M]')
+    stop_month = stop.astype('datetime64[M]')
+    months = (stop_month - start_month).astype(int)
+    start_day = (start - start_month.astype('datetime64[D]')).astype(int)
+    stop_day = (stop - stop_month.astype('datetime64[D]')).astype(int)
+    return np.where(months >= 0, months - (stop_day < start_day), months + (stop_day > start_day))
+
+
+def is_in_period(dates, period):
+    """Return whether each date is between the start and the stop of period (included).
+
+    >>> from openfisca_core import periods
+    >>> is_in_period(np.array(['2013-12-31', '2014-02-28', '2014-03-01'], dtype = 'datetime64[D]'),
+    ...     periods.period('month', '2014-01', 2))
+    array([False,  True, False])
+    """
+    dates = np.asarray(dates, dtype = 'datetime64[D]')
+    return (dates >= np.datetime64(period.start.date, 'D')) & (dates <= np.datetime64(period.stop.date, 'D'))
+
+
+def parse_dates(values):
+    """Convert ISO 8601 strings ("YYYY-MM-DD", "YYYY-MM" or "YYYY") to an array of dates, in a single operation.
+
+    Incomplete dates are completed with the first month and day. Return None when a value is not such a string or is
+    not a valid date, so that the caller can fall back to a conversion (and errors) cell by cell.
+
+    >>> parse_dates([u'2014-02-03', u'1973-05', u'2013'])
+    array(['2014-02-03', '1973-05-01', '2013-01-01'], dtype='datetime64[D]')
+    >>> parse_dates([u'2014-02-30']) is None
+    True
+    """
+    strings = np.asarray(values)
+    if strings.dtype.kind not in ('S', 'U') or strings.ndim != 1:
+        return None
+    lengths = np.char.str_len(strings)
+    completed_strings = np.where(lengths == 4, np.char.add(strings, u'-01-01'),
+        np.where(lengths == 7, np.char.add(strings, u'-01'), strings))
+    try:
+        dates = completed_strings.astype('datetime64[D]')
+    except ValueError:
+        return None
+    # Reject values that NumPy accepts but are not canonical dates ("today", "NaT", "2014-2-3", times, etc).
+    if not (np.datetime_as_string(dates) == completed_strings).all():
+        return None
+    return dates
@@ -25,41 +25,113 @@
 
 import collections
 import copy
+import itertools
 import os
 import xml
 
+import numpy as np
+
 from . import conv
 from . import decompositionsxml
 
 
-def calculate(simulations, decomposition_json):
-    assert decomposition_json is not None
-
-    for node in iter_decomposition_nodes(decomposition_json):
-        if node.get('children') is None:
-            for simulation in simulations:
-                simulation.calculate_add(node['code'])
+def calculate(simulations, decomposition_json, output_variables_name = None):
+    """Compute the values of the nodes of a decomposition and return them in a copy of the decomposition.
 
+    When ``output_variables_name`` is given, only the nodes having one of these codes (and their descendants) are
+    computed. The values of the other nodes are None.
+    """
+    assert decomposition_json is not None
     response_json = copy.deepcopy(decomposition_json)  # Use decomposition as a skeleton for response.
-    for node in iter_decomposition_nodes(response_json, children_first = True):
-        children = node.get('children')
-        if children:
-            node['values'] = map(lambda *l: sum(l), *(
-                child['values']
-                for child in children
-                ))
+    leaf_array_by_index = {}
+    nodes, values_matrix, computed = calculate_matrix(simulations, response_json,
+        leaf_array_by_index = leaf_array_by_index, output_variables_name = output_variables_name)
+    # Note: Convert the whole matrix to Python values at once, because it is much faster than cell by cell.
+    for node_index, (node, values, is_computed) in enumerate(itertools.izip(nodes, values_matrix.tolist(),
+            computed.tolist())):
+        if not is_computed:
+            node['values'] = None
+        elif node_index in leaf_array_by_index:
+            # Leaves keep the JSON values of their column (integers, dates...), instead of the dtype of the matrix.
+            column = simulations[0].get_holder(node['code']).column
+            node['values'] = column.transform_array_to_json(leaf_array_by_index[node_index])
         else:
-            node['values'] = values = []
-            for simulation in simulations:
-                holder = simulation.get_holder(node['code'])
-                column = holder.column
-                values.extend(
-                    column.transform_value_to_json(value)
-                    for value in holder.new_test_case_array(simulation.period).tolist()
-                    )
+            node['values'] = values
     return response_json
 
 
+def calculate_matrix(simulations, decomposition_json, leaf_array_by_index = None, output_variables_name = None):
+    """Compute the values of the nodes of a decomposition, for each step of each simulation.
+
+    Return the list of the nodes (depth first, parents before children), the (nodes x steps) matrix of their values
+    and a boolean array telling which nodes are computed (see ``output_variables_name`` in ``calculate()``).
+    The values of a node having children are the sums of the values of its children, computed in int64 when every
+    leaf is an integer (or a boolean) and in float64 otherwise.
+    When ``leaf_array_by_index`` is a dictionary, it is filled with the values of each computed leaf, in their own
+    dtype, by node index.
+    """
+    assert decomposition_json is not None
+    nodes = []
+    depth_list = []
+    parent_index_list = []
+    stack = [
+        (node, -1, 0)
+        for node in reversed(decomposition_json if isinstance(decomposition_json, list) else [decomposition_json])
+        ]
+    while stack:
+        node, parent_index, depth = stack.pop()
+        node_index = len(nodes)
+        nodes.append(node)
+        depth_list.append(depth)
+        parent_index_list.append(parent_index)
+        stack.extend(
+            (child, node_index, depth + 1)
+            for child in reversed(node.get('children') or [])
+            )
+    depth_array = np.array(depth_list, dtype = np.intp)
+    parent_index_array = np.array(parent_index_list, dtype = np.intp)
+
+    if output_variables_name is None:
+        computed = np.ones(len(nodes), dtype = np.bool)
+    else:
+        output_variables_name = set(output_variables_name)
+        computed = np.zeros(len(nodes), dtype = np.bool)
+        for node_index, (node, parent_index) in enumerate(itertools.izip(nodes, parent_index_list)):
+            computed[node_index] = node.get('code') in output_variables_name \
+                or parent_index >= 0 and computed[parent_index]
+
+    leaves_index = [
+        node_index
+        for node_index, node in enumerate(nodes)
+        if not node.get('children') and computed[node_index]
+        ]
+    for node_index in leaves_index:
+        for simulation in simulations:
+            simulation.calculate_add(nodes[node_index]['code'])
+    leaf_arrays = [
+        np.concatenate([
+            simulation.get_holder(nodes[node_index]['code']).new_test_case_array(simulation.period)
+            for simulation in simulations
+            ])
+        for node_index in leaves_index
+        ]
+    steps_count = sum(simulation.steps_count for simulation in simulations)
+    # Sum children with the same precision as Python floats, and without overflowing small integer types.
+    dtype = np.int64 if leaf_arrays and all(leaf_array.dtype.kind in 'biu' for leaf_array in leaf_arrays) \
+        else np.float64
+    values_matrix = np.zeros((len(nodes), steps_count), dtype = dtype)
+    for node_index, leaf_array in itertools.izip(leaves_index, leaf_arrays):
+        values_matrix[node_index] = leaf_array
+    if leaf_array_by_index is not None:
+        leaf_array_by_index.update(itertools.izip(leaves_index, leaf_arrays))
+
+    # Sum the values of the children into their parents, from the deepest level up to the roots.
+    for depth in xrange(depth_array.max() if len(nodes) else 0, 0, -1):
+        level_nodes_index = np.flatnonzero(depth_array == depth)
+        np.add.at(values_matrix, parent_index_array[level_nodes_index], values_matrix[level_nodes_index])
+    return nodes, values_matrix, computed
+
+
 def get_decomposition_json(tax_benefit_system, xml_file_path = None):
     if xml_file_path is None:
         xml_file_path = os.path.join(tax_benefit_system.DECOMP_DIR, tax_benefit_system.DEFAULT_DECOMP_FILE)
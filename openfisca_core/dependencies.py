@@ -0,0 +1,438 @@
+# -*- coding: utf-8 -*-
+
+
+# OpenFisca -- A versatile microsimulation software
+# By: OpenFisca Team <contact@openfisca.fr>
+#
+# Copyright (C) 2011, 2012, 2013, 2014, 2015 OpenFisca Team
+# https://github.com/openfisca
+#
+# This file is part of OpenFisca.
+#
+# OpenFisca is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# OpenFisca is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""Static analysis of the formulas of a tax-benefit system: the variables and legislation parameters they read
+
+The source of each formula function is parsed (without being run) to find:
+
+* the variables requested through ``simulation.calculate*()``, ``compute*()``, ``get_array()``... when their name is a
+  string literal (or a string constant of the module or of the closure of the function);
+* the legislation parameters read from ``simulation.legislation_at(...)`` (directly, through local aliases or
+  ``getattr()`` calls with a literal name) or from ``accessors.law``.
+
+When a formula requests a variable whose name is only known at run time, its variables are unknown (None) and the
+users of the graph must assume that the formula may depend on any variable. When the simulation is used otherwise
+(given to a helper function, aliased, or used to call an other method), both its variables and its legislation
+parameters are unknown.
+"""
+
+
+import ast
+import collections
+import hashlib
+import inspect
+import json
+import logging
+import os
+import textwrap
+
+from . import accessors, formulas
+
+
+__all__ = [
+    'DependencyGraph',
+    'extract_function_dependencies',
+    ]
+
+
+cache_version = 2  # Increment to invalidate disk caches when extraction changes.
+log = logging.getLogger(__name__)
+variable_methods_name = frozenset([
+    'calculate',
+    'calculate_add',
+    'calculate_add_divide',
+    'calculate_age',
+    'calculate_divide',
+    'compute',
+    'compute_add',
+    'compute_add_divide',
+    'compute_divide',
+    'get_array',
+    'get_holder',
+    'get_or_new_holder',
+    ])
+
+
+class DependenciesVisitor(ast.NodeVisitor):
+    """Collect the variables and the legislation paths read by the AST of a function"""
+    are_dependencies_unknown = False  # True when the simulation escapes from the calls that can be analyzed
+    is_cacheable = True  # False when the result depends on values found in closure or globals of function
+    legislation_path_by_name = None  # Local names bound to a legislation node
+    legislation_paths = None
+    local_names = None
+    simulation_name = None  # Name of the argument of the function that is the simulation
+    value_by_name = None
+    variables_name = None  # None when some variables names are only known at run time
+
+    def __init__(self, function, local_names):
+        self.legislation_path_by_name = {}
+        self.legislation_paths = set()
+        self.local_names = local_names
+        args_name = inspect.getargspec(function).args
+        if 'simulation' in args_name:
+            self.simulation_name = 'simulation'
+        elif len(args_name) >= 2:
+            self.simulation_name = args_name[1]
+        self.value_by_name = value_by_name = dict(function.func_globals)
+        if function.func_closure is not None:
+            value_by_name.update(
+                (name, cell.cell_contents)
+                for name, cell in zip(function.func_code.co_freevars, function.func_closure)
+                )
+        if function.func_defaults is not None:
+            for name, value in zip(args_name[-len(function.func_defaults):], function.func_defaults):
+                if isinstance(value, accessors.Accessor):
+                    self.legislation_path_by_name[name] = get_accessor_path(value)
+        self.variables_name = set()
+
+    def get_constant(self, node):
+        """Return the string of a node when it is known statically, None otherwise."""
+        if isinstance(node, ast.Str):
+            return unicode(node.s)
+        if isinstance(node, ast.Name) and node.id not in self.local_names:
+            value = self.value_by_name.get(node.id)
+            if isinstance(value, basestring):
+                self.is_cacheable = False
+                return unicode(value)
+        return None
+
+    def get_legislation_path(self, node):
+        """Return the legislation path of the node, when it is a legislation node, None otherwise.
+
+        The root of the legislation has an empty path.
+        """
+        if isinstance(node, ast.Attribute):
+            parent_path = self.get_legislation_path(node.value)
+            if parent_path is None:
+                return None
+            return u'.'.join(fragment for fragment in (parent_path, unicode(node.attr)) if fragment)
+        if isinstance(node, ast.Call):
+            func = node.func
+            if isinstance(func, ast.Attribute) and func.attr == 'legislation_at':
+                return u''
+            if isinstance(func, ast.Name) and func.id == 'getattr' and len(node.args) >= 2:
+                parent_path = self.get_legislation_path(node.args[0])
+                if parent_path is None:
+                    return None
+                name = self.get_constant(node.args[1])
+                # When name is not known statically, depend on the whole parent node.
+                return parent_path if name is None \
+                    else u'.'.join(fragment for fragment in (parent_path, name) if fragment)
+            return None
+        if isinstance(node, ast.Name):
+            path = self.legislation_path_by_name.get(node.id)
+            if path is not None:
+                return path
+            if node.id not in self.local_names:
+                value = self.value_by_name.get(node.id)
+                if isinstance(value, accessors.Accessor):
+                    self.is_cacheable = False
+                    return get_accessor_path(value)
+        return None
+
+    def visit_Assign(self, node):
+        if len(node.targets) == 1 and isinstance(node.targets[0], ast.Name):
+            path = self.get_legislation_path(node.value)
+            if path is not None:
+                self.legislation_path_by_name[node.targets[0].id] = path
+                self.visit_legislation_arguments(node.value)
+                return
+            self.legislation_path_by_name.pop(node.targets[0].id, None)
+        self.generic_visit(node)
+
+    def visit_Attribute(self, node):
+        path = self.get_legislation_path(node)
+        if path is None:
+            self.generic_visit(node)
+        else:
+            self.legislation_paths.add(path)
+            self.visit_legislation_arguments(node)
+
+    def visit_Call(self, node):
+        func = node.func
+        path = self.get_legislation_path(node)
+        if path is not None:
+            self.legislation_paths.add(path)
+            self.visit_legislation_arguments(node)
+            return
+        if isinstance(func, ast.Attribute):
+            # A method of a legislation node (for example "calc()" of a tax scale) is not a parameter.
+            path = self.get_legislation_path(func.value)
+            if path is not None:
+                self.legislation_paths.add(path)
+                self.visit_legislation_arguments(func.value)
+                for child in ast.iter_child_nodes(node):
+                    if child is not func:
+                        self.visit(child)
+                return
+            if isinstance(func.value, ast.Name) and func.value.id == self.simulation_name:
+                if func.attr not in variable_methods_name or not node.args:
+                    self.are_dependencies_unknown = True
+                    return
+                if self.variables_name is not None:
+                    variable_name = self.get_constant(node.args[0])
+                    if variable_name is None:
+                        self.variables_name = None
+                    else:
+                        self.variables_name.add(variable_name)
+                # Visit the arguments, but not the simulation itself.
+                for child in ast.iter_child_nodes(node):
+                    if child is not func:
+                        self.visit(child)
+                return
+        self.generic_visit(node)
+
+    def visit_Name(self, node):
+        if node.id == self.simulation_name and isinstance(node.ctx, ast.Load):
+            self.are_dependencies_unknown = True
+            return
+        path = self.get_legislation_path(node)
+        if path is not None:
+            self.legislation_paths.add(path)
+
+    def visit_legislation_arguments(self, node):
+        """Visit the arguments of the calls of a legislation chain (for example the instant of legislation_at())."""
+        while True:
+            if isinstance(node, ast.Attribute):
+                node = node.value
+            elif isinstance(node, ast.Call):
+                for arg in node.args[1:] if isinstance(node.func, ast.Name) else node.args:
+                    self.visit(arg)
+                for keyword in node.keywords:
+                    self.visit(keyword.value)
+                node = node.args[0] if isinstance(node.func, ast.Name) else node.func.value
+            else:
+                return
+
+
+class DependencyGraph(object):
+    """Static dependency graph of the formulas of a tax-benefit system
+
+    A dependency graph can be used as the ``input_variables_extractor`` of formulas graphs and JSON exports.
+    """
+    legislation_paths_by_variable_name = None  # None as value when legislation parameters are not known statically
+    variables_name_by_variable_name = None  # None as value when input variables are not known statically
+
+    def __init__(self, tax_benefit_system = None, cache_file_path = None):
+        assert tax_benefit_system is not None
+        dependencies_by_key = {}
+        if cache_file_path is not None and os.path.exists(cache_file_path):
+            with open(cache_file_path) as cache_file:
+                cache_json = json.load(cache_file)
+            if cache_json.get('version') == cache_version:
+                dependencies_by_key = cache_json['dependencies_by_key']
+        keys_count = len(dependencies_by_key)
+
+        legislation_json = tax_benefit_system.legislation_json
+        self.legislation_paths_by_variable_name = legislation_paths_by_variable_name = {}
+        self.variables_name_by_variable_name = variables_name_by_variable_name = {}
+        for name, column in tax_benefit_system.column_by_name.iteritems():
+            formula_class = column.formula_class
+            if formula_class is None:
+                legislation_paths, variables_name = set(), set()
+            elif issubclass(formula_class, formulas.AbstractEntityToEntity):
+                legislation_paths, variables_name = set(), set([formula_class.variable_name])
+            else:
+                if issubclass(formula_class, formulas.DatedFormula):
+                    functions = [
+                        dated_formula_class['formula_class'].function
+                        for dated_formula_class in formula_class.dated_formulas_class
+                        ]
+                else:
+                    functions = [formula_class.function] if formula_class.function is not None else []
+                legislation_paths, variables_name = set(), set()
+                for function in functions:
+                    function_variables_name, function_legislation_paths = extract_function_dependencies(function,
+                        dependencies_by_key = dependencies_by_key)
+                    if function_legislation_paths is None or legislation_paths is None:
+                        legislation_paths = None
+                    else:
+                        legislation_paths.update(function_legislation_paths)
+                    if function_variables_name is None or variables_name is None:
+                        variables_name = None
+                    else:
+                        variables_name.update(function_variables_name)
+            if legislation_paths is not None and legislation_json is not None:
+                legislation_paths = set(
+                    truncate_legislation_path(legislation_json, path)
+                    for path in legislation_paths
+                    )
+            legislation_paths_by_variable_name[name] = legislation_paths
+            if variables_name is not None:
+                variables_name.discard(name)  # Requests of other periods of the same variable are not dependencies.
+            variables_name_by_variable_name[name] = variables_name
+
+        if cache_file_path is not None and len(dependencies_by_key) != keys_count:
+            with open(cache_file_path, 'w') as cache_file:
+                json.dump(dict(dependencies_by_key = dependencies_by_key, version = cache_version), cache_file)
+
+    def get_dependent_variables(self, variables_name = (), legislation_paths = ()):
+        """Return the variables whose value may change when the given variables or legislation parameters change.
+
+        Used to invalidate caches. Formulas whose dependencies are not known statically are always included.
+        """
+        legislation_paths = set(legislation_paths)
+        dependents_name_by_variable_name = collections.defaultdict(set)
+        dependent_variables_name = set(variables_name)
+        for name, input_variables_name in self.variables_name_by_variable_name.iteritems():
+            if input_variables_name is None:
+                dependent_variables_name.add(name)
+            else:
+                for input_variable_name in input_variables_name:
+                    dependents_name_by_variable_name[input_variable_name].add(name)
+            paths = self.legislation_paths_by_variable_name[name]
+            if legislation_paths and (paths is None or any(
+                    is_legislation_path_overlapping(path, changed_path)
+                    for path in paths
+                    for changed_path in legislation_paths
+                    )):
+                dependent_variables_name.add(name)
+        variables_name_to_visit = list(dependent_variables_name)
+        while variables_name_to_visit:
+            for dependent_name in dependents_name_by_variable_name.get(variables_name_to_visit.pop(), ()):
+                if dependent_name not in dependent_variables_name:
+                    dependent_variables_name.add(dependent_name)
+                    variables_name_to_visit.append(dependent_name)
+        return dependent_variables_name
+
+    def get_evaluation_order(self, variables_name):
+        """Return the variables required to compute the given ones, each one after its dependencies.
+
+        Return None when the dependencies of a required formula are not known statically. Cycles (between periods
+        of variables) are broken arbitrarily.
+        """
+        variables_name_by_variable_name = self.variables_name_by_variable_name
+        ordered_variables_name = []
+        visited = set()
+        for root_name in variables_name:
+            if root_name in visited:
+                continue
+            visited.add(root_name)
+            input_variables_name = variables_name_by_variable_name.get(root_name, ())
+            if input_variables_name is None:
+                return None
+            stack = [(root_name, iter(sorted(input_variables_name)))]
+            while stack:
+                name, input_variables_name_iterator = stack[-1]
+                for input_variable_name in input_variables_name_iterator:
+                    if input_variable_name not in visited:
+                        visited.add(input_variable_name)
+                        input_variables_name = variables_name_by_variable_name.get(input_variable_name, ())
+                        if input_variables_name is None:
+                            return None
+                        stack.append((input_variable_name, iter(sorted(input_variables_name))))
+                        break
+                else:
+                    stack.pop()
+                    ordered_variables_name.append(name)
+        return ordered_variables_name
+
+    def get_input_variables(self, column):
+        return self.variables_name_by_variable_name.get(column.name)
+
+    def get_legislation_paths(self, column):
+        return self.legislation_paths_by_variable_name.get(column.name)
+
+    def get_required_variables(self, variables_name):
+        """Return the set of the variables needed to compute the given ones (including them).
+
+        Return None when the dependencies of a required formula are not known statically.
+        """
+        ordered_variables_name = self.get_evaluation_order(variables_name)
+        return None if ordered_variables_name is None else set(ordered_variables_name)
+
+
+def extract_function_dependencies(function, dependencies_by_key = None):
+    """Return the couple (variables name, legislation paths) read by a formula function.
+
+    Each item of the couple is None when it can't be known statically.
+    ``dependencies_by_key`` is an optional cache, indexed by a hash of the source code of the function.
+    """
+    try:
+        source = textwrap.dedent(inspect.getsource(function))
+    except (IOError, TypeError):
+        log.info(u'Source of function {} is not available'.format(function))
+        return None, None
+    key = hashlib.sha1(source).hexdigest()
+    if dependencies_by_key is not None:
+        dependencies = dependencies_by_key.get(key)
+        if dependencies is not None:
+            return (
+                None if dependencies[0] is None else set(dependencies[0]),
+                None if dependencies[1] is None else set(dependencies[1]),
+                )
+    try:
+        tree = ast.parse(source)
+    except SyntaxError:
+        # For example the source of a lambda function is only a part of a statement.
+        log.info(u'Source of function {} can not be parsed'.format(function))
+        return None, None
+    local_names = set(
+        node.id
+        for node in ast.walk(tree)
+        if isinstance(node, ast.Name) and isinstance(node.ctx, (ast.Param, ast.Store))
+        )
+    visitor = DependenciesVisitor(function, local_names)
+    visitor.visit(tree)
+    if visitor.are_dependencies_unknown:
+        variables_name, legislation_paths = None, None
+    else:
+        variables_name = visitor.variables_name
+        legislation_paths = visitor.legislation_paths
+    if dependencies_by_key is not None and visitor.is_cacheable and function.func_closure is None:
+        dependencies_by_key[key] = [
+            None if variables_name is None else sorted(variables_name),
+            None if legislation_paths is None else sorted(legislation_paths),
+            ]
+    return variables_name, legislation_paths
+
+
+def get_accessor_path(accessor):
+    # Note: Accessor.path can't be used, because every attribute of an accessor (but a few) is a new accessor.
+    return u'.'.join(reversed([
+        ancestor.name
+        for ancestor in accessor.iter_ancestors()
+        if ancestor.name is not None
+        ]))
+
+
+def is_legislation_path_overlapping(path, other_path):
+    """Return True when a legislation path contains the other one, or the reverse."""
+    if not path or not other_path or path == other_path:
+        return True
+    return path.startswith(other_path + u'.') or other_path.startswith(path + u'.')
+
+
+def truncate_legislation_path(legislation_json, path):
+    """Return the longest prefix of a path that exists in a legislation (removing attributes of parameters)."""
+    node_json = legislation_json
+    fragments = []
+    for fragment in path.split(u'.') if path else ():
+        children_json = node_json.get('children') if isinstance(node_json, dict) else None
+        if children_json is None or fragment not in children_json:
+            break
+        node_json = children_json[fragment]
+        fragments.append(fragment)
+    return u'.'.join(fragments)
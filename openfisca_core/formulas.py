@@ -25,6 +25,7 @@
 
 from __future__ import division
 
+from bisect import bisect_right
 import collections
 import datetime
 import inspect
@@ -117,8 +118,7 @@ class AbstractEntityToEntity(AbstractFormula):
         output_period = variable_dated_holder.period
 
         array = self.transform(variable_dated_holder, roles = self.roles)
-        if array.dtype != column.dtype:
-            array = array.astype(column.dtype)
+        array = array.astype(holder.dtype, copy = False)
 
         if debug or trace:
             variable_infos = (column.name, output_period)
@@ -207,6 +207,8 @@ class DatedFormula(AbstractGroupedFormula):
     base_function = None  # Class attribute. Overridden by subclasses
     dated_formulas = None  # A list of dictionaries containing a formula jointly with start and stop instants
     dated_formulas_class = None  # Class attribute
+    found_dated_formula_by_period = None  # Class attribute. Memo of find_dated_formula()
+    start_instants = None  # Class attribute. Sorted start instants of dated_formulas_class, for bisection
 
     def __init__(self, holder = None):
         super(DatedFormula, self).__init__(holder = holder)
@@ -224,11 +226,16 @@ class DatedFormula(AbstractGroupedFormula):
     @classmethod
     def at_instant(cls, instant, default = UnboundLocalError):
         assert isinstance(instant, periods.Instant)
-        for dated_formula_class in cls.dated_formulas_class:
-            start_instant = dated_formula_class['start_instant']
+        # Dated formulas are sorted by start instant and don't overlap: only the last one starting before the instant
+        # may contain it.
+        start_instants = cls.start_instants
+        if start_instants is None:
+            start_instants = cls.get_start_instants()
+        index = bisect_right(start_instants, instant) - 1
+        if index >= 0:
+            dated_formula_class = cls.dated_formulas_class[index]
             stop_instant = dated_formula_class['stop_instant']
-            if (start_instant is None or start_instant <= instant) and (
-                    stop_instant is None or instant <= stop_instant):
+            if stop_instant is None or instant <= stop_instant:
                 return dated_formula_class['formula_class']
         if default is UnboundLocalError:
             raise KeyError(instant)
@@ -253,29 +260,64 @@ class DatedFormula(AbstractGroupedFormula):
 
     def compute(self, period = None, requested_formulas_by_period = None):
         dated_holder = None
-        stop_instant = period.stop
-        for dated_formula in self.dated_formulas:
-            if dated_formula['start_instant'] > stop_instant:
-                break
-            output_period = period.intersection(dated_formula['start_instant'], dated_formula['stop_instant'])
-            if output_period is None:
-                continue
-            dated_holder = dated_formula['formula'].compute(period = output_period,
+        found_dated_formula = self.find_dated_formula(period)
+        if found_dated_formula is not None:
+            index, output_period = found_dated_formula
+            formula = self.dated_formulas[index]['formula']
+            dated_holder = formula.compute(period = output_period,
                 requested_formulas_by_period = requested_formulas_by_period)
-            if dated_holder.array is None:
-                break
-            self.used_formula = dated_formula['formula']
-            return dated_holder
+            if dated_holder.array is not None:
+                self.used_formula = formula
+                return dated_holder
 
         holder = self.holder
         column = holder.column
-        array = np.empty(holder.entity.count, dtype = column.dtype)
+        array = np.empty(holder.entity.count, dtype = holder.dtype)
         array.fill(column.default)
         if dated_holder is None:
             dated_holder = holder.at_period(period)
         dated_holder.array = array
         return dated_holder
 
+    @classmethod
+    def find_dated_formula(cls, period):
+        """Return the index of the first dated formula overlapping period and their intersection, or None."""
+        found_dated_formula_by_period = cls.__dict__.get('found_dated_formula_by_period')
+        if found_dated_formula_by_period is None:
+            cls.found_dated_formula_by_period = found_dated_formula_by_period = {}
+        elif period in found_dated_formula_by_period:
+            return found_dated_formula_by_period[period]
+        elif len(found_dated_formula_by_period) >= periods.parsing_cache_max_size:
+            found_dated_formula_by_period.clear()
+        found_dated_formula = None
+        dated_formulas_class = cls.dated_formulas_class
+        stop_instant = period.stop
+        # Dated formulas before the last one starting before the period end before it.
+        first_index = max(bisect_right(cls.get_start_instants(), period.start) - 1, 0)
+        for index in xrange(first_index, len(dated_formulas_class)):
+            dated_formula_class = dated_formulas_class[index]
+            if dated_formula_class['start_instant'] > stop_instant:
+                break
+            output_period = period.intersection(dated_formula_class['start_instant'],
+                dated_formula_class['stop_instant'])
+            if output_period is not None:
+                found_dated_formula = (index, output_period)
+                break
+        found_dated_formula_by_period[period] = found_dated_formula
+        return found_dated_formula
+
+    @classmethod
+    def get_start_instants(cls):
+        # Set by new_filled_column(), but computed for classes created otherwise, without inheriting those of their
+        # parent class.
+        start_instants = cls.__dict__.get('start_instants')
+        if start_instants is None:
+            cls.start_instants = start_instants = [
+                dated_formula_class['start_instant']
+                for dated_formula_class in cls.dated_formulas_class
+                ]
+        return start_instants
+
     def graph_parameters(self, edges, input_variables_extractor, nodes, visited):
         """Recursively build a graph of formulas."""
         for dated_formula in self.dated_formulas:
@@ -474,24 +516,25 @@ class SimpleFormula(AbstractFormula):
         # holder.compute().
 
         # Ensure that method is not called several times for the same period (infinite loop).
-        if requested_formulas_by_period is None:
-            requested_formulas_by_period = {}
-        period_or_none = None if column.is_permanent else period
-        period_requested_formulas = requested_formulas_by_period.get(period_or_none)
-        if period_requested_formulas is None:
-            requested_formulas_by_period[period_or_none] = period_requested_formulas = set()
-        else:
-            assert self not in period_requested_formulas, \
-                'Infinite loop in formula {}<{}>. Missing values for columns: {}'.format(
-                    column.name,
-                    period,
-                    u', '.join(sorted(set(
-                        u'{}<{}>'.format(requested_formula.holder.column.name, period1)
-                        for period1, period_requested_formulas1 in requested_formulas_by_period.iteritems()
-                        for requested_formula in period_requested_formulas1
-                        ))).encode('utf-8'),
-                    )
-        period_requested_formulas.add(self)
+        # Note: When no requested formulas are given, they would be a new dict, unknown to the formula function, so
+        # there is nothing to check.
+        if requested_formulas_by_period is not None:
+            period_or_none = None if column.is_permanent else period
+            period_requested_formulas = requested_formulas_by_period.get(period_or_none)
+            if period_requested_formulas is None:
+                requested_formulas_by_period[period_or_none] = period_requested_formulas = set()
+            else:
+                assert self not in period_requested_formulas, \
+                    'Infinite loop in formula {}<{}>. Missing values for columns: {}'.format(
+                        column.name,
+                        period,
+                        u', '.join(sorted(set(
+                            u'{}<{}>'.format(requested_formula.holder.column.name, period1)
+                            for period1, period_requested_formulas1 in requested_formulas_by_period.iteritems()
+                            for requested_formula in period_requested_formulas1
+                            ))).encode('utf-8'),
+                        )
+            period_requested_formulas.add(self)
 
         if debug or trace:
             simulation.stack_trace.append(dict(
@@ -533,8 +576,7 @@ class SimpleFormula(AbstractFormula):
                         nan_count).encode('utf-8'))
             except TypeError:
                 pass
-        if array.dtype != column.dtype:
-            array = array.astype(column.dtype)
+        array = array.astype(holder.dtype, copy = False)
 
         if debug or trace:
             variable_infos = (column.name, output_period)
@@ -561,7 +603,8 @@ class SimpleFormula(AbstractFormula):
 
         dated_holder = holder.at_period(output_period)
         dated_holder.array = array
-        period_requested_formulas.remove(self)
+        if requested_formulas_by_period is not None:
+            period_requested_formulas.remove(self)
         return dated_holder
 
     def filter_role(self, array_or_dated_holder, default = None, entity = None, role = None):
@@ -617,6 +660,18 @@ class SimpleFormula(AbstractFormula):
                     'to': column.name,
                     })
 
+    def new_output_array(self, fill_value = None):
+        """Return a new array of the size of the entity and of the dtype of the holder, to store the formula result.
+
+        Functions writing their result in it (``np.multiply(a, b, out = array)``, ``array[...] = ...``) avoid the
+        conversion (and the copy) of their result to the dtype of the column.
+        """
+        holder = self.holder
+        array = np.empty(holder.entity.count, dtype = holder.dtype)
+        if fill_value is not None:
+            array.fill(fill_value)
+        return array
+
     def split_by_roles(self, array_or_dated_holder, default = None, entity = None, roles = None):
         """dispatch a persons array to several entity arrays (one for each role)."""
         holder = self.holder
@@ -712,7 +767,7 @@ class SimpleFormula(AbstractFormula):
             simulation = entity.simulation
             variables_name = input_variables_extractor.get_input_variables(column)
             variables_json = []
-            for variable_name in sorted(variables_name):
+            for variable_name in sorted(variables_name or ()):
                 variable_holder = simulation.get_or_new_holder(variable_name)
                 variable_column = variable_holder.column
                 variables_json.append(collections.OrderedDict((
@@ -1022,6 +1077,10 @@ class FormulaColumnMetaclass(type):
                 dated_formulas_class.sort(key = lambda dated_formula_class: dated_formula_class['start_instant'])
 
             formula_class_attributes['dated_formulas_class'] = dated_formulas_class
+            formula_class_attributes['start_instants'] = [
+                dated_formula_class['start_instant']
+                for dated_formula_class in dated_formulas_class
+                ]
         else:
             assert issubclass(formula_class, SimpleFormula), formula_class
 
@@ -1108,7 +1167,7 @@ def last_duration_last_value(formula, simulation, period):
     if formula.function is not None:
         return formula.function(simulation, period)
     column = holder.column
-    array = np.empty(holder.entity.count, dtype = column.dtype)
+    array = np.empty(holder.entity.count, dtype = holder.dtype)
     array.fill(column.default)
     return period, array
 
@@ -1146,7 +1205,7 @@ def permanent_default_value(formula, simulation, period):
         return formula.function(simulation, period)
     holder = formula.holder
     column = holder.column
-    array = np.empty(holder.entity.count, dtype = column.dtype)
+    array = np.empty(holder.entity.count, dtype = holder.dtype)
     array.fill(column.default)
     return period, array
 
@@ -1203,34 +1262,29 @@ def requested_period_added_value(formula, simulation, period):
     period_size = period.size
     period_unit = period.unit
     if holder._array_by_period is not None and (period_size > 1 or period_unit == u'year'):
-        after_instant = period.start.offset(period_size, period_unit)
         if period_size > 1:
-            array = np.empty(holder.entity.count, dtype = column.dtype)
-            sub_period = period.start.period(period_unit)
-            while sub_period.start < after_instant:
+            array = np.zeros(holder.entity.count, dtype = holder.dtype)
+            for sub_period in period.get_subperiods(period_unit):
                 sub_array = holder._array_by_period.get(sub_period)
                 if sub_array is None:
                     array = None
                     break
                 array += sub_array
-                sub_period = sub_period.offset(1)
             if array is not None:
                 return period, array
         if period_unit == u'year':
-            array = np.empty(holder.entity.count, dtype = column.dtype)
-            month = period.start.period(u'month')
-            while month.start < after_instant:
+            array = np.zeros(holder.entity.count, dtype = holder.dtype)
+            for month in period.get_subperiods(u'month'):
                 month_array = holder._array_by_period.get(month)
                 if month_array is None:
                     array = None
                     break
                 array += month_array
-                month = month.offset(1)
             if array is not None:
                 return period, array
     if formula.function is not None:
         return formula.function(simulation, period)
-    array = np.empty(holder.entity.count, dtype = column.dtype)
+    array = np.empty(holder.entity.count, dtype = holder.dtype)
     array.fill(column.default)
     return period, array
 
@@ -1240,7 +1294,7 @@ def requested_period_default_value(formula, simulation, period):
         return formula.function(simulation, period)
     holder = formula.holder
     column = holder.column
-    array = np.empty(holder.entity.count, dtype = column.dtype)
+    array = np.empty(holder.entity.count, dtype = holder.dtype)
     array.fill(column.default)
     return period, array
 
@@ -1256,7 +1310,7 @@ def requested_period_last_value(formula, simulation, period):
     if formula.function is not None:
         return formula.function(simulation, period)
     column = holder.column
-    array = np.empty(holder.entity.count, dtype = column.dtype)
+    array = np.empty(holder.entity.count, dtype = holder.dtype)
     array.fill(column.default)
     return period, array
 
@@ -1267,27 +1321,22 @@ def set_input_dispatch_by_period(formula, period, array):
     period_size = period.size
     period_unit = period.unit
     if period_unit == u'year' or period_size > 1:
-        after_instant = period.start.offset(period_size, period_unit)
         if period_size > 1:
-            sub_period = period.start.period(period_unit)
-            while sub_period.start < after_instant:
+            for sub_period in period.get_subperiods(period_unit):
                 existing_array = holder.get_array(sub_period)
                 if existing_array is None:
                     holder.set_array(sub_period, array)
                 else:
                     # The array of the current sub-period is reused for the next ones.
                     array = existing_array
-                sub_period = sub_period.offset(1)
         if period_unit == u'year':
-            month = period.start.period(u'month')
-            while month.start < after_instant:
+            for month in period.get_subperiods(u'month'):
                 existing_array = holder.get_array(month)
                 if existing_array is None:
                     holder.set_array(month, array)
                 else:
                     # The array of the current sub-period is reused for the next ones.
                     array = existing_array
-                month = month.offset(1)
 
 
 def set_input_divide_by_period(formula, period, array):
@@ -1296,38 +1345,31 @@ def set_input_divide_by_period(formula, period, array):
     period_size = period.size
     period_unit = period.unit
     if period_unit == u'year' or period_size > 1:
-        after_instant = period.start.offset(period_size, period_unit)
         if period_size > 1:
             remaining_array = array.copy()
-            sub_period = period.start.period(period_unit)
+            sub_periods = period.get_subperiods(period_unit)
             sub_periods_count = period_size
-            while sub_period.start < after_instant:
+            for sub_period in sub_periods:
                 existing_array = holder.get_array(sub_period)
                 if existing_array is not None:
                     remaining_array -= existing_array
                     sub_periods_count -= 1
-                sub_period = sub_period.offset(1)
             if sub_periods_count > 0:
                 divided_array = remaining_array / sub_periods_count
-                sub_period = period.start.period(period_unit)
-                while sub_period.start < after_instant:
+                for sub_period in sub_periods:
                     if holder.get_array(sub_period) is None:
                         holder.set_array(sub_period, divided_array)
-                    sub_period = sub_period.offset(1)
         if period_unit == u'year':
             remaining_array = array.copy()
-            month = period.start.period(u'month')
+            months = period.get_subperiods(u'month')
             months_count = 12 * period_size
-            while month.start < after_instant:
+            for month in months:
                 existing_array = holder.get_array(month)
                 if existing_array is not None:
                     remaining_array -= existing_array
                     months_count -= 1
-                month = month.offset(1)
             if months_count > 0:
                 divided_array = remaining_array / months_count
-                month = period.start.period(u'month')
-                while month.start < after_instant:
+                for month in months:
                     if holder.get_array(month) is None:
                         holder.set_array(month, divided_array)
-                    month = month.offset(1)
@@ -25,16 +25,16 @@
 
 from __future__ import division
 
+import json
+
 import numpy as np
 
-from . import periods
-from .tools import empty_clone
+from . import dates, periods
 
 
 class DatedHolder(object):
     """A view of an holder, for a given period"""
-    holder = None
-    period = None
+    __slots__ = ('holder', 'period')
 
     def __init__(self, holder, period):
         self.holder = holder
@@ -60,28 +60,44 @@ class DatedHolder(object):
     def entity(self):
         return self.holder.entity
 
-    def to_value_json(self):
-        transform_dated_value_to_json = self.holder.column.transform_dated_value_to_json
-        return [
-            transform_dated_value_to_json(cell)
-            for cell in self.array.tolist()
-            ]
+    def to_value_json(self, decimals = None):
+        return self.holder.column.transform_array_to_json(self.array, decimals = decimals)
+
+    def write_value_json(self, value_file, decimals = None):
+        """Write the JSON of the value to a file, without building the whole list of values in memory."""
+        for fragment in self.holder.column.iter_array_json_fragments(self.array, decimals = decimals):
+            value_file.write(fragment)
 
 
 class Holder(object):
-    _array = None  # Only used when column.is_permanent
-    _array_by_period = None  # Only used when not column.is_permanent
-    column = None
-    entity = None
-    formula = None
-    formula_output_period_by_requested_period = None
+    # Note: A simulation may contain thousands of holders => Use slots to save memory and speed up attribute access.
+    __slots__ = (
+        '_array',  # Only used when column.is_permanent
+        '_array_by_period',  # Only used when not column.is_permanent
+        '_age_array_by_key',  # Ages computed from the dates of the holder, by (period, unit)
+        '_dated_holder_by_period',  # Pool of the views of the holder, to avoid creating them at each computation
+        '_input_periods',  # Periods of the arrays set as inputs (None for a permanent column), None when there is none
+        'column',
+        'dtype',  # dtype of the arrays of the holder, chosen by the simulation for the column
+        'entity',
+        'formula',
+        'formula_output_period_by_requested_period',
+        )
 
     def __init__(self, column = None, entity = None):
+        self._array = None
+        self._array_by_period = None
+        self._age_array_by_key = None
+        self._dated_holder_by_period = None
+        self._input_periods = None
         assert column is not None
-        assert self.column is None
         self.column = column
         assert entity is not None
         self.entity = entity
+        simulation = entity.simulation
+        self.dtype = column.dtype if simulation is None else simulation.get_dtype(column)
+        self.formula = None
+        self.formula_output_period_by_requested_period = None
 
     @property
     def array(self):
@@ -101,34 +117,63 @@ class Holder(object):
                 simulation.traceback[variable_infos] = dict(
                     holder = self,
                     )
+        self._age_array_by_key = None
         self._array = array
 
     def at_period(self, period):
-        return self if self.column.is_permanent else DatedHolder(self, period)
+        if self.column.is_permanent:
+            return self
+        dated_holder_by_period = self._dated_holder_by_period
+        if dated_holder_by_period is None:
+            self._dated_holder_by_period = dated_holder_by_period = {}
+        dated_holder = dated_holder_by_period.get(period)
+        if dated_holder is None:
+            dated_holder_by_period[period] = dated_holder = DatedHolder(self, period)
+        return dated_holder
 
     def calculate(self, period = None, accept_other_period = False, requested_formulas_by_period = None):
         dated_holder = self.compute(period = period, accept_other_period = accept_other_period,
             requested_formulas_by_period = requested_formulas_by_period)
         return dated_holder.array
 
+    def calculate_age(self, period = None, unit = u'year', requested_formulas_by_period = None):
+        """Return the ages (in completed years or months) at the start of period of the dates of the holder.
+
+        The ages are computed once by period and unit, for all the formulas using them.
+        """
+        if period is None:
+            period = self.entity.simulation.period
+        key = (period, unit)
+        age_array_by_key = self._age_array_by_key
+        if age_array_by_key is None:
+            self._age_array_by_key = age_array_by_key = {}
+        else:
+            age_array = age_array_by_key.get(key)
+            if age_array is not None:
+                return age_array
+        assert self.column.dtype == 'datetime64[D]', \
+            u'Variable {} is not a date'.format(self.column.name).encode('utf-8')
+        birth = self.calculate(period = period, requested_formulas_by_period = requested_formulas_by_period)
+        age_array_by_key[key] = age_array = dates.get_age(birth, period.start, unit = unit)
+        return age_array
+
     def clone(self, entity):
         """Copy the holder just enough to be able to run a new simulation without modifying the original simulation."""
-        new = empty_clone(self)
-        new_dict = new.__dict__
-
-        for key, value in self.__dict__.iteritems():
-            if key in ('_array_by_period',):
-                if value is not None:
-                    # There is no need to copy the arrays, because the formulas don't modify them.
-                    new_dict[key] = value.copy()
-            elif key not in ('entity', 'formula'):
-                new_dict[key] = value
-
-        new_dict['entity'] = entity
+        new = self.__class__.__new__(self.__class__)
+        new._array = self._array
+        # There is no need to copy the arrays, because the formulas don't modify them.
+        new._array_by_period = None if self._array_by_period is None else self._array_by_period.copy()
+        new._age_array_by_key = None
+        # Dated holders of the original holder can't be shared.
+        new._dated_holder_by_period = None
+        new._input_periods = None if self._input_periods is None else self._input_periods.copy()
+        new.column = self.column
+        new.dtype = self.dtype
+        new.entity = entity
+        new.formula_output_period_by_requested_period = self.formula_output_period_by_requested_period
         # Caution: formula must be cloned after the entity has been set into new.
         formula = self.formula
-        if formula is not None:
-            new_dict['formula'] = formula.clone(new)
+        new.formula = None if formula is None else formula.clone(new)
 
         return new
 
@@ -145,7 +190,10 @@ class Holder(object):
 
         # First look for dated_holders covering the whole period (without hole).
         dated_holder = self.at_period(period)
+        profiler = simulation.profiler
         if dated_holder.array is not None:
+            if profiler is not None:
+                profiler.record_cache_hit(self, period)
             return dated_holder
         assert self._array is None  # self._array should always be None when dated_holder.array is None.
 
@@ -153,15 +201,24 @@ class Holder(object):
         column_stop_instant = periods.instant(column.end)
         if (column_start_instant is None or column_start_instant <= period.start) \
                 and (column_stop_instant is None or period.start <= column_stop_instant):
-            formula_dated_holder = self.formula.compute(period = period,
-                requested_formulas_by_period = requested_formulas_by_period)
+            if profiler is None:
+                formula_dated_holder = self.formula.compute(period = period,
+                    requested_formulas_by_period = requested_formulas_by_period)
+            else:
+                profiler.start(self, period)
+                formula_dated_holder = None
+                try:
+                    formula_dated_holder = self.formula.compute(period = period,
+                        requested_formulas_by_period = requested_formulas_by_period)
+                finally:
+                    profiler.stop(formula_dated_holder)
             assert formula_dated_holder is not None
             if not column.is_permanent:
                 assert accept_other_period or formula_dated_holder.period == period, \
                     u"Requested period {} differs from {} returned by variable {}".format(period,
                         formula_dated_holder.period, column.name)
             return formula_dated_holder
-        array = np.empty(entity.count, dtype = column.dtype)
+        array = np.empty(entity.count, dtype = self.dtype)
         array.fill(column.default)
         dated_holder.array = array
         return dated_holder
@@ -300,10 +357,27 @@ class Holder(object):
             return self.compute(period = period, requested_formulas_by_period = requested_formulas_by_period)
 
     def delete_arrays(self):
-        if self._array is not None:
-            del self._array
-        if self._array_by_period is not None:
-            del self._array_by_period
+        self._age_array_by_key = None
+        self._array = None
+        self._array_by_period = None
+        self._input_periods = None
+
+    def delete_computed_arrays(self):
+        """Delete the arrays computed by the formula of the holder, but keep the ones set as inputs."""
+        input_periods = self._input_periods
+        if input_periods is None:
+            self.delete_arrays()
+            return
+        self._age_array_by_key = None
+        if None not in input_periods:
+            self._array = None
+        array_by_period = self._array_by_period
+        if array_by_period is not None:
+            self._array_by_period = {
+                period: array
+                for period, array in array_by_period.iteritems()
+                if period in input_periods
+                } or None
 
     def get_array(self, period):
         if self.column.is_permanent:
@@ -361,13 +435,29 @@ class Holder(object):
                 simulation.traceback[variable_infos] = dict(
                     holder = self,
                     )
+        self._age_array_by_key = None
         array_by_period = self._array_by_period
         if array_by_period is None:
             self._array_by_period = array_by_period = {}
         array_by_period[period] = array
 
     def set_input(self, period, array):
+        input_periods = self._input_periods
+        if input_periods is None:
+            self._input_periods = input_periods = set()
+        if self.column.is_permanent:
+            self.formula.set_input(period, array)
+            input_periods.add(None)
+            return
+        # Note: The formula may also set the arrays of the sub-periods of the input period.
+        array_by_period = self._array_by_period
+        previous_array_by_period = {} if array_by_period is None else array_by_period.copy()
         self.formula.set_input(period, array)
+        input_periods.update(
+            array_period
+            for array_period, period_array in (self._array_by_period or {}).iteritems()
+            if previous_array_by_period.get(array_period) is not period_array
+            )
 
     def to_field_json(self, input_variables_extractor = None, with_value = False):
         self_json = self.column.to_json()
@@ -379,22 +469,37 @@ class Holder(object):
             self_json['value'] = self.to_value_json()
         return self_json
 
-    def to_value_json(self):
+    def to_value_json(self, decimals = None):
         column = self.column
-        transform_dated_value_to_json = column.transform_dated_value_to_json
         if column.is_permanent:
             array = self._array
             if array is None:
                 return None
-            return [
-                transform_dated_value_to_json(cell)
-                for cell in array.tolist()
-                ]
+            return column.transform_array_to_json(array, decimals = decimals)
         value_json = {}
         if self._array_by_period is not None:
             for period, array in self._array_by_period.iteritems():
-                value_json[str(period)] = [
-                    transform_dated_value_to_json(cell)
-                    for cell in array.tolist()
-                    ]
+                value_json[str(period)] = column.transform_array_to_json(array, decimals = decimals)
         return value_json
+
+    def write_value_json(self, value_file, decimals = None):
+        """Write the JSON of to_value_json() to a file, without building the lists of values in memory."""
+        column = self.column
+        if column.is_permanent:
+            array = self._array
+            if array is None:
+                value_file.write('null')
+                return
+            for fragment in column.iter_array_json_fragments(array, decimals = decimals):
+                value_file.write(fragment)
+            return
+        value_file.write('{')
+        if self._array_by_period is not None:
+            for index, (period, array) in enumerate(self._array_by_period.iteritems()):
+                if index > 0:
+                    value_file.write(', ')
+                value_file.write(json.dumps(str(period)))
+                value_file.write(': ')
+                for fragment in column.iter_array_json_fragments(array, decimals = decimals):
+                    value_file.write(fragment)
+        value_file.write('}')
@@ -31,7 +31,7 @@ import datetime
 import itertools
 import logging
 
-from . import conv, periods, taxscales
+from . import conv, periods, stepvectors, taxscales
 
 
 log = logging.getLogger(__name__)
@@ -287,6 +287,84 @@ def generate_dated_node_json(node_json, legislation_start_str, legislation_stop_
     return dated_node_json
 
 
+def update_compact_legislation(compact_legislation, value_by_path, legislation_json = None):
+    """Return a compact legislation where the parameters at the given JSON paths have new values.
+
+    ``value_by_path`` is an iterable of (path, value) couples, paths being the same as in
+    ``reforms.update_legislation()``. Only the nodes (and tax scales) on the paths are copied. The other ones are
+    shared with the given compact legislation, which is left unchanged.
+
+    A tax scale having a patched bracket is compiled again from its JSON in ``legislation_json`` (the legislation the
+    compact legislation was compiled from), with the new values, so that the bases of the brackets and the brackets
+    missing at the instant of the compact legislation are handled as in ``compact_dated_node_json()``.
+    """
+    copied_nodes_id = set()
+
+    def copy_node(node):
+        node = node.copy()
+        copied_nodes_id.add(id(node))
+        return node
+
+    updated_compact_legislation = None
+    bracket_patches_by_scale_path = collections.OrderedDict()
+    for path, value in value_by_path:
+        if updated_compact_legislation is None:
+            updated_compact_legislation = copy_node(compact_legislation)
+        node = updated_compact_legislation
+        path_index = 0
+        while True:
+            assert path[path_index] == 'children', u'Unexpected legislation path: {}'.format(path).encode('utf-8')
+            key = path[path_index + 1]
+            path_index += 2
+            if path_index == len(path) or tuple(path[path_index:]) == ('values',):
+                node[key] = value
+                break
+            child = node[key]
+            if isinstance(child, CompactNode):
+                if id(child) not in copied_nodes_id:
+                    node[key] = child = copy_node(child)
+                node = child
+                continue
+            # Bracket of a tax scale
+            assert path[path_index] == 'brackets' and len(path) == path_index + 3, \
+                u'Unexpected legislation path: {}'.format(path).encode('utf-8')
+            bracket_patches_by_scale_path.setdefault(tuple(path[:path_index]), (node, key, []))[2].append(
+                (path[path_index + 1], path[path_index + 2], value))
+            break
+
+    if bracket_patches_by_scale_path:
+        assert legislation_json is not None, u'Patching a tax scale requires the legislation JSON'
+        instant_str = str(compact_legislation.instant)
+        for scale_path, (node, key, bracket_patches) in bracket_patches_by_scale_path.iteritems():
+            scale_json = legislation_json
+            for fragment in scale_path:
+                scale_json = scale_json[fragment]
+            dated_scale_json = generate_dated_node_json(scale_json, legislation_json['start'],
+                legislation_json['stop'], instant_str)
+            dated_brackets_json = dated_scale_json['brackets']
+            # Note: Tax scales compare the thresholds of their brackets, so step vectors of thresholds (used by
+            # parameter axes) replace the original thresholds once the tax scale is compiled.
+            threshold_vector_by_bracket_index = {}
+            for bracket_index, bracket_key, value in bracket_patches:
+                assert bracket_key in ('amount', 'base', 'rate', 'threshold'), bracket_key
+                if bracket_key == 'threshold' and stepvectors.is_step_vector(value):
+                    threshold_vector_by_bracket_index[bracket_index] = value
+                else:
+                    dated_brackets_json[bracket_index][bracket_key] = value
+            tax_scale = compact_dated_node_json(dated_scale_json, code = key, instant = compact_legislation.instant)
+            thresholds = list(tax_scale.thresholds)
+            for bracket_index, threshold_vector in threshold_vector_by_bracket_index.iteritems():
+                threshold = dated_brackets_json[bracket_index].get('threshold')
+                assert threshold is not None and thresholds.count(threshold) == 1 and sum(
+                    bracket_json.get('threshold') == threshold
+                    for bracket_json in dated_brackets_json
+                    ) == 1, u'Threshold of bracket {} of {} can not vary at {}'.format(bracket_index, key,
+                        instant_str).encode('utf-8')
+                tax_scale.thresholds[thresholds.index(threshold)] = threshold_vector
+            node[key] = tax_scale
+    return compact_legislation if updated_compact_legislation is None else updated_compact_legislation
+
+
 # Level-1 Converters
 
 
@@ -32,22 +32,51 @@ Since a period is a triple it can be used as a dictionary key.
 """
 
 
+from bisect import bisect_right
 import calendar
 import collections
 import datetime
 import re
 
+import numpy as np
+
 from . import conv
 
 
 N_ = lambda message: message
 # Note: weak references are not used, because Python 2.7 can't create weak reference to 'datetime.date' objects.
 date_by_instant_cache = {}
+instant_by_str_cache = {}  # Memo of instant() for strings, cleared when it reaches parsing_cache_max_size
+parsing_cache_max_size = 10000
+period_by_value_cache = {}  # Memo of period() for strings and integers, cleared when it reaches parsing_cache_max_size
+period_str_re = re.compile(ur'((day|month|year):)?(\d{4})(-(\d{1,2})(-(\d{1,2}))?)?(:(\d{1,9}))?$')
 str_by_instant_cache = {}
+subperiods_by_unit_by_period_cache = {}  # Memo of get_subperiods(), cleared when it reaches parsing_cache_max_size
 year_or_month_or_day_re = re.compile(ur'(18|19|20)\d{2}(-(0?[1-9]|1[0-2])(-([0-2]?\d|3[0-1]))?)?$')
 
 
+# Integer arithmetic of instants: an instant is a day ordinal (as given by date.toordinal()) or a month index
+# (year * 12 + month - 1) plus a day. Months of years in [tables_start_year, tables_stop_year[ are tabulated, so that
+# period arithmetic needs neither datetime nor calendar.
+tables_start_year = 1800
+tables_stop_year = 2200
+month_days_table = [
+    calendar.monthrange(year, month)[1]
+    for year in xrange(tables_start_year, tables_stop_year)
+    for month in xrange(1, 13)
+    ]
+first_day_ordinal_by_month_table = [datetime.date(tables_start_year, 1, 1).toordinal()]
+for month_days in month_days_table:
+    first_day_ordinal_by_month_table.append(first_day_ordinal_by_month_table[-1] + month_days)
+del month_days
+tables_months_count = len(month_days_table)
+tables_start_month_index = tables_start_year * 12
+
+
 class Instant(tuple):
+    # Note: Simulations create many instants => Don't give them a __dict__ (nor a weakref slot).
+    __slots__ = ()
+
     def __repr__(self):
         """Transform instant to to its Python representation as a string.
 
@@ -124,6 +153,19 @@ class Instant(tuple):
         """
         return self[1]
 
+    @property
+    def ordinal(self):
+        """Return the day ordinal of the instant (the same as ``date.toordinal()``).
+
+        >>> instant('2014-2-3').ordinal == datetime.date(2014, 2, 3).toordinal()
+        True
+        """
+        year, month, day = self
+        table_index = year * 12 + month - 1 - tables_start_month_index
+        if 0 <= table_index < tables_months_count:
+            return first_day_ordinal_by_month_table[table_index] + day - 1
+        return get_first_day_ordinal(year * 12 + month - 1) + day - 1
+
     def period(self, unit, size = 1):
         """Create a new period starting at instant.
 
@@ -228,7 +270,7 @@ class Instant(tuple):
                 day = 1
         elif offset == 'last-of':
             if unit == u'month':
-                day = calendar.monthrange(year, month)[1]
+                day = get_month_days(year, month)
             else:
                 assert unit == u'year', 'Invalid unit: {} of type {}'.format(unit, type(unit))
                 month = 12
@@ -236,41 +278,18 @@ class Instant(tuple):
         else:
             assert isinstance(offset, int), 'Invalid offset: {} of type {}'.format(offset, type(offset))
             if unit == u'day':
-                day += offset
-                if offset < 0:
-                    while day < 1:
-                        month -= 1
-                        if month == 0:
-                            year -= 1
-                            month = 12
-                        day += calendar.monthrange(year, month)[1]
-                elif offset > 0:
-                    month_last_day = calendar.monthrange(year, month)[1]
-                    while day > month_last_day:
-                        month += 1
-                        if month == 13:
-                            year += 1
-                            month = 1
-                        day -= month_last_day
-                        month_last_day = calendar.monthrange(year, month)[1]
-            elif unit == u'month':
-                month += offset
-                if offset < 0:
-                    while month < 1:
-                        year -= 1
-                        month += 12
-                elif offset > 0:
-                    while month > 12:
-                        year += 1
-                        month -= 12
-                month_last_day = calendar.monthrange(year, month)[1]
-                if day > month_last_day:
-                    day = month_last_day
+                if offset == 0:
+                    return self
+                return instant_from_ordinal(self.ordinal + offset)
+            if unit == u'month':
+                year, month = divmod(year * 12 + month - 1 + offset, 12)
+                month += 1
             else:
                 assert unit == u'year', 'Invalid unit: {} of type {}'.format(unit, type(unit))
                 year += offset
-                # Handle february month of leap year.
-                month_last_day = calendar.monthrange(year, month)[1]
+            # Handle the last days of months (and february month of leap year).
+            if day > 28:
+                month_last_day = get_month_days(year, month)
                 if day > month_last_day:
                     day = month_last_day
         return self.__class__((year, month, day))
@@ -290,6 +309,9 @@ class Instant(tuple):
 
 
 class Period(tuple):
+    # Note: Simulations create many periods => Don't give them a __dict__ (nor a weakref slot).
+    __slots__ = ()
+
     def __repr__(self):
         """Transform period to to its Python representation as a string.
 
@@ -356,7 +378,7 @@ class Period(tuple):
                 start_instant = start_instant[:1]
                 if unit != u'year':
                     size = None
-            elif unit == u'day' and size == calendar.monthrange(year, month)[1] or unit in (u'month', u'year'):
+            elif unit == u'day' and size == get_month_days(year, month) or unit in (u'month', u'year'):
                 start_instant = start_instant[:2]
                 if unit not in (u'month', u'year'):
                     size = None
@@ -405,7 +427,33 @@ class Period(tuple):
         >>> period('year', '2014-2-3').days
         365
         """
-        return (self.stop.date - self.start.date).days + 1
+        return self.stop.ordinal - self[1].ordinal + 1
+
+    def get_subperiods(self, unit):
+        """Return the periods of 1 unit that cover the period, starting at its start.
+
+        >>> period('year', 2014).get_subperiods('month')[-1]
+        Period((u'month', Instant((2014, 12, 1)), 1))
+        >>> len(period('month', '2014-2', 2).get_subperiods('day'))
+        59
+        """
+        subperiods_by_unit = subperiods_by_unit_by_period_cache.get(self)
+        if subperiods_by_unit is None:
+            if len(subperiods_by_unit_by_period_cache) >= parsing_cache_max_size:
+                subperiods_by_unit_by_period_cache.clear()
+            subperiods_by_unit_by_period_cache[self] = subperiods_by_unit = {}
+        subperiods = subperiods_by_unit.get(unit)
+        if subperiods is None:
+            unit = unicode(unit)
+            instants = [
+                instant_from_ordinal(ordinal)
+                for ordinal in get_subperiods_start_ordinals(self, unit).tolist()
+                ]
+            subperiods_by_unit[unit] = subperiods = tuple(
+                Period((unit, instant, 1))
+                for instant in instants
+                )
+        return subperiods
 
     def intersection(self, start, stop):
         if start is None and stop is None:
@@ -429,8 +477,8 @@ class Period(tuple):
                 intersection_start,
                 intersection_stop.year - intersection_start.year + 1,
                 ))
-        if intersection_start.day == 1 and intersection_stop.day == calendar.monthrange(intersection_stop.year,
-                intersection_stop.month)[1]:
+        if intersection_start.day == 1 and intersection_stop.day == get_month_days(intersection_stop.year,
+                intersection_stop.month):
             return self.__class__((
                 u'month',
                 intersection_start,
@@ -440,7 +488,7 @@ class Period(tuple):
         return self.__class__((
             u'day',
             intersection_start,
-            (intersection_stop.date - intersection_start.date).days + 1,
+            intersection_stop.ordinal - intersection_start.ordinal + 1,
             ))
 
     def offset(self, offset, unit = None):
@@ -625,41 +673,24 @@ class Period(tuple):
         unit, start_instant, size = self
         year, month, day = start_instant
         if unit == u'day':
-            if size > 1:
-                day += size - 1
-                month_last_day = calendar.monthrange(year, month)[1]
-                while day > month_last_day:
-                    month += 1
-                    if month == 13:
-                        year += 1
-                        month = 1
-                    day -= month_last_day
-                    month_last_day = calendar.monthrange(year, month)[1]
+            if size == 1:
+                return start_instant
+            day += size - 1
+            if day <= get_month_days(year, month):
+                return Instant((year, month, day))
+            return instant_from_ordinal(start_instant.ordinal + size - 1)
+        if unit == u'month':
+            month_index = year * 12 + month - 1 + size
         else:
-            if unit == u'month':
-                month += size
-                while month > 12:
-                    year += 1
-                    month -= 12
-            else:
-                assert unit == u'year', 'Invalid unit: {} of type {}'.format(unit, type(unit))
-                year += size
-            day -= 1
-            if day < 1:
-                month -= 1
-                if month == 0:
-                    year -= 1
-                    month = 12
-                day += calendar.monthrange(year, month)[1]
-            else:
-                month_last_day = calendar.monthrange(year, month)[1]
-                if day > month_last_day:
-                    month += 1
-                    if month == 13:
-                        year += 1
-                        month = 1
-                    day -= month_last_day
-        return Instant((year, month, day))
+            assert unit == u'year', 'Invalid unit: {} of type {}'.format(unit, type(unit))
+            month_index = year * 12 + month - 1 + 12 * size
+        # The day before the same day of the month after the period (overflowing to the next month, when this month
+        # is too short).
+        year, month = divmod(month_index, 12)
+        month += 1
+        if 1 < day <= get_month_days(year, month) + 1:
+            return Instant((year, month, day - 1))
+        return instant_from_ordinal(get_first_day_ordinal(month_index) + day - 2)
 
     def to_json_dict(self):
         return collections.OrderedDict((
@@ -673,6 +704,64 @@ class Period(tuple):
         return self[0]
 
 
+def get_first_day_ordinal(month_index):
+    """Return the day ordinal of the first day of a month, given as year * 12 + month - 1."""
+    table_index = month_index - tables_start_month_index
+    if 0 <= table_index < tables_months_count:
+        return first_day_ordinal_by_month_table[table_index]
+    year, month = divmod(month_index, 12)
+    return datetime.date(year, month + 1, 1).toordinal()
+
+
+def get_month_days(year, month):
+    """Return the number of days of a month.
+
+    >>> get_month_days(2012, 2)
+    29
+    """
+    table_index = year * 12 + month - 1 - tables_start_month_index
+    if 0 <= table_index < tables_months_count:
+        return month_days_table[table_index]
+    return calendar.monthrange(year, month)[1]
+
+
+def get_subperiods_start_ordinals(period, unit):
+    """Return an array of the day ordinals of the starts of the periods of 1 unit that cover a period.
+
+    The sub-periods are the ones obtained by offsetting repeatedly by 1 unit a period starting at the start of the
+    period, as long as they start before the start of the period offset by its size.
+
+    >>> get_subperiods_start_ordinals(period('year', 2014), 'month')[:3] - instant(2014).ordinal
+    array([ 0, 31, 59])
+    """
+    period_unit, start_instant, size = period
+    after_instant = start_instant.offset(size, period_unit)
+    after_ordinal = after_instant.ordinal
+    if unit == u'day':
+        return np.arange(start_instant.ordinal, after_ordinal)
+    year, month, day = start_instant
+    after_year, after_month, after_day = after_instant
+    step = 12 if unit == u'year' else 1
+    month_indexes = np.arange(year * 12 + month - 1, after_year * 12 + after_month, step)
+    table_indexes = month_indexes - tables_start_month_index
+    if table_indexes[0] >= 0 and table_indexes[-1] < tables_months_count:
+        month_days = np.asarray(month_days_table)[table_indexes]
+        first_day_ordinals = np.asarray(first_day_ordinal_by_month_table)[table_indexes]
+    else:
+        month_days = np.array([
+            get_month_days(month_index // 12, month_index % 12 + 1)
+            for month_index in month_indexes.tolist()
+            ])
+        first_day_ordinals = np.array([
+            get_first_day_ordinal(month_index)
+            for month_index in month_indexes.tolist()
+            ])
+    # Offsetting by 1 unit clips the day to the last day of shorter months, and the clipped day is kept afterwards.
+    days = np.minimum.accumulate(np.minimum(day, month_days)) if day > 28 else day
+    start_ordinals = first_day_ordinals + days - 1
+    return start_ordinals[start_ordinals < after_ordinal]
+
+
 def instant(instant):
     """Return a new instant, aka a triple of integers (year, month, day).
 
@@ -694,11 +783,19 @@ def instant(instant):
     if instant is None:
         return None
     if isinstance(instant, basestring):
-        instant = Instant(
-            int(fragment)
-            for fragment in instant.split(u'-', 2)[:3]
-            )
-    elif isinstance(instant, datetime.date):
+        parsed_instant = instant_by_str_cache.get(instant)
+        if parsed_instant is None:
+            fragments = instant.split(u'-', 2)[:3]
+            parsed_instant = Instant((
+                int(fragments[0]),
+                int(fragments[1]) if len(fragments) >= 2 else 1,
+                int(fragments[2]) if len(fragments) == 3 else 1,
+                ))
+            if len(instant_by_str_cache) >= parsing_cache_max_size:
+                instant_by_str_cache.clear()
+            instant_by_str_cache[instant] = parsed_instant
+        return parsed_instant
+    if isinstance(instant, datetime.date):
         instant = Instant((instant.year, instant.month, instant.day))
     elif isinstance(instant, int):
         instant = (instant,)
@@ -717,6 +814,20 @@ def instant(instant):
     return Instant(instant)
 
 
+def instant_from_ordinal(ordinal):
+    """Return the instant of a day ordinal (as given by ``date.toordinal()``).
+
+    >>> instant_from_ordinal(instant('2012-2-29').ordinal + 1)
+    Instant((2012, 3, 1))
+    """
+    table_index = bisect_right(first_day_ordinal_by_month_table, ordinal) - 1
+    if 0 <= table_index < tables_months_count:
+        year, month = divmod(table_index + tables_start_month_index, 12)
+        return Instant((year, month + 1, ordinal - first_day_ordinal_by_month_table[table_index] + 1))
+    date = datetime.date.fromordinal(ordinal)
+    return Instant((date.year, date.month, date.day))
+
+
 def instant_date(instant):
     if instant is None:
         return None
@@ -813,7 +924,17 @@ def period(value, start = None, size = None):
     if not isinstance(value, basestring) or value not in (u'day', u'month', u'year'):
         assert start is None, start
         assert size is None, size
-        return conv.check(json_or_python_to_period)(value)
+        if not isinstance(value, (basestring, int)):
+            return conv.check(json_or_python_to_period)(value)
+        parsed_period = period_by_value_cache.get(value)
+        if parsed_period is None:
+            parsed_period = parse_period_str(value) if isinstance(value, basestring) else None
+            if parsed_period is None:
+                parsed_period = conv.check(json_or_python_to_period)(value)
+            if len(period_by_value_cache) >= parsing_cache_max_size:
+                period_by_value_cache.clear()
+            period_by_value_cache[value] = parsed_period
+        return parsed_period
     unit = unicode(value)
     assert size is None or isinstance(size, int) and size > 0, size
 
@@ -847,7 +968,7 @@ def period(value, start = None, size = None):
         start = Instant((start[0], start[1], 1))
         if size is None:
             if unit == u'day':
-                size = calendar.monthrange(start[0], start[1])[1]
+                size = get_month_days(start[0], start[1])
             else:
                 size = 1
     else:
@@ -857,6 +978,48 @@ def period(value, start = None, size = None):
     return Period((unit, start, size))
 
 
+def parse_period_str(value):
+    """Parse the canonical forms of period strings without converters. Return None for any other string.
+
+    Unusual strings (with spaces, invalid dates, out of range years...) are left to ``json_or_python_to_period``.
+
+    >>> parse_period_str(u'2014-2:3')
+    Period((u'month', Instant((2014, 2, 1)), 3))
+    >>> parse_period_str(u'month:2014')
+    Period((u'month', Instant((2014, 1, 1)), 12))
+    >>> parse_period_str(u'2014-2-30')
+    """
+    match = period_str_re.match(value)
+    if match is None:
+        return None
+    unit, year, month, day, size = match.group(2, 3, 5, 7, 9)
+    year = int(year)
+    if month is None:
+        default_unit = u'year'
+        start = (year,)
+    else:
+        month = int(month)
+        if not 1 <= month <= 12:
+            return None
+        if day is None:
+            default_unit = u'month'
+            start = (year, month)
+        else:
+            day = int(day)
+            if not 1 <= day <= get_month_days(year, month):
+                return None
+            default_unit = u'day'
+            start = (year, month, day)
+    if size is not None:
+        size = int(size)
+        if size < 1:
+            return None
+    parsed_period = period(default_unit if unit is None else unit, start, size)
+    if not (1870, 1, 1) <= parsed_period.start <= (2099, 12, 31):
+        return None
+    return parsed_period
+
+
 # Level-1 converters
 
 
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+
+
+# OpenFisca -- A versatile microsimulation software
+# By: OpenFisca Team <contact@openfisca.fr>
+#
+# Copyright (C) 2011, 2012, 2013, 2014, 2015 OpenFisca Team
+# https://github.com/openfisca
+#
+# This file is part of OpenFisca.
+#
+# OpenFisca is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# OpenFisca is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""Profile the formulas of a simulation: time, calls, memory and cache hits by (variable, period)"""
+
+
+import collections
+import json
+import timeit
+
+
+__all__ = ['Profiler']
+
+
+class Profiler(object):
+    """Record statistics of the computations of the formulas of a simulation
+
+    The simulation calls ``start()`` and ``stop()`` around each formula computation and ``record_cache_hit()`` each time
+    a requested value is already known. Inclusive time includes the time spent computing dependencies, exclusive time
+    doesn't.
+    """
+    frames = None  # Stack of [key, start time, time spent in dependencies] of formulas being computed
+    stats_by_key = None  # [calls, cache hits, inclusive time, exclusive time, bytes] by (variable name, period)
+    time_by_folded_stack = None  # Exclusive time by stack of keys, for flame graphs
+
+    def __init__(self):
+        self.frames = []
+        self.stats_by_key = {}
+        self.time_by_folded_stack = collections.defaultdict(float)
+
+    def get_stats(self, key):
+        stats = self.stats_by_key.get(key)
+        if stats is None:
+            self.stats_by_key[key] = stats = [0, 0, 0.0, 0.0, 0]
+        return stats
+
+    def record_cache_hit(self, holder, period):
+        self.get_stats((holder.column.name, period))[1] += 1
+
+    def start(self, holder, period):
+        self.frames.append([(holder.column.name, period), timeit.default_timer(), 0.0])
+
+    def stop(self, dated_holder = None):
+        """End the computation of the formula started last. Dated holder is its result (None on error)."""
+        key, start_time, dependencies_time = self.frames.pop()
+        inclusive_time = timeit.default_timer() - start_time
+        exclusive_time = inclusive_time - dependencies_time
+        stats = self.get_stats(key)
+        stats[0] += 1
+        stats[2] += inclusive_time
+        stats[3] += exclusive_time
+        if dated_holder is not None:
+            stats[4] += dated_holder.array.nbytes
+        frames = self.frames
+        if frames:
+            frames[-1][2] += inclusive_time
+        self.time_by_folded_stack[tuple(
+            parent_frame[0]
+            for parent_frame in frames
+            ) + (key,)] += exclusive_time
+
+    def to_folded_stacks(self):
+        """Return the lines of a "folded stacks" file (readable by flamegraph.pl), with times in microseconds."""
+        return [
+            u'{} {}'.format(
+                u';'.join(u'{}<{}>'.format(variable_name, period) for variable_name, period in folded_stack),
+                int(round(time * 1e6)),
+                )
+            for folded_stack, time in sorted(self.time_by_folded_stack.iteritems())
+            ]
+
+    def to_json(self):
+        """Return the statistics of each (variable, period), sorted by decreasing exclusive time."""
+        return [
+            collections.OrderedDict((
+                ('variable', variable_name),
+                ('period', None if period is None else unicode(period)),
+                ('calls', calls),
+                ('cache_hits', cache_hits),
+                ('inclusive_time', inclusive_time),
+                ('exclusive_time', exclusive_time),
+                ('bytes', bytes_count),
+                ))
+            for (variable_name, period), (calls, cache_hits, inclusive_time, exclusive_time, bytes_count) in sorted(
+                self.stats_by_key.iteritems(),
+                key = lambda item: (-item[1][3], item[0]),
+                )
+            ]
+
+    def write_folded_stacks(self, file_path):
+        with open(file_path, 'w') as folded_stacks_file:
+            for line in self.to_folded_stacks():
+                folded_stacks_file.write(line.encode('utf-8'))
+                folded_stacks_file.write('\n')
+
+    def write_json(self, file_path):
+        with open(file_path, 'w') as json_file:
+            json.dump(self.to_json(), json_file, indent = 2)
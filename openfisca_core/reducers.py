@@ -0,0 +1,322 @@
+# -*- coding: utf-8 -*-
+
+
+# OpenFisca -- A versatile microsimulation software
+# By: OpenFisca Team <contact@openfisca.fr>
+#
+# Copyright (C) 2011, 2012, 2013, 2014, 2015 OpenFisca Team
+# https://github.com/openfisca
+#
+# This file is part of OpenFisca.
+#
+# OpenFisca is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# OpenFisca is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""Reducers aggregating variables of simulations, that can be updated chunk by chunk and merged together"""
+
+
+import numpy as np
+
+
+__all__ = [
+    'AbstractReducer',
+    'WeightedCount',
+    'WeightedHistogram',
+    'WeightedMean',
+    'WeightedQuantiles',
+    'WeightedSum',
+    ]
+
+
+class AbstractReducer(object):
+    group_by_variable_name = None  # When not None, the name of a variable containing non-negative integer codes
+    period = None  # When None, the period of the simulation is used.
+    variable_name = None
+    weight_variable_name = None  # When None, every cell has a weight of 1.
+
+    def __init__(self, variable_name = None, period = None, weight_variable_name = None,
+            group_by_variable_name = None):
+        assert variable_name is not None
+        self.variable_name = variable_name
+        if period is not None:
+            self.period = period
+        if weight_variable_name is not None:
+            self.weight_variable_name = weight_variable_name
+        if group_by_variable_name is not None:
+            self.group_by_variable_name = group_by_variable_name
+
+    def calculate_arrays(self, simulation):
+        """Return the (array, weight array, group array) triple of the variable.
+
+        Weight array is None when there is no weight and group array is None when there is no group-by variable.
+        """
+        period = self.period
+        array = simulation.calculate(self.variable_name, period)
+        entity = simulation.entity_by_column_name[self.variable_name]
+        weight_array = None
+        weight_variable_name = self.weight_variable_name
+        if weight_variable_name is not None:
+            assert simulation.entity_by_column_name[weight_variable_name] is entity, \
+                u'Variable {} and weight {} must belong to the same entity'.format(self.variable_name,
+                    weight_variable_name).encode('utf-8')
+            weight_array = simulation.calculate(weight_variable_name, period)
+        group_array = None
+        group_by_variable_name = self.group_by_variable_name
+        if group_by_variable_name is not None:
+            assert simulation.entity_by_column_name[group_by_variable_name] is entity, \
+                u'Variable {} and group-by variable {} must belong to the same entity'.format(self.variable_name,
+                    group_by_variable_name).encode('utf-8')
+            group_array = simulation.calculate(group_by_variable_name, period)
+            assert group_array.dtype == np.bool_ or np.issubdtype(group_array.dtype, np.integer), \
+                u'Group-by variable {} must contain integer codes'.format(group_by_variable_name).encode('utf-8')
+            group_array = group_array.astype(np.intp)
+        return array, weight_array, group_array
+
+    def merge(self, other):
+        """Add the aggregates of another reducer (computed on another chunk of population) to this reducer."""
+        raise NotImplementedError('Method "merge" is not implemented for {}'.format(self.__class__.__name__))
+
+    @property
+    def result(self):
+        raise NotImplementedError('Property "result" is not implemented for {}'.format(self.__class__.__name__))
+
+    def update(self, simulation, chunk = None):
+        """Aggregate the variable of a simulation (optionally built for a chunk of population)."""
+        raise NotImplementedError('Method "update" is not implemented for {}'.format(self.__class__.__name__))
+
+
+class WeightedCount(AbstractReducer):
+    """Weighted count of the cells of the entity of the variable"""
+    total = 0.0
+
+    def merge(self, other):
+        assert isinstance(other, WeightedCount)
+        self.total = add_totals(self.total, other.total)
+        return self
+
+    @property
+    def result(self):
+        return self.total
+
+    def update(self, simulation, chunk = None):
+        array, weight_array, group_array = self.calculate_arrays(simulation)
+        self.total = add_totals(self.total, sum_by_group(
+            np.ones(len(array), dtype = np.float64) if weight_array is None else weight_array,
+            group_array,
+            ))
+
+
+class WeightedHistogram(AbstractReducer):
+    """Weighted count of the cells in each bin of the variable
+
+    Bins are fixed by their edges, so that histograms of different chunks can be merged. Values below the first edge
+    are counted in the first bin and values above the last edge in the last bin.
+    """
+    bins = None
+    total = 0.0
+
+    def __init__(self, variable_name = None, bins = None, period = None, weight_variable_name = None,
+            group_by_variable_name = None):
+        super(WeightedHistogram, self).__init__(variable_name = variable_name, period = period,
+            weight_variable_name = weight_variable_name, group_by_variable_name = group_by_variable_name)
+        bins = np.asarray(bins, dtype = np.float64)
+        assert bins.ndim == 1 and len(bins) >= 2 and np.all(bins[1:] > bins[:-1]), bins
+        self.bins = bins
+
+    def merge(self, other):
+        assert isinstance(other, WeightedHistogram)
+        assert np.array_equal(self.bins, other.bins)
+        self.total = add_totals(self.total, other.total)
+        return self
+
+    @property
+    def result(self):
+        """Return the weights of the bins, as an array of shape (bins,) or (groups, bins) when grouped."""
+        bins_count = len(self.bins) - 1
+        if isinstance(self.total, float):
+            return np.zeros(bins_count) if self.group_by_variable_name is None else np.zeros((0, bins_count))
+        if self.group_by_variable_name is None:
+            return self.total
+        return self.total.reshape(-1, bins_count)
+
+    def update(self, simulation, chunk = None):
+        array, weight_array, group_array = self.calculate_arrays(simulation)
+        bins_count = len(self.bins) - 1
+        bin_array = np.clip(np.searchsorted(self.bins, array, side = 'right') - 1, 0, bins_count - 1)
+        if group_array is not None:
+            bin_array += group_array * bins_count
+        total = np.bincount(bin_array, weights = weight_array)
+        # Pad to a whole number of rows of bins.
+        self.total = add_totals(self.total, add_totals(np.zeros(-(-len(total) // bins_count) * bins_count), total))
+
+
+class WeightedMean(AbstractReducer):
+    total = 0.0
+    weight_total = 0.0
+
+    def merge(self, other):
+        assert isinstance(other, WeightedMean)
+        self.total = add_totals(self.total, other.total)
+        self.weight_total = add_totals(self.weight_total, other.weight_total)
+        return self
+
+    @property
+    def result(self):
+        """Return the weighted mean, or NaN (for each group) when the total weight is zero."""
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            return np.true_divide(self.total, self.weight_total)
+
+    def update(self, simulation, chunk = None):
+        array, weight_array, group_array = self.calculate_arrays(simulation)
+        self.total = add_totals(self.total, sum_by_group(
+            array if weight_array is None else array * weight_array, group_array))
+        self.weight_total = add_totals(self.weight_total, sum_by_group(
+            np.ones(len(array), dtype = np.float64) if weight_array is None else weight_array,
+            group_array,
+            ))
+
+
+class WeightedQuantiles(AbstractReducer):
+    """Weighted quantiles (deciles by default) of the variable
+
+    A weighted quantile q is the lowest value whose cumulated weight reaches q times the total weight.
+
+    When ``bins`` are given, quantiles are interpolated from a weighted histogram of the variable, which uses a
+    bounded memory whatever the number of chunks. Otherwise, the values and weights of every chunk are kept to give
+    exact quantiles.
+    """
+    group_arrays = None
+    histogram = None
+    quantiles = None
+    value_arrays = None
+    weight_arrays = None
+
+    def __init__(self, variable_name = None, quantiles = None, bins = None, period = None,
+            weight_variable_name = None, group_by_variable_name = None):
+        super(WeightedQuantiles, self).__init__(variable_name = variable_name, period = period,
+            weight_variable_name = weight_variable_name, group_by_variable_name = group_by_variable_name)
+        self.quantiles = np.arange(1, 10) / 10.0 if quantiles is None else np.asarray(quantiles, dtype = np.float64)
+        assert np.all((0 <= self.quantiles) & (self.quantiles <= 1)), self.quantiles
+        if bins is None:
+            self.group_arrays = []
+            self.value_arrays = []
+            self.weight_arrays = []
+        else:
+            self.histogram = WeightedHistogram(variable_name = variable_name, bins = bins, period = period,
+                weight_variable_name = weight_variable_name, group_by_variable_name = group_by_variable_name)
+
+    def merge(self, other):
+        assert isinstance(other, WeightedQuantiles)
+        assert np.array_equal(self.quantiles, other.quantiles)
+        if self.histogram is not None:
+            self.histogram.merge(other.histogram)
+        else:
+            self.group_arrays.extend(other.group_arrays)
+            self.value_arrays.extend(other.value_arrays)
+            self.weight_arrays.extend(other.weight_arrays)
+        return self
+
+    @property
+    def result(self):
+        """Return the quantiles, as an array of shape (quantiles,) or (groups, quantiles) when grouped."""
+        if self.histogram is not None:
+            histogram = self.histogram.result
+            if self.group_by_variable_name is None:
+                return interpolate_quantiles(self.histogram.bins, histogram, self.quantiles)
+            return np.array([
+                interpolate_quantiles(self.histogram.bins, group_histogram, self.quantiles)
+                for group_histogram in histogram
+                ]).reshape(-1, len(self.quantiles))
+        if not self.value_arrays:
+            return np.repeat(np.nan, len(self.quantiles)) if self.group_by_variable_name is None \
+                else np.zeros((0, len(self.quantiles)))
+        value_array = np.concatenate(self.value_arrays)
+        weight_array = np.concatenate(self.weight_arrays)
+        if self.group_by_variable_name is None:
+            return calculate_quantiles(value_array, weight_array, self.quantiles)
+        group_array = np.concatenate(self.group_arrays)
+        return np.array([
+            calculate_quantiles(value_array[group_array == group], weight_array[group_array == group],
+                self.quantiles)
+            for group in xrange(group_array.max() + 1)
+            ])
+
+    def update(self, simulation, chunk = None):
+        if self.histogram is not None:
+            self.histogram.update(simulation, chunk = chunk)
+            return
+        array, weight_array, group_array = self.calculate_arrays(simulation)
+        self.value_arrays.append(np.array(array, dtype = np.float64))
+        self.weight_arrays.append(np.ones(len(array), dtype = np.float64) if weight_array is None
+            else np.array(weight_array, dtype = np.float64))
+        if group_array is not None:
+            self.group_arrays.append(group_array)
+
+
+class WeightedSum(AbstractReducer):
+    total = 0.0
+
+    def merge(self, other):
+        assert isinstance(other, WeightedSum)
+        self.total = add_totals(self.total, other.total)
+        return self
+
+    @property
+    def result(self):
+        return self.total
+
+    def update(self, simulation, chunk = None):
+        array, weight_array, group_array = self.calculate_arrays(simulation)
+        self.total = add_totals(self.total, sum_by_group(
+            array if weight_array is None else array * weight_array, group_array))
+
+
+def add_totals(total, other_total):
+    """Add two totals, each being a float or an array of totals by group (possibly of different lengths)."""
+    if isinstance(total, float) and isinstance(other_total, float):
+        return total + other_total
+    if isinstance(total, float):
+        assert total == 0, total
+        return np.array(other_total, dtype = np.float64)
+    if isinstance(other_total, float):
+        assert other_total == 0, other_total
+        return total
+    if len(total) < len(other_total):
+        total, other_total = other_total, total
+    total = np.array(total, dtype = np.float64)
+    total[:len(other_total)] += other_total
+    return total
+
+
+def calculate_quantiles(value_array, weight_array, quantiles):
+    if len(value_array) == 0:
+        return np.repeat(np.nan, len(quantiles))
+    order = np.argsort(value_array, kind = 'mergesort')
+    cumulated_weight_array = np.cumsum(weight_array[order])
+    indexes = np.searchsorted(cumulated_weight_array, quantiles * cumulated_weight_array[-1], side = 'left')
+    return value_array[order][np.minimum(indexes, len(order) - 1)]
+
+
+def interpolate_quantiles(bins, histogram, quantiles):
+    cumulated_weight_array = np.concatenate(([0.0], np.cumsum(histogram)))
+    if cumulated_weight_array[-1] == 0:
+        return np.repeat(np.nan, len(quantiles))
+    return np.interp(quantiles * cumulated_weight_array[-1], cumulated_weight_array, bins)
+
+
+def sum_by_group(array, group_array):
+    """Return the sum of array (float), or its sums by group (array) when group_array is not None."""
+    if group_array is None:
+        return float(np.sum(array, dtype = np.float64))
+    return np.bincount(group_array, weights = array).astype(np.float64)
@@ -25,14 +25,16 @@
 
 import collections
 
-from . import formulas, periods, taxbenefitsystems
+from . import formulas, legislations, periods, taxbenefitsystems
 
 
 class AbstractReform(taxbenefitsystems.AbstractTaxBenefitSystem):
     """A reform is a variant of a TaxBenefitSystem, that refers to the real TaxBenefitSystem as its reference."""
     DECOMP_DIR = None
     DEFAULT_DECOMP_FILE = None
+    legislation_patches = None  # List of dict(path, start, stop, value) applied to the legislation of the reference
     name = None
+    patches_reference_legislation = False  # When True, compact legislations are overlays of the reference ones
 
     def __init__(self):
         assert self.name is not None
@@ -44,16 +46,126 @@ class AbstractReform(taxbenefitsystems.AbstractTaxBenefitSystem):
             self.DECOMP_DIR = self.reference.DECOMP_DIR
         if self.DEFAULT_DECOMP_FILE is None:
             self.DEFAULT_DECOMP_FILE = self.reference.DEFAULT_DECOMP_FILE
+        legislation_json = self.legislation_json
+        if legislation_json is None:
+            legislation_json = self.reference.legislation_json
+            if self.legislation_patches:
+                self.legislation_patches = normalize_legislation_patches(self.legislation_patches)
+                self.patches_reference_legislation = True
+                # The legislation JSON is only used for exports: compact legislations don't depend on it.
+                for path, start, stop, value in self.legislation_patches:
+                    legislation_json = update_legislation(legislation_json, path, start = start, stop = stop,
+                        value = value)
         super(AbstractReform, self).__init__(
             entity_class_by_key_plural = self.entity_class_by_key_plural or self.reference.entity_class_by_key_plural,
-            legislation_json = self.legislation_json or self.reference.legislation_json,
+            legislation_json = legislation_json,
             )
 
+    def new_column_by_name(self):
+        """Return the columns of the reform, layered over the ones of its reference.
+
+        Only the columns added or replaced by the reform are stored, when its entity classes are clones of the ones of
+        the reference.
+        """
+        reference = self.reference
+        column_by_name = LayeredOrderedDict(reference.column_by_name)
+        for key_plural, entity_class in self.entity_class_by_key_plural.iteritems():
+            entity_column_by_name = entity_class.column_by_name
+            reference_entity_class = reference.entity_class_by_key_plural.get(key_plural)
+            if reference_entity_class is None:
+                return super(AbstractReform, self).new_column_by_name()
+            reference_entity_column_by_name = reference_entity_class.column_by_name
+            if entity_column_by_name is reference_entity_column_by_name:
+                continue
+            if not isinstance(entity_column_by_name, LayeredOrderedDict) \
+                    or entity_column_by_name.parent is not reference_entity_column_by_name:
+                return super(AbstractReform, self).new_column_by_name()
+            column_by_name.update(entity_column_by_name.own)
+        return column_by_name
+
+    def get_compact_legislation(self, instant):
+        if not self.patches_reference_legislation:
+            return super(AbstractReform, self).get_compact_legislation(instant)
+        compact_legislation = self.compact_legislation_by_instant_cache.get(instant)
+        if compact_legislation is None:
+            compact_legislation = patch_compact_legislation(self.reference.get_compact_legislation(instant),
+                self.legislation_patches, legislation_json = self.reference.legislation_json)
+            self.compact_legislation_by_instant_cache[instant] = compact_legislation
+        return compact_legislation
+
+
+class LayeredOrderedDict(collections.MutableMapping):
+    """An ordered dict storing only its own items and falling back to a parent mapping for the other ones
+
+    Used for the columns of reforms, so that building a reform costs only its changes. Iteration goes through the keys
+    of the parent, then the new keys of this layer. Nothing is cached, so that changes of any layer (including the
+    replacement of an item of a plain parent mapping) are always seen.
+    """
+    own = None  # OrderedDict of the items added or replaced in this layer
+    parent = None  # Mapping of the items of the lower layers
+
+    def __init__(self, parent):
+        self.own = collections.OrderedDict()
+        self.parent = parent
+
+    def __contains__(self, key):
+        return key in self.own or key in self.parent
+
+    def __delitem__(self, key):
+        assert key in self.own, u'Items of a parent layer can\'t be deleted: {}'.format(key).encode('utf-8')
+        del self.own[key]
+
+    def __getitem__(self, key):
+        own = self.own
+        if key in own:
+            return own[key]
+        return self.parent[key]
+
+    def __iter__(self):
+        parent = self.parent
+        for key in parent:
+            yield key
+        for key in self.own:
+            if key not in parent:
+                yield key
+
+    def __len__(self):
+        parent = self.parent
+        return len(parent) + sum(1 for key in self.own if key not in parent)
+
+    def __repr__(self):
+        return '{}({!r}, {!r})'.format(self.__class__.__name__, self.parent, self.own)
+
+    def __setitem__(self, key, value):
+        self.own[key] = value
+
+    def copy(self):
+        return collections.OrderedDict(self.iteritems())
+
+    def iteritems(self):
+        own = self.own
+        parent = self.parent
+        for key, value in parent.iteritems():
+            yield key, own.get(key, value)
+        for key, value in own.iteritems():
+            if key not in parent:
+                yield key, value
+
+    def itervalues(self):
+        for key, value in self.iteritems():
+            yield value
+
+    def items(self):
+        return list(self.iteritems())
+
+    def values(self):
+        return list(self.itervalues())
+
 
 def clone_entity_class(entity_class):
     class ReformEntity(entity_class):
         pass
-    ReformEntity.column_by_name = entity_class.column_by_name.copy()
+    ReformEntity.column_by_name = LayeredOrderedDict(entity_class.column_by_name)
     return ReformEntity
 
 
@@ -69,9 +181,15 @@ def compose_reforms(build_reform_list, base_tax_benefit_system):
     return composed_reform
 
 
-def make_reform(decomposition_dir_name = None, decomposition_file_name = None, legislation_json = None, name = None,
-        new_formulas = None, reference = None):
-    """Return a Reform class inherited from AbstractReform."""
+def make_reform(decomposition_dir_name = None, decomposition_file_name = None, legislation_json = None,
+        legislation_patches = None, name = None, new_formulas = None, reference = None):
+    """Return a Reform class inherited from AbstractReform.
+
+    ``legislation_patches`` is a list of ``dict(path = ..., start = ..., stop = ..., value = ...)`` (or with a
+    ``period`` instead of ``start`` and ``stop``), where path is the same as in ``update_legislation()``. When given
+    without a ``legislation_json``, the compact legislations of the reform share every unpatched node with the ones of
+    the reference.
+    """
     assert isinstance(name, basestring)
     assert isinstance(reference, taxbenefitsystems.AbstractTaxBenefitSystem)
     reform_entity_class_by_key_plural = {
@@ -83,6 +201,7 @@ def make_reform(decomposition_dir_name = None, decomposition_file_name = None, l
         for entity_class in reform_entity_class_by_key_plural.itervalues()
         }
     reform_legislation_json = legislation_json
+    reform_legislation_patches = legislation_patches
     reform_name = name
     reform_reference = reference
 
@@ -91,6 +210,7 @@ def make_reform(decomposition_dir_name = None, decomposition_file_name = None, l
         DEFAULT_DECOMP_FILE = decomposition_file_name
         entity_class_by_key_plural = reform_entity_class_by_key_plural
         legislation_json = reform_legislation_json
+        legislation_patches = reform_legislation_patches
         name = reform_name
         reference = reform_reference
 
@@ -136,6 +256,46 @@ def find_item_at_date(items, date, nearest_in_period = None):
     return None
 
 
+def normalize_legislation_patches(legislation_patches):
+    """Return the legislation patches as a list of (path, start instant, stop instant, value) tuples."""
+    normalized_legislation_patches = []
+    for legislation_patch in legislation_patches:
+        if isinstance(legislation_patch, tuple):
+            normalized_legislation_patches.append(legislation_patch)
+            continue
+        period = legislation_patch.get('period')
+        if period is not None:
+            assert legislation_patch.get('start') is None and legislation_patch.get('stop') is None, \
+                u'period parameter can\'t be used with start and stop'
+            period = periods.period(period)
+            start = period.start
+            stop = period.stop
+        else:
+            start = legislation_patch.get('start')
+            stop = legislation_patch.get('stop')
+        assert start is not None and stop is not None, u'start and stop must be provided, or period'
+        value = legislation_patch.get('value')
+        assert value is not None
+        normalized_legislation_patches.append((tuple(legislation_patch['path']), periods.instant(start),
+            periods.instant(stop), value))
+    return normalized_legislation_patches
+
+
+def patch_compact_legislation(compact_legislation, legislation_patches, legislation_json = None):
+    """Return a compact legislation with the patches in effect at its instant.
+
+    Only the nodes (and tax scales) on the path of a patch are copied. The other ones are shared with the given compact
+    legislation, which is left unchanged. ``legislation_json`` is the legislation the compact legislation was compiled
+    from: it is required to patch the brackets of tax scales.
+    """
+    instant = compact_legislation.instant
+    return legislations.update_compact_legislation(compact_legislation, [
+        (path, value)
+        for path, start, stop, value in legislation_patches
+        if start <= instant <= stop
+        ], legislation_json = legislation_json)
+
+
 def update_legislation(legislation_json, path, period = None, value = None, start = None, stop = None):
     """
     This function is deprecated.
@@ -291,4 +451,13 @@ def updated_legislation_items(items, start_instant, stop_instant, value):
             # drop those
             continue
 
+    if not inserted:
+        # The period matches no existing item.
+        new_items.append(
+            collections.OrderedDict((
+                ('start', str(start_instant)),
+                ('stop', str(stop_instant)),
+                ('value', new_item['value']),
+                ))
+            )
     return sorted(new_items, key = lambda item: item['start'])
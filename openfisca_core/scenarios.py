@@ -30,7 +30,7 @@ import itertools
 
 import numpy as np
 
-from . import conv, periods, simulations
+from . import conv, periods, simulations, stepvectors
 
 
 N_ = lambda message: message
@@ -61,12 +61,36 @@ class AbstractScenario(object):
                     )
         return value, None
 
-    def fill_simulation(self, simulation, variables_name_to_skip = None):
+    def fill_simulation(self, simulation, output_variables_name = None, variables_name_to_skip = None):
+        """Give the inputs of the scenario to the holders of a simulation.
+
+        When ``output_variables_name`` is given, the inputs that these variables don't depend on (according to the
+        static dependency graph of the tax-benefit system) are neither converted nor stored. Every input is kept when a
+        formula needed by these variables has dependencies that are not known statically.
+        """
         assert isinstance(simulation, simulations.Simulation)
         if variables_name_to_skip is None:
             variables_name_to_skip = set()
         column_by_name = self.tax_benefit_system.column_by_name
         entity_by_key_plural = simulation.entity_by_key_plural
+        if output_variables_name is not None:
+            required_variables_name = simulation.tax_benefit_system.get_dependency_graph().get_required_variables(
+                output_variables_name)
+            # Note: required_variables_name is None when some dependencies are unknown, for example when a formula
+            # gives the simulation to a helper function.
+            if required_variables_name is not None:
+                # Note: The composition of entities is always needed.
+                required_variables_name = required_variables_name.union(
+                    variable_name
+                    for entity in entity_by_key_plural.itervalues()
+                    if not entity.is_persons_entity
+                    for variable_name in (entity.index_for_person_variable_name, entity.role_for_person_variable_name)
+                    )
+                variables_name_to_skip = set(variables_name_to_skip).union(
+                    variable_name
+                    for variable_name in column_by_name
+                    if variable_name not in required_variables_name
+                    )
         simulation_period = simulation.period
         test_case = self.test_case
 
@@ -81,11 +105,15 @@ class AbstractScenario(object):
             if self.input_variables is not None:
                 # Note: For set_input to work, handle days, before months, before years => use sorted().
                 for variable_name, array_by_period in sorted(self.input_variables.iteritems()):
+                    if variable_name in variables_name_to_skip:
+                        continue
                     holder = simulation.get_or_new_holder(variable_name)
                     entity = holder.entity
                     for period, array in array_by_period.iteritems():
                         if entity.count == 0:
                             entity.count = len(array)
+                        if simulation.optimize_memory:
+                            array = array.astype(holder.dtype, copy = False)
                         holder.set_input(period, array)
 
             if persons.count == 0:
@@ -97,12 +125,12 @@ class AbstractScenario(object):
                 index_holder = persons.get_or_new_holder(entity.index_for_person_variable_name)
                 index_array = index_holder.array
                 if index_array is None:
-                    index_holder.array = np.arange(persons.count, dtype = index_holder.column.dtype)
+                    index_holder.array = np.arange(persons.count, dtype = index_holder.dtype)
 
                 role_holder = persons.get_or_new_holder(entity.role_for_person_variable_name)
                 role_array = role_holder.array
                 if role_array is None:
-                    role_holder.array = np.zeros(persons.count, role_holder.column.dtype)
+                    role_holder.array = np.zeros(persons.count, role_holder.dtype)
                 entity.roles_count = 1
 
                 if entity.count == 0:
@@ -132,12 +160,12 @@ class AbstractScenario(object):
                 if entity.is_persons_entity:
                     continue
                 entity_step_size = entity.step_size
-                persons.get_or_new_holder(entity.index_for_person_variable_name).array = person_entity_id_array = \
-                    np.empty(steps_count * persons.step_size,
-                        dtype = column_by_name[entity.index_for_person_variable_name].dtype)
-                persons.get_or_new_holder(entity.role_for_person_variable_name).array = person_entity_role_array = \
-                    np.empty(steps_count * persons.step_size,
-                        dtype = column_by_name[entity.role_for_person_variable_name].dtype)
+                index_holder = persons.get_or_new_holder(entity.index_for_person_variable_name)
+                index_holder.array = person_entity_id_array = np.empty(steps_count * persons.step_size,
+                    dtype = index_holder.dtype)
+                role_holder = persons.get_or_new_holder(entity.role_for_person_variable_name)
+                role_holder.array = person_entity_role_array = np.empty(steps_count * persons.step_size,
+                    dtype = role_holder.dtype)
                 for member_index, member in enumerate(test_case[entity_key_plural]):
                     for person_role, person_id in entity.iter_member_persons_role_and_id(member):
                         person_index = person_index_by_id[person_id]
@@ -189,9 +217,9 @@ class AbstractScenario(object):
                                 for step_index in range(steps_count)
                                 for variable_value in variable_values
                                 )
-                            array = np.fromiter(variable_values_iter, dtype = column.dtype) \
-                                if column.dtype is not object \
-                                else np.array(list(variable_values_iter), dtype = column.dtype)
+                            array = np.fromiter(variable_values_iter, dtype = holder.dtype) \
+                                if holder.dtype is not object \
+                                else np.array(list(variable_values_iter), dtype = holder.dtype)
                             holder.set_input(variable_period, array)
 
             if self.axes is not None:
@@ -200,14 +228,21 @@ class AbstractScenario(object):
                     # All parallel axes have the same count, entity and period.
                     first_axis = parallel_axes[0]
                     axis_count = first_axis['count']
-                    axis_entity = simulation.entity_by_column_name[first_axis['name']]
-                    axis_period = first_axis['period'] or simulation_period
                     for axis in parallel_axes:
+                        if axis.get('name') is None:
+                            set_parameter_axis(simulation, axis, np.linspace(axis['min'], axis['max'], axis_count))
+                    first_axis = get_first_variable_axis(parallel_axes)
+                    if first_axis is not None:
+                        axis_entity = simulation.entity_by_column_name[first_axis['name']]
+                        axis_period = first_axis['period'] or simulation_period
+                    for axis in parallel_axes:
+                        if axis.get('name') is None:
+                            continue
                         holder = simulation.get_or_new_holder(axis['name'])
                         column = holder.column
                         array = holder.get_array(axis_period)
                         if array is None:
-                            array = np.empty(axis_entity.count, dtype = column.dtype)
+                            array = np.empty(axis_entity.count, dtype = holder.dtype)
                             array.fill(column.default)
                             holder.set_input(axis_period, array)
                         array[axis['index']:: axis_entity.step_size] = np.linspace(axis['min'], axis['max'], axis_count)
@@ -224,14 +259,22 @@ class AbstractScenario(object):
                         # All parallel axes have the same count, entity and period.
                         first_axis = parallel_axes[0]
                         axis_count = first_axis['count']
-                        axis_entity = simulation.entity_by_column_name[first_axis['name']]
-                        axis_period = first_axis['period'] or simulation_period
                         for axis in parallel_axes:
+                            if axis.get('name') is None:
+                                set_parameter_axis(simulation, axis, axis['min']
+                                    + mesh.reshape(steps_count) * (axis['max'] - axis['min']) / (axis_count - 1))
+                        first_axis = get_first_variable_axis(parallel_axes)
+                        if first_axis is not None:
+                            axis_entity = simulation.entity_by_column_name[first_axis['name']]
+                            axis_period = first_axis['period'] or simulation_period
+                        for axis in parallel_axes:
+                            if axis.get('name') is None:
+                                continue
                             holder = simulation.get_or_new_holder(axis['name'])
                             column = holder.column
                             array = holder.get_array(axis_period)
                             if array is None:
-                                array = np.empty(axis_entity.count, dtype = column.dtype)
+                                array = np.empty(axis_entity.count, dtype = holder.dtype)
                                 array.fill(column.default)
                                 holder.set_input(axis_period, array)
                             array[axis['index']:: axis_entity.step_size] = axis['min'] \
@@ -295,21 +338,26 @@ class AbstractScenario(object):
                 for parallel_axes_index, parallel_axes in enumerate(data['axes']):
                     first_axis = parallel_axes[0]
                     axis_count = first_axis['count']
-                    axis_entity_key_plural = column_by_name[first_axis['name']].entity_key_plural
-                    axis_period = first_axis['period']
+                    # Parameter axes have neither entity nor period: compare variable axes to the first one.
+                    first_variable_axis = get_first_variable_axis(parallel_axes)
+                    if first_variable_axis is not None:
+                        axis_entity_key_plural = column_by_name[first_variable_axis['name']].entity_key_plural
+                        axis_period = first_variable_axis['period']
                     for axis_index, axis in enumerate(parallel_axes):
                         if axis['min'] >= axis['max']:
                             errors.setdefault('axes', {}).setdefault(parallel_axes_index, {}).setdefault(
                                 axis_index, {})['max'] = state._(u"Max value must be greater than min value")
+                        if axis_index > 0 and axis['count'] != axis_count:
+                            errors.setdefault('axes', {}).setdefault(parallel_axes_index, {}).setdefault(
+                                axis_index, {})['count'] = state._(u"Parallel indexes must have the same count")
+                        if axis['name'] is None:
+                            continue
                         column = column_by_name[axis['name']]
                         if axis['index'] >= len(data['test_case'][column.entity_key_plural]):
                             errors.setdefault('axes', {}).setdefault(parallel_axes_index, {}).setdefault(
                                 axis_index, {})['index'] = state._(u"Index must be lower than {}").format(
                                     len(data['test_case'][column.entity_key_plural]))
-                        if axis_index > 0:
-                            if axis['count'] != axis_count:
-                                errors.setdefault('axes', {}).setdefault(parallel_axes_index, {}).setdefault(
-                                    axis_index, {})['count'] = state._(u"Parallel indexes must have the same count")
+                        if axis is not first_variable_axis:
                             if column.entity_key_plural != axis_entity_key_plural:
                                 errors.setdefault('axes', {}).setdefault(parallel_axes_index, {}).setdefault(
                                     axis_index, {})['period'] = state._(
@@ -341,7 +389,12 @@ class AbstractScenario(object):
                 value = value, state = state or conv.default_state)
         return json_to_instance
 
-    def new_simulation(self, debug = False, debug_all = False, reference = False, trace = False):
+    def new_simulation(self, debug = False, debug_all = False, optimize_memory = False, output_variables_name = None,
+            profile = False, reference = False, structured_trace = False, trace = False):
+        """Create a simulation of the scenario.
+
+        When ``output_variables_name`` is given, only the inputs needed to compute these variables are filled.
+        """
         assert isinstance(reference, (bool, int)), \
             'Parameter reference must be a boolean. When True, the reference tax-benefit system is used.'
         tax_benefit_system = self.tax_benefit_system
@@ -354,11 +407,14 @@ class AbstractScenario(object):
         simulation = simulations.Simulation(
             debug = debug,
             debug_all = debug_all,
+            optimize_memory = optimize_memory,
             period = self.period,
+            profile = profile,
+            structured_trace = structured_trace,
             tax_benefit_system = tax_benefit_system,
             trace = trace,
             )
-        self.fill_simulation(simulation)
+        self.fill_simulation(simulation, output_variables_name = output_variables_name)
         return simulation
 
     def to_json(self):
@@ -393,6 +449,48 @@ def extract_output_variables_name_to_ignore(output_variables_name_to_ignore):
     return extract_output_variables_name_to_ignore_converter
 
 
+def get_first_variable_axis(parallel_axes):
+    """Return the first axis varying a variable (not a legislation parameter), or None."""
+    for axis in parallel_axes:
+        if axis.get('name') is not None:
+            return axis
+    return None
+
+
+def get_parameter_json_path(parameter):
+    """Convert the dotted path of a parameter axis to a JSON path of the legislation.
+
+    >>> get_parameter_json_path(u'ir.bareme.brackets.2.threshold')
+    ('children', u'ir', 'children', u'bareme', 'brackets', 2, u'threshold')
+    """
+    path = []
+    fragments = parameter.split(u'.')
+    for index, fragment in enumerate(fragments):
+        if fragment == u'brackets':
+            assert len(fragments) == index + 3, u'Invalid parameter path: {}'.format(parameter).encode('utf-8')
+            path.extend(['brackets', int(fragments[index + 1]), fragments[index + 2]])
+            break
+        path.extend(['children', fragment])
+    return tuple(path)
+
+
+def is_parameter_axis_valid(legislation_json, parameter):
+    """Return True when the dotted path of a parameter axis is a parameter or an item of a bracket of a legislation."""
+    if legislation_json is None:
+        return False
+    node_json = legislation_json
+    fragments = parameter.split(u'.')
+    for index, fragment in enumerate(fragments):
+        if node_json.get('@type') == u'Scale':
+            return fragment == u'brackets' and len(fragments) == index + 3 and fragments[index + 1].isdigit() \
+                and int(fragments[index + 1]) < len(node_json.get('brackets') or []) \
+                and fragments[index + 2] in (u'amount', u'base', u'rate', u'threshold')
+        node_json = (node_json.get('children') or {}).get(fragment)
+        if node_json is None:
+            return False
+    return node_json.get('@type') == u'Parameter'
+
+
 def make_json_or_python_to_array_by_period_by_variable_name(tax_benefit_system, period):
     def json_or_python_to_array_by_period_by_variable_name(value, state = None):
         if value is None:
@@ -415,6 +513,7 @@ def make_json_or_python_to_array_by_period_by_variable_name(tax_benefit_system,
 
 def make_json_or_python_to_axes(tax_benefit_system):
     column_by_name = tax_benefit_system.column_by_name
+    legislation_json = tax_benefit_system.legislation_json
     return conv.pipe(
         conv.test_isinstance(list),
         conv.uniform_sequence(
@@ -448,12 +547,21 @@ def make_json_or_python_to_axes(tax_benefit_system):
                                     conv.test(lambda column_name: column_by_name[column_name].dtype in (
                                         np.float32, np.int16, np.int32),
                                         error = N_(u'Invalid type for axe: integer or float expected')),
-                                    conv.not_none,
+                                    ),
+                                # Dotted path of a legislation parameter (like "ir.taux") or of a bracket of a tax
+                                # scale (like "ir.bareme.brackets.2.threshold"), to vary instead of a variable
+                                parameter = conv.pipe(
+                                    conv.test_isinstance(basestring),
+                                    conv.cleanup_line,
+                                    conv.test(lambda parameter: is_parameter_axis_valid(legislation_json, parameter),
+                                        error = N_(u'Unknown legislation parameter')),
                                     ),
                                 # TODO: Check that period is valid in params.
                                 period = periods.json_or_python_to_period,
                                 ),
                             ),
+                        conv.test(lambda axis: (axis['name'] is None) != (axis['parameter'] is None),
+                            error = N_(u'An axis must have either a name or a parameter')),
                         ),
                     drop_none_items = True,
                     ),
@@ -659,3 +767,10 @@ def set_entities_json_id(entities_json):
         if 'id' not in entity_json:
             entity_json['id'] = index
     return entities_json
+
+
+def set_parameter_axis(simulation, axis, values):
+    """Replace the legislation parameter of an axis with a step vector of its values in the simulation."""
+    if simulation.parameter_vector_by_path is None:
+        simulation.parameter_vector_by_path = {}
+    simulation.parameter_vector_by_path[get_parameter_json_path(axis['parameter'])] = stepvectors.StepVector(values)
@@ -0,0 +1,518 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+# OpenFisca -- A versatile microsimulation software
+# By: OpenFisca Team <contact@openfisca.fr>
+#
+# Copyright (C) 2011, 2012, 2013, 2014, 2015 OpenFisca Team
+# https://github.com/openfisca
+#
+# This file is part of OpenFisca.
+#
+# OpenFisca is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# OpenFisca is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""Benchmark the core operations of OpenFisca on synthetic data, and compare timings to a saved baseline.
+
+Benchmarks run offline. Each benchmark is run for several sizes (number of persons, of parameters, etc) and its best
+and median durations are written in JSON, so that they can be compared to a baseline saved by a previous run.
+Benchmarks measuring memory also write the bytes of the arrays they build, in total and by dtype.
+"""
+
+
+import argparse
+import collections
+import itertools
+import json
+import logging
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import timeit
+
+import numpy as np
+
+from openfisca_core import (calmar, columns, conv, decompositions, formulas, legislations, legislationsxml, periods,
+    sweeps, synthetics, taxscales)
+
+
+app_name = os.path.splitext(os.path.basename(__file__))[0]
+benchmark_by_name = collections.OrderedDict()
+log = logging.getLogger(app_name)
+persons_counts = [1000, 100000, 10000000]
+tax_benefit_system_by_arguments = {}
+year = 2013
+
+
+class Timer(object):
+    """Context manager measuring the duration of the code that must be benchmarked, excluding its setup"""
+    duration = None
+    nbytes_by_dtype = None  # Bytes of the arrays built by the benchmark, set by the benchmarks measuring memory
+    start = None
+
+    def __enter__(self):
+        self.start = timeit.default_timer()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.duration = timeit.default_timer() - self.start
+
+
+def benchmark(**values_by_parameter_name):
+    """Decorator registering a benchmark function, to run with every combination of the given parameters values.
+
+    A benchmark function receives a Timer and must use it (as a context manager) around the code to measure.
+    """
+    def register_benchmark(function):
+        parameters_name = sorted(values_by_parameter_name)
+        for values in itertools.product(*(values_by_parameter_name[name] for name in parameters_name)):
+            kwargs = collections.OrderedDict(zip(parameters_name, values))
+            name = '{}[{}]'.format(function.__name__, ','.join(
+                '{}={}'.format(parameter_name, value)
+                for parameter_name, value in kwargs.iteritems()
+                )) if kwargs else function.__name__
+            benchmark_by_name[name] = (function, kwargs)
+        return function
+
+    return register_benchmark
+
+
+def get_simulation_nbytes_by_dtype(simulation):
+    """Return the bytes of the arrays stored in the holders of a simulation, by dtype."""
+    nbytes_by_dtype = collections.Counter()
+    for entity in simulation.entity_by_key_plural.itervalues():
+        for holder in entity.holder_by_name.itervalues():
+            arrays = [] if holder._array is None else [holder._array]
+            if holder._array_by_period is not None:
+                arrays.extend(holder._array_by_period.itervalues())
+            for array in arrays:
+                nbytes_by_dtype[array.dtype.name] += array.nbytes
+    return dict(nbytes_by_dtype)
+
+
+def get_tax_benefit_system(**kwargs):
+    key = tuple(sorted(kwargs.iteritems()))
+    tax_benefit_system = tax_benefit_system_by_arguments.get(key)
+    if tax_benefit_system is None:
+        tax_benefit_system_by_arguments[key] = tax_benefit_system = synthetics.new_tax_benefit_system(**kwargs)
+    return tax_benefit_system
+
+
+# Benchmarks
+
+
+@benchmark(persons_count = persons_counts)
+def axes_expansion(timer, persons_count):
+    tax_benefit_system = get_tax_benefit_system()
+    scenario = tax_benefit_system.new_scenario()
+    scenario.axes = [[dict(count = persons_count // 2, index = 0, max = 100000, min = 0, name = 'input_0',
+        period = None)]]
+    scenario.period = periods.period(year)
+    scenario.test_case = dict(
+        familles = [dict(id = 0, parents = [0, 1])],
+        individus = [dict(id = 0), dict(id = 1)],
+        )
+    with timer:
+        scenario.new_simulation()
+
+
+@benchmark(observations_count = [10000, 100000, 1000000])
+def calibration(timer, observations_count):
+    random_state = np.random.RandomState(0)
+    data = dict(
+        age = random_state.randint(0, 100, observations_count),
+        region = random_state.randint(0, 20, observations_count),
+        salaire = random_state.uniform(0, 50000, observations_count),
+        wprm_init = random_state.uniform(0.5, 1.5, observations_count),
+        )
+    margins = dict(
+        age = dict((age, float((data['age'] == age).sum()) * 1.01) for age in range(100)),
+        region = dict((region, float((data['region'] == region).sum()) * 1.01) for region in range(20)),
+        salaire = data['salaire'].sum() * 1.05,
+        )
+    margins['total_population'] = sum(margins['age'].itervalues())
+    with timer:
+        calmar.calmar(data, margins, parameters = dict(lo = 0.5, method = 'logit', solver = 'newton', up = 2,
+            use_proportions = True))
+
+
+@benchmark(calls_count = [10000, 100000], debug = [False, True])
+def compute_call_overhead(timer, calls_count, debug):
+    # Variables are already computed: only the cost of the calls remains.
+    tax_benefit_system = get_tax_benefit_system()
+    simulation = synthetics.new_simulation(tax_benefit_system, debug = debug, persons_count = 10, period = year)
+    names = tax_benefit_system.output_variables_name
+    for name in names:
+        simulation.calculate(name)
+    period = periods.period(year)
+    with timer:
+        for index in range(calls_count // len(names)):
+            for name in names:
+                simulation.compute(name, period)
+
+
+@benchmark(persons_count = persons_counts)
+def compute_add(timer, persons_count):
+    tax_benefit_system = get_tax_benefit_system()
+    simulation = synthetics.new_simulation(tax_benefit_system, persons_count = persons_count, period = year)
+    period = periods.period('month:{}-01:12'.format(year))
+    with timer:
+        for name in tax_benefit_system.output_variables_name:
+            simulation.compute_add(name, period)
+
+
+@benchmark(persons_count = [1000, 100000])
+def date_parsing(timer, persons_count):
+    # Birth dates of a survey, given as ISO 8601 strings.
+    random_state = np.random.RandomState(0)
+    births_str = [
+        unicode(birth)
+        for birth in (np.datetime64('1920-01-01') + random_state.randint(30000, size = persons_count)).tolist()
+        ]
+    json_to_array_by_period = columns.DateCol().make_json_to_array_by_period(periods.period(year))
+    with timer:
+        conv.check(json_to_array_by_period)(births_str)
+
+
+@benchmark(versions_count = [2, 30])
+def dated_formula_dispatch(timer, versions_count):
+    # A legislative variable with a dated version by year, requested for every month of these years.
+    start_instant = periods.instant(year - versions_count + 1)
+    formula_class = type('dated_formula', (formulas.DatedFormula,), dict(dated_formulas_class = [
+        dict(
+            formula_class = formulas.SimpleFormula,
+            start_instant = start_instant.offset(index, u'year'),
+            stop_instant = start_instant.offset(index + 1, u'year').offset(-1, u'day'),
+            )
+        for index in range(versions_count)
+        ]))
+    instants = [
+        start_instant.offset(index, u'month')
+        for index in range(12 * versions_count)
+        ] * (10000 // (12 * versions_count) + 1)
+    with timer:
+        for instant in instants:
+            formula_class.at_instant(instant)
+
+
+@benchmark(steps_count = [10, 1000])
+def decomposition_calculation(timer, steps_count):
+    # Leaves are the 100 variables of the tax-benefit system (for 2 persons), grouped into a tree of 3 levels.
+    tax_benefit_system = get_tax_benefit_system(variables_count = 100)
+    scenario = tax_benefit_system.new_scenario()
+    scenario.axes = [[dict(count = steps_count, index = 0, max = 100000, min = 0, name = 'input_0', period = None)]]
+    scenario.period = periods.period(year)
+    scenario.test_case = dict(
+        familles = [dict(id = 0, parents = [0, 1])],
+        individus = [dict(id = 0), dict(id = 1)],
+        )
+    simulation = scenario.new_simulation()
+    variables_name = [
+        name
+        for name, column in tax_benefit_system.column_by_name.iteritems()
+        if column.entity_key_plural == 'individus' and name.startswith('variable_')
+        ]
+    decomposition_json = [
+        dict(code = 'group_{}'.format(group_index), children = [
+            dict(code = 'group_{}_{}'.format(group_index, sub_group_index), children = [
+                dict(code = name)
+                for name in variables_name[group_index * 20 + sub_group_index * 5:][:5]
+                ])
+            for sub_group_index in range(4)
+            ])
+        for group_index in range(len(variables_name) // 20)
+        ]
+    with timer:
+        decompositions.calculate([simulation], decomposition_json)
+
+
+@benchmark(persons_count = persons_counts)
+def entity_projections(timer, persons_count):
+    # Every formula is a projection of a variable of the other entity.
+    tax_benefit_system = get_tax_benefit_system(families_share = 0.5, projections_share = 1)
+    simulation = synthetics.new_simulation(tax_benefit_system, persons_count = persons_count, period = year)
+    with timer:
+        for name in tax_benefit_system.output_variables_name:
+            simulation.calculate(name)
+
+
+@benchmark(depth = [2, 10, 50], persons_count = persons_counts)
+def formula_evaluation(timer, depth, persons_count):
+    tax_benefit_system = get_tax_benefit_system(depth = depth)
+    simulation = synthetics.new_simulation(tax_benefit_system, persons_count = persons_count, period = year)
+    with timer:
+        for name in tax_benefit_system.output_variables_name:
+            simulation.calculate(name)
+
+
+@benchmark(debug = [False, True], simulations_count = [10, 100])
+def formula_call_overhead(timer, debug, simulations_count):
+    # Arrays are tiny, so that only the Python overhead of each call to a formula remains.
+    tax_benefit_system = get_tax_benefit_system()
+    simulation = synthetics.new_simulation(tax_benefit_system, debug = debug, persons_count = 10, period = year)
+    simulations = [
+        simulation.clone(debug = debug)
+        for index in range(simulations_count)
+        ]
+    with timer:
+        for simulation in simulations:
+            for name in tax_benefit_system.output_variables_name:
+                simulation.calculate(name)
+
+
+@benchmark(variables_count = [100, 1000])
+def holder_lookup(timer, variables_count):
+    # Each variable is requested a first time, creating its holder, and then 9 more times.
+    tax_benefit_system = get_tax_benefit_system(variables_count = variables_count)
+    simulation = synthetics.new_simulation(tax_benefit_system, persons_count = 10, period = year)
+    names = tax_benefit_system.column_by_name.keys()
+    period = periods.period(year)
+    with timer:
+        for index in range(10):
+            for name in names:
+                simulation.get_or_new_holder(name).at_period(period)
+
+
+@benchmark(parameters_count = [100, 1000, 10000])
+def legislation_compaction(timer, parameters_count):
+    legislation_json = get_tax_benefit_system(parameters_count = parameters_count).legislation_json
+    instant = periods.instant(year)
+    with timer:
+        dated_legislation_json = legislations.generate_dated_legislation_json(legislation_json, instant)
+        legislations.compact_dated_node_json(dated_legislation_json)
+
+
+@benchmark(periods_count = [1000, 10000])
+def period_arithmetic(timer, periods_count):
+    # Offsets, stops, lengths and intersections of periods of every unit, starting on every day of a few years.
+    start_instant = periods.instant(year)
+    periods_list = [
+        periods.period(unit, start_instant.offset(index, u'day'), index % 3 + 1)
+        for index in range(periods_count)
+        for unit in (u'day', u'month', u'year')
+        ]
+    with timer:
+        for period in periods_list:
+            period.offset(1)
+            period.offset(-1, u'month')
+            period.stop
+            period.days
+            period.intersection(start_instant, period.stop)
+
+
+@benchmark(calls_count = [10000, 100000])
+def period_parsing(timer, calls_count):
+    # Strings requested by formulas: a few distinct values, parsed again and again.
+    values = [
+        value
+        for month in range(1, 13)
+        for value in (
+            u'{}'.format(year),
+            u'{}-{:02d}'.format(year, month),
+            u'{}-{:02d}-01'.format(year, month),
+            u'month:{}-{:02d}:3'.format(year, month),
+            u'year:{}-{:02d}'.format(year, month),
+            )
+        ]
+    values = (values * (calls_count // len(values) + 1))[:calls_count]
+    instants_str = [
+        value.split(u':')[1] if value.startswith((u'month', u'year')) else value
+        for value in values
+        ]
+    with timer:
+        for value in values:
+            periods.period(value)
+        for instant_str in instants_str:
+            periods.instant(instant_str)
+
+
+@benchmark(processes_count = [1, 4], variants_count = [16])
+def reform_sweep(timer, processes_count, variants_count):
+    # Each variant scales a parameter used by a few formulas.
+    tax_benefit_system = get_tax_benefit_system()
+    simulation = synthetics.new_simulation(tax_benefit_system, persons_count = 10000, period = year)
+    legislation_patches_by_variant = [
+        [dict(
+            path = ('children', 'synthetic', 'children', 'taux_{}'.format(variant_index % 10), 'values'),
+            period = year,
+            value = 0.01 * variant_index,
+            )]
+        for variant_index in range(variants_count)
+        ]
+    with timer:
+        sweeps.run_sweep(simulation, legislation_patches_by_variant, tax_benefit_system.output_variables_name,
+            processes_count = processes_count)
+
+
+@benchmark(persons_count = [1000, 100000])
+def simulation_clone(timer, persons_count):
+    tax_benefit_system = get_tax_benefit_system()
+    simulation = synthetics.new_simulation(tax_benefit_system, persons_count = persons_count, period = year)
+    for name in tax_benefit_system.output_variables_name:
+        simulation.calculate(name)
+    with timer:
+        simulation.clone()
+
+
+@benchmark(optimize_memory = [False, True], persons_count = [1000, 100000])
+def simulation_memory(timer, optimize_memory, persons_count):
+    """Measure the memory of the variables computed by a synthetic system.
+
+    Its formulas are FloatCol, already stored in float32: optimize_memory narrows only the roles, saving about 0.2%.
+    """
+    tax_benefit_system = get_tax_benefit_system()
+    simulation = synthetics.new_simulation(tax_benefit_system, optimize_memory = optimize_memory,
+        persons_count = persons_count, period = year)
+    with timer:
+        for name in tax_benefit_system.output_variables_name:
+            simulation.calculate(name)
+    timer.nbytes_by_dtype = get_simulation_nbytes_by_dtype(simulation)
+
+
+@benchmark(optimize_memory = [False, True], persons_count = [1000, 100000])
+def survey_memory(timer, optimize_memory, persons_count):
+    """Measure the memory of survey inputs, mostly roles, ages and enumerations.
+
+    Here, narrowed columns dominate: optimize_memory stores roles in int8 instead of int32, ages in int16 instead of
+    int32 and enumerations in int8 instead of int16, saving about 25% of the inputs.
+    """
+    tax_benefit_system = get_tax_benefit_system(categorical_inputs_count = 100)
+    with timer:
+        simulation = synthetics.new_simulation(tax_benefit_system, optimize_memory = optimize_memory,
+            persons_count = persons_count, period = year)
+    timer.nbytes_by_dtype = get_simulation_nbytes_by_dtype(simulation)
+
+
+@benchmark(values_count = persons_counts)
+def tax_scale_calc(timer, values_count):
+    tax_scale = taxscales.MarginalRateTaxScale()
+    for bracket_index in range(10):
+        tax_scale.add_bracket(10000 * bracket_index, 0.05 * bracket_index)
+    base = np.random.RandomState(0).uniform(0, 150000, values_count).astype(np.float32)
+    with timer:
+        tax_scale.calc(base)
+
+
+@benchmark(parameters_count = [100, 1000, 10000])
+def xml_legislation_load(timer, parameters_count):
+    directory = tempfile.mkdtemp()
+    try:
+        file_path = os.path.join(directory, 'legislation.xml')
+        with open(file_path, 'w') as xml_file:
+            xml_file.write(synthetics.new_legislation_xml(parameters_count = parameters_count).encode('utf-8'))
+        with timer:
+            conv.check(legislationsxml.xml_legislation_file_path_to_json)(file_path)
+    finally:
+        shutil.rmtree(directory)
+
+
+# Runner
+
+
+def compare(results_json, baseline_json, threshold):
+    """Print the ratio of each timing to its baseline and return the names of the benchmarks that regressed."""
+    regressions_name = []
+    baseline_by_name = baseline_json['benchmarks']
+    for name, result_json in results_json['benchmarks'].iteritems():
+        baseline = baseline_by_name.get(name)
+        if baseline is None:
+            print '{:<60} {:>10.6f} s  (no baseline)'.format(name, result_json['best'])
+            continue
+        ratio = result_json['best'] / baseline['best'] if baseline['best'] > 0 else float('inf')
+        if ratio > threshold:
+            regressions_name.append(name)
+        print '{:<60} {:>10.6f} s  {:>10.6f} s  x{:.2f}{}'.format(name, baseline['best'], result_json['best'], ratio,
+            '  REGRESSION' if ratio > threshold else '')
+    return regressions_name
+
+
+def run_benchmark(name, repeat):
+    function, kwargs = benchmark_by_name[name]
+    durations = []
+    nbytes_by_dtype = None
+    for index in range(repeat):
+        timer = Timer()
+        function(timer, **kwargs)
+        assert timer.duration is not None, 'Benchmark {} did not use its timer'.format(name)
+        durations.append(timer.duration)
+        if timer.nbytes_by_dtype is not None:
+            nbytes_by_dtype = timer.nbytes_by_dtype
+    result_json = collections.OrderedDict((
+        ('best', min(durations)),
+        ('median', float(np.median(durations))),
+        ('repeat', repeat),
+        ))
+    if nbytes_by_dtype is not None:
+        result_json['nbytes'] = sum(nbytes_by_dtype.itervalues())
+        result_json['nbytes_by_dtype'] = collections.OrderedDict(sorted(nbytes_by_dtype.iteritems()))
+    return result_json
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__)
+    parser.add_argument('-c', '--compare', help = 'path of a JSON file of baseline timings to compare with')
+    parser.add_argument('-k', '--keyword', action = 'append', default = [],
+        help = 'run only the benchmarks whose name contains this keyword (may be repeated)')
+    parser.add_argument('-l', '--list', action = 'store_true', default = False, help = 'list benchmarks and exit')
+    parser.add_argument('-m', '--max-size', default = 100000, type = int,
+        help = 'skip benchmarks whose sizes (persons, values, observations...) exceed this number (default: 100000)')
+    parser.add_argument('-o', '--output', help = 'path of the JSON file where timings are written')
+    parser.add_argument('-r', '--repeat', default = 3, type = int, help = 'number of runs of each benchmark')
+    parser.add_argument('-t', '--threshold', default = 1.2, type = float,
+        help = 'ratio to baseline above which a timing is reported as a regression (default: 1.2)')
+    parser.add_argument('-v', '--verbose', action = 'store_true', default = False, help = "increase output verbosity")
+    args = parser.parse_args()
+    logging.basicConfig(level = logging.DEBUG if args.verbose else logging.WARNING, stream = sys.stdout)
+
+    names = [
+        name
+        for name, (function, kwargs) in benchmark_by_name.iteritems()
+        if (not args.keyword or any(keyword in name for keyword in args.keyword))
+        and all(value <= args.max_size for key, value in kwargs.iteritems() if key.endswith('_count'))
+        ]
+    if args.list:
+        for name in names:
+            print name
+        return 0
+
+    results_json = collections.OrderedDict((
+        ('numpy', np.__version__),
+        ('python', platform.python_version()),
+        ('benchmarks', collections.OrderedDict()),
+        ))
+    for name in names:
+        log.info(u'Running benchmark {}'.format(name))
+        results_json['benchmarks'][name] = result_json = run_benchmark(name, args.repeat)
+        if args.compare is None:
+            print '{:<60} {:>10.6f} s{}'.format(name, result_json['best'],
+                '  {:>10.3f} MB ({})'.format(result_json['nbytes'] / 1e6, ', '.join(
+                    '{}: {:.3f} MB'.format(dtype, nbytes / 1e6)
+                    for dtype, nbytes in result_json['nbytes_by_dtype'].iteritems()
+                    )) if 'nbytes' in result_json else '')
+    if args.output is not None:
+        with open(args.output, 'w') as output_file:
+            json.dump(results_json, output_file, indent = 2)
+    if args.compare is not None:
+        with open(args.compare) as baseline_file:
+            baseline_json = json.load(baseline_file)
+        if compare(results_json, baseline_json, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -25,10 +25,22 @@
 
 import collections
 
-from . import periods
+import numpy as np
+
+from . import legislations, periods, profilers, tracers
 from .tools import empty_clone, stringify_array
 
 
+# Methods replaced by their fast version in simulations that are neither debugged nor traced
+fast_method_name_by_method_name = dict(
+    compute = 'fast_compute',
+    compute_add = 'fast_compute_add',
+    compute_add_divide = 'fast_compute_add_divide',
+    compute_divide = 'fast_compute_divide',
+    get_array = 'fast_get_array',
+    )
+
+
 class Simulation(object):
     compact_legislation_by_instant_cache = None
     debug = False
@@ -36,8 +48,12 @@ class Simulation(object):
     entity_by_column_name = None
     entity_by_key_plural = None
     entity_by_key_singular = None
+    holder_by_column_name = None  # Flat index of the holders of every entity, filled lazily
+    optimize_memory = False  # When True, holders store their arrays in compact dtypes (see get_dtype())
+    parameter_vector_by_path = None  # Step vectors replacing legislation parameters (by JSON path), for parameter axes
     period = None
     persons = None
+    profiler = None  # When not None, a profilers.Profiler (or a tracers.Tracer) notified of formulas computations
     reference_compact_legislation_by_instant_cache = None
     stack_trace = None
     steps_count = 1
@@ -45,7 +61,8 @@ class Simulation(object):
     trace = False
     traceback = None
 
-    def __init__(self, debug = False, debug_all = False, period = None, tax_benefit_system = None, trace = False):
+    def __init__(self, debug = False, debug_all = False, optimize_memory = False, period = None, profile = False,
+            structured_trace = False, tax_benefit_system = None, trace = False):
         assert isinstance(period, periods.Period)
         self.period = period
         if debug:
@@ -53,6 +70,12 @@ class Simulation(object):
         if debug_all:
             assert debug
             self.debug_all = True
+        if optimize_memory:
+            self.optimize_memory = True
+        if structured_trace:
+            self.profiler = tracers.Tracer()
+        elif profile:
+            self.profiler = profilers.Profiler()
         assert tax_benefit_system is not None
         self.tax_benefit_system = tax_benefit_system
         if trace:
@@ -60,9 +83,11 @@ class Simulation(object):
         if debug or trace:
             self.stack_trace = collections.deque()
             self.traceback = collections.OrderedDict()
+        self.select_evaluation_methods()
 
         # Note: Since simulations are short-lived and must be fast, don't use weakrefs for cache.
         self.compact_legislation_by_instant_cache = {}
+        self.holder_by_column_name = {}
         self.reference_compact_legislation_by_instant_cache = {}
 
         entity_class_by_key_plural = tax_benefit_system.entity_class_by_key_plural
@@ -102,30 +127,48 @@ class Simulation(object):
         return self.compute_add_divide(column_name, period = period,
             requested_formulas_by_period = requested_formulas_by_period).array
 
+    def calculate_age(self, column_name, period = None, unit = u'year', requested_formulas_by_period = None):
+        """Return the ages (in completed years or months) at the start of period of the dates of a variable."""
+        if period is None:
+            period = self.period
+        elif not isinstance(period, periods.Period):
+            period = periods.period(period)
+        if (self.debug or self.trace) and self.stack_trace:
+            self.record_input_variable(column_name, period)
+        return self.get_or_new_holder(column_name).calculate_age(period = period, unit = unit,
+            requested_formulas_by_period = requested_formulas_by_period)
+
     def calculate_divide(self, column_name, period = None, requested_formulas_by_period = None):
         if period is None:
             period = self.period
         return self.compute_divide(column_name, period = period,
             requested_formulas_by_period = requested_formulas_by_period).array
 
-    def clone(self, debug = False, debug_all = False, trace = False):
+    def clone(self, debug = False, debug_all = False, profile = False, structured_trace = False, trace = False):
         """Copy the simulation just enough to be able to run the copy without modifying the original simulation."""
         new = empty_clone(self)
         new_dict = new.__dict__
 
         for key, value in self.__dict__.iteritems():
-            if key not in ('debug', 'debug_all', 'entity_by_key_plural', 'persons', 'trace'):
+            if key not in ('debug', 'debug_all', 'entity_by_key_plural', 'holder_by_column_name', 'persons', 'profiler',
+                    'trace') \
+                    and key not in fast_method_name_by_method_name:
                 new_dict[key] = value
 
         if debug:
             new_dict['debug'] = True
         if debug_all:
             new_dict['debug_all'] = True
+        if structured_trace:
+            new_dict['profiler'] = tracers.Tracer()
+        elif profile:
+            new_dict['profiler'] = profilers.Profiler()
         if trace:
             new_dict['trace'] = True
         if debug or trace:
             new_dict['stack_trace'] = collections.deque()
             new_dict['traceback'] = collections.OrderedDict()
+        new.select_evaluation_methods()
 
         new_dict['entity_by_key_plural'] = entity_by_key_plural = dict(
             (key_plural, entity.clone(simulation = new))
@@ -140,6 +183,7 @@ class Simulation(object):
             (entity.key_singular, entity)
             for entity in entity_by_key_plural.itervalues()
             )
+        new_dict['holder_by_column_name'] = {}
         for entity in entity_by_key_plural.itervalues():
             if entity.is_persons_entity:
                 new_dict['persons'] = entity
@@ -153,11 +197,7 @@ class Simulation(object):
         elif not isinstance(period, periods.Period):
             period = periods.period(period)
         if (self.debug or self.trace) and self.stack_trace:
-            variable_infos = (column_name, period)
-            calling_frame = self.stack_trace[-1]
-            caller_input_variables_infos = calling_frame['input_variables_infos']
-            if variable_infos not in caller_input_variables_infos:
-                caller_input_variables_infos.append(variable_infos)
+            self.record_input_variable(column_name, period)
         return self.entity_by_column_name[column_name].compute(column_name, period = period,
             accept_other_period = accept_other_period, requested_formulas_by_period = requested_formulas_by_period)
 
@@ -167,11 +207,7 @@ class Simulation(object):
         elif not isinstance(period, periods.Period):
             period = periods.period(period)
         if (self.debug or self.trace) and self.stack_trace:
-            variable_infos = (column_name, period)
-            calling_frame = self.stack_trace[-1]
-            caller_input_variables_infos = calling_frame['input_variables_infos']
-            if variable_infos not in caller_input_variables_infos:
-                caller_input_variables_infos.append(variable_infos)
+            self.record_input_variable(column_name, period)
         return self.entity_by_column_name[column_name].compute_add(column_name, period = period,
             requested_formulas_by_period = requested_formulas_by_period)
 
@@ -181,11 +217,7 @@ class Simulation(object):
         elif not isinstance(period, periods.Period):
             period = periods.period(period)
         if (self.debug or self.trace) and self.stack_trace:
-            variable_infos = (column_name, period)
-            calling_frame = self.stack_trace[-1]
-            caller_input_variables_infos = calling_frame['input_variables_infos']
-            if variable_infos not in caller_input_variables_infos:
-                caller_input_variables_infos.append(variable_infos)
+            self.record_input_variable(column_name, period)
         return self.entity_by_column_name[column_name].compute_add_divide(column_name, period = period,
             requested_formulas_by_period = requested_formulas_by_period)
 
@@ -195,34 +227,102 @@ class Simulation(object):
         elif not isinstance(period, periods.Period):
             period = periods.period(period)
         if (self.debug or self.trace) and self.stack_trace:
-            variable_infos = (column_name, period)
-            calling_frame = self.stack_trace[-1]
-            caller_input_variables_infos = calling_frame['input_variables_infos']
-            if variable_infos not in caller_input_variables_infos:
-                caller_input_variables_infos.append(variable_infos)
+            self.record_input_variable(column_name, period)
         return self.entity_by_column_name[column_name].compute_divide(column_name, period = period,
             requested_formulas_by_period = requested_formulas_by_period)
 
+    def fast_compute(self, column_name, period = None, accept_other_period = False,
+            requested_formulas_by_period = None):
+        if period is None:
+            period = self.period
+        elif not isinstance(period, periods.Period):
+            period = periods.period(period)
+        holder = self.holder_by_column_name.get(column_name)
+        if holder is None:
+            holder = self.get_or_new_holder(column_name)
+        return holder.compute(period = period, accept_other_period = accept_other_period,
+            requested_formulas_by_period = requested_formulas_by_period)
+
+    def fast_compute_add(self, column_name, period = None, requested_formulas_by_period = None):
+        if period is None:
+            period = self.period
+        elif not isinstance(period, periods.Period):
+            period = periods.period(period)
+        holder = self.holder_by_column_name.get(column_name)
+        if holder is None:
+            holder = self.get_or_new_holder(column_name)
+        return holder.compute_add(period = period, requested_formulas_by_period = requested_formulas_by_period)
+
+    def fast_compute_add_divide(self, column_name, period = None, requested_formulas_by_period = None):
+        if period is None:
+            period = self.period
+        elif not isinstance(period, periods.Period):
+            period = periods.period(period)
+        holder = self.holder_by_column_name.get(column_name)
+        if holder is None:
+            holder = self.get_or_new_holder(column_name)
+        return holder.compute_add_divide(period = period,
+            requested_formulas_by_period = requested_formulas_by_period)
+
+    def fast_compute_divide(self, column_name, period = None, requested_formulas_by_period = None):
+        if period is None:
+            period = self.period
+        elif not isinstance(period, periods.Period):
+            period = periods.period(period)
+        holder = self.holder_by_column_name.get(column_name)
+        if holder is None:
+            holder = self.get_or_new_holder(column_name)
+        return holder.compute_divide(period = period, requested_formulas_by_period = requested_formulas_by_period)
+
+    def fast_get_array(self, column_name, period = None):
+        if period is None:
+            period = self.period
+        elif not isinstance(period, periods.Period):
+            period = periods.period(period)
+        holder = self.holder_by_column_name.get(column_name)
+        if holder is None:
+            holder = self.get_or_new_holder(column_name)
+        return holder.get_array(period)
+
     def get_array(self, column_name, period = None):
         if period is None:
             period = self.period
         elif not isinstance(period, periods.Period):
             period = periods.period(period)
         if (self.debug or self.trace) and self.stack_trace:
-            variable_infos = (column_name, period)
-            calling_frame = self.stack_trace[-1]
-            caller_input_variables_infos = calling_frame['input_variables_infos']
-            if variable_infos not in caller_input_variables_infos:
-                caller_input_variables_infos.append(variable_infos)
+            self.record_input_variable(column_name, period)
         return self.entity_by_column_name[column_name].get_array(column_name, period)
 
     def get_compact_legislation(self, instant):
         compact_legislation = self.compact_legislation_by_instant_cache.get(instant)
         if compact_legislation is None:
             compact_legislation = self.tax_benefit_system.get_compact_legislation(instant)
+            if self.parameter_vector_by_path:
+                compact_legislation = legislations.update_compact_legislation(compact_legislation,
+                    self.parameter_vector_by_path.iteritems(),
+                    legislation_json = self.tax_benefit_system.legislation_json)
             self.compact_legislation_by_instant_cache[instant] = compact_legislation
         return compact_legislation
 
+    def get_dtype(self, column):
+        """Return the dtype of the arrays of a column in this simulation.
+
+        When memory is optimized, roles are stored in int8, floats in float32 and columns having a compact dtype (ages,
+        small enumerations) in it. Entity indexes stay in int32 and FloatCol is already float32, so the gain only comes
+        from the roles, the ages, the enumerations and the float64 columns.
+        """
+        dtype = column.dtype
+        if not self.optimize_memory:
+            return dtype
+        if column.compact_dtype is not None:
+            return column.compact_dtype
+        if np.dtype(dtype) == np.float64:
+            return np.float32
+        for entity in self.entity_by_key_plural.itervalues():
+            if column.name == entity.role_for_person_variable_name:
+                return np.int8
+        return dtype
+
     def get_holder(self, column_name, default = UnboundLocalError):
         entity = self.entity_by_column_name[column_name]
         if default is UnboundLocalError:
@@ -230,8 +330,11 @@ class Simulation(object):
         return entity.holder_by_name.get(column_name, default)
 
     def get_or_new_holder(self, column_name):
-        entity = self.entity_by_column_name[column_name]
-        return entity.get_or_new_holder(column_name)
+        holder = self.holder_by_column_name.get(column_name)
+        if holder is None:
+            entity = self.entity_by_column_name[column_name]
+            self.holder_by_column_name[column_name] = holder = entity.get_or_new_holder(column_name)
+        return holder
 
     def get_reference_compact_legislation(self, instant):
         reference_compact_legislation = self.reference_compact_legislation_by_instant_cache.get(instant)
@@ -249,6 +352,32 @@ class Simulation(object):
             return self.get_reference_compact_legislation(instant)
         return self.get_compact_legislation(instant)
 
+    def record_input_variable(self, column_name, period):
+        """Add a variable to the inputs of the formula being debugged or traced."""
+        variable_infos = (column_name, period)
+        caller_input_variables_infos = self.stack_trace[-1]['input_variables_infos']
+        if variable_infos not in caller_input_variables_infos:
+            caller_input_variables_infos.append(variable_infos)
+
+    def reduce(self, reducers):
+        """Update each reducer (see module reducers) with the variables of the simulation and return their results."""
+        for reducer in reducers:
+            reducer.update(self)
+        return [reducer.result for reducer in reducers]
+
+    def select_evaluation_methods(self):
+        """Use the fast versions of the compute methods, unless the simulation is debugged or traced.
+
+        The fast versions skip every debug & trace check and go straight to the holders. They are stored in the
+        instance, so that the choice is made once, when the simulation is created (or cloned).
+        """
+        instance_dict = self.__dict__
+        for method_name, fast_method_name in fast_method_name_by_method_name.iteritems():
+            if self.debug or self.trace:
+                instance_dict.pop(method_name, None)
+            else:
+                instance_dict[method_name] = getattr(self, fast_method_name)
+
     def stringify_input_variables_infos(self, input_variables_infos):
         return u', '.join(
             u'{}@{}<{}>{}'.format(
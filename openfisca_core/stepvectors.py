@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+
+
+# OpenFisca -- A versatile microsimulation software
+# By: OpenFisca Team <contact@openfisca.fr>
+#
+# Copyright (C) 2011, 2012, 2013, 2014, 2015 OpenFisca Team
+# https://github.com/openfisca
+#
+# This file is part of OpenFisca.
+#
+# OpenFisca is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# OpenFisca is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""Vector-valued legislation parameters, with a value per step of the axes of a simulation
+
+In a simulation with axes, the members of each entity are laid out step after step: member ``i`` of step ``s`` has
+index ``s * step_size + i``. A ``StepVector`` holds one value per step. When it is combined (by any numpy ufunc:
+arithmetic, comparisons, ``np.maximum``...) with an array of an entity, each of its values is repeated for the members
+of its step, so that formulas written for scalar parameters work unchanged. Combined with scalars or other step
+vectors, the result is still a step vector.
+
+Functions that are not ufuncs (``np.where``, ``np.select``...) don't broadcast step vectors: use ``expand()`` first.
+"""
+
+
+import numpy as np
+
+
+__all__ = [
+    'expand',
+    'is_step_vector',
+    'StepVector',
+    ]
+
+
+class StepVector(np.ndarray):
+    """A 1D array of the values of a parameter, one per step"""
+
+    def __new__(cls, values):
+        array = np.asarray(values)
+        assert array.ndim == 1, array.shape
+        return array.view(cls)
+
+    def __array_ufunc__(self, ufunc, method, *inputs, **kwargs):
+        steps_count = len(self)
+        count = None
+        for input in inputs:
+            if isinstance(input, np.ndarray) and not isinstance(input, StepVector) and input.ndim > 0:
+                assert input.ndim == 1 and len(input) % steps_count == 0, \
+                    u'Array of length {} is not a multiple of {} steps'.format(len(input), steps_count).encode('utf-8')
+                count = len(input)
+        if count is None:
+            inputs = [
+                input.view(np.ndarray) if isinstance(input, StepVector) else input
+                for input in inputs
+                ]
+        else:
+            inputs = [
+                expand(input, count) if isinstance(input, StepVector) else input
+                for input in inputs
+                ]
+        outputs = kwargs.get('out')
+        if outputs is not None:
+            kwargs['out'] = tuple(
+                output.view(np.ndarray) if isinstance(output, StepVector) else output
+                for output in outputs
+                )
+        result = getattr(ufunc, method)(*inputs, **kwargs)
+        if count is None and outputs is None and isinstance(result, np.ndarray) and result.shape == (steps_count,):
+            return result.view(StepVector)
+        return result
+
+    def __repr__(self):
+        return '{}({})'.format(self.__class__.__name__, self.view(np.ndarray).tolist())
+
+
+def expand(value, count):
+    """Return the value of a parameter for each of the ``count`` members of an entity (the value itself if scalar)."""
+    if not isinstance(value, StepVector):
+        return value
+    assert count % len(value) == 0, (count, len(value))
+    return np.repeat(value.view(np.ndarray), count // len(value))
+
+
+def is_step_vector(value):
+    return isinstance(value, StepVector)
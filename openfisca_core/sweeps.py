@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+
+
+# OpenFisca -- A versatile microsimulation software
+# By: OpenFisca Team <contact@openfisca.fr>
+#
+# Copyright (C) 2011, 2012, 2013, 2014, 2015 OpenFisca Team
+# https://github.com/openfisca
+#
+# This file is part of OpenFisca.
+#
+# OpenFisca is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# OpenFisca is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""Compute the same population under many variants of a legislation, in a pool of processes
+
+Each variant is a list of legislation patches (see ``reforms.make_reform()``). The baseline simulation is computed
+first, then each variant starts from a clone of it, where only the variables in the dependency cone of its patches are
+computed again: the values of the other variables are reused from the baseline.
+
+Worker processes are forked after the baseline has been computed, so that they share the inputs of the population and
+the baseline values with the parent process (copy-on-write). When the baseline simulation has been filled from a
+column store, its inputs are memory-mapped and shared through the page cache of the operating system.
+"""
+
+
+import collections
+import multiprocessing
+
+import numpy as np
+
+from . import reforms
+
+
+__all__ = [
+    'get_legislation_patch_path',
+    'run_sweep',
+    ]
+
+
+sweep = None  # Arguments of the running sweep, inherited by forked worker processes
+
+
+def get_legislation_patch_path(path):
+    """Convert the JSON path of a legislation patch to the dotted path used by dependency graphs."""
+    return u'.'.join(
+        path[index + 1]
+        for index, fragment in enumerate(path[:-1])
+        if fragment == 'children'
+        )
+
+
+def new_variant_simulation(simulation, legislation_patches, dependency_graph, name = None):
+    """Return a clone of a (computed) simulation using a variant of its legislation.
+
+    The values computed by the formulas that depend on the patched parameters are removed from the clone. The values
+    set as inputs are kept.
+    """
+    tax_benefit_system = simulation.tax_benefit_system
+    legislation_patches = reforms.normalize_legislation_patches(legislation_patches)
+    Reform = reforms.make_reform(
+        legislation_patches = legislation_patches,
+        name = name or u'variant',
+        reference = tax_benefit_system,
+        )
+    variant_simulation = simulation.clone()
+    variant_simulation.compact_legislation_by_instant_cache = {}
+    variant_simulation.reference_compact_legislation_by_instant_cache = {}
+    variant_simulation.tax_benefit_system = Reform()
+    dependent_variables_name = dependency_graph.get_dependent_variables(legislation_paths = [
+        get_legislation_patch_path(path)
+        for path, start, stop, value in legislation_patches
+        ])
+    for variable_name in dependent_variables_name:
+        holder = variant_simulation.get_holder(variable_name, None)
+        if holder is not None and holder.formula is not None:
+            holder.delete_computed_arrays()
+    return variant_simulation
+
+
+def run_sweep(simulation, legislation_patches_by_variant, output_variables_name, period = None,
+        processes_count = None):
+    """Compute output variables for each variant of the legislation of a simulation with inputs.
+
+    Return an OrderedDict mapping each output variable name to a 2D array, with a row per variant (in the order of
+    ``legislation_patches_by_variant``) and a column per member of the entity of the variable. An empty list of
+    patches gives the baseline.
+
+    ``processes_count`` defaults to the number of CPUs. With a single process, variants are computed in the current
+    process.
+    """
+    global sweep
+
+    assert sweep is None, u'Sweeps can\'t be nested'
+    if period is None:
+        period = simulation.period
+    output_variables_name = list(output_variables_name)
+    dependency_graph = simulation.tax_benefit_system.get_dependency_graph()
+    for variable_name in output_variables_name:
+        simulation.calculate(variable_name, period = period)
+    variants_count = len(legislation_patches_by_variant)
+    if processes_count is None:
+        processes_count = multiprocessing.cpu_count()
+    processes_count = min(processes_count, variants_count)
+
+    sweep = (simulation, legislation_patches_by_variant, output_variables_name, period, dependency_graph)
+    try:
+        if processes_count <= 1:
+            arrays_by_variant = map(run_sweep_variant, range(variants_count))
+        else:
+            pool = multiprocessing.Pool(processes_count)
+            try:
+                arrays_by_variant = pool.map(run_sweep_variant, range(variants_count))
+            finally:
+                pool.close()
+                pool.join()
+    finally:
+        sweep = None
+
+    return collections.OrderedDict(
+        (variable_name, np.vstack([arrays[index] for arrays in arrays_by_variant]))
+        for index, variable_name in enumerate(output_variables_name)
+        )
+
+
+def run_sweep_variant(variant_index):
+    simulation, legislation_patches_by_variant, output_variables_name, period, dependency_graph = sweep
+    variant_simulation = new_variant_simulation(simulation, legislation_patches_by_variant[variant_index],
+        dependency_graph, name = u'variant_{}'.format(variant_index))
+    return [
+        variant_simulation.calculate(variable_name, period = period)
+        for variable_name in output_variables_name
+        ]
@@ -0,0 +1,442 @@
+# -*- coding: utf-8 -*-
+
+
+# OpenFisca -- A versatile microsimulation software
+# By: OpenFisca Team <contact@openfisca.fr>
+#
+# Copyright (C) 2011, 2012, 2013, 2014, 2015 OpenFisca Team
+# https://github.com/openfisca
+#
+# This file is part of OpenFisca.
+#
+# OpenFisca is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# OpenFisca is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""Generate synthetic tax-benefit systems, legislations and populations, to benchmark and test OpenFisca at any scale
+
+A synthetic tax-benefit system has a given number of formulas, arranged in layers: each formula depends on a formula
+of the previous layer and on other formulas (or input variables) of any earlier layer, and on legislation parameters.
+The number of variables, the depth of the dependency graph and the fan-out of each formula can be chosen
+independently. Formulas are a mix of simple and dated formulas, of persons and families, computed by month or by
+year, and of projections between persons and families.
+"""
+
+
+import collections
+import datetime
+import xml.etree.ElementTree
+
+import numpy as np
+
+from . import formulas, periods, scenarios, simulations
+from .columns import AgeCol, EnumCol, FloatCol, IntCol
+from .entities import AbstractEntity
+from .enumerations import Enum
+from .taxbenefitsystems import AbstractTaxBenefitSystem
+
+
+__all__ = [
+    'new_legislation_json',
+    'new_legislation_xml',
+    'new_simulation',
+    'new_tax_benefit_system',
+    ]
+
+
+# Number of categories of the enumerations used as categorical inputs
+categories_count = 10
+# Distribution of the number of persons by family (the last item is for 6 persons or more)
+family_size_probabilities = np.array([0.35, 0.31, 0.15, 0.12, 0.05, 0.02])
+legislation_start_year = 2000
+legislation_stop_year = 2030
+# Year when dated formulas change
+reform_year = 2010
+
+
+class Scenario(scenarios.AbstractScenario):
+    pass
+
+
+class SyntheticVariable(object):
+    """Description of a synthetic variable, used to generate the formulas depending on it"""
+    entity_symbol = None  # 'fam' or 'ind'
+    is_monthly = False
+    name = None
+
+    def __init__(self, name = None, entity_symbol = None, is_monthly = False):
+        self.entity_symbol = entity_symbol
+        self.is_monthly = is_monthly
+        self.name = name
+
+    def calculate(self, simulation, period):
+        """Return the value of the variable for a monthly or yearly period."""
+        if period.unit == u'year' and self.is_monthly:
+            return simulation.calculate_add(self.name, period)
+        if period.unit == u'month' and not self.is_monthly:
+            return simulation.calculate_divide(self.name, period)
+        return simulation.calculate(self.name, period)
+
+
+def iter_dated_values(values_count):
+    """Iterate the (start, stop, index) of values_count consecutive periods covering the legislation, latest first."""
+    years_count = legislation_stop_year - legislation_start_year + 1
+    values_count = max(1, min(values_count, years_count))
+    bounds = [legislation_start_year + years_count * index // values_count for index in range(values_count + 1)]
+    for index in reversed(range(values_count)):
+        yield (
+            datetime.date(bounds[index], 1, 1).isoformat(),
+            datetime.date(bounds[index + 1] - 1, 12, 31).isoformat(),
+            index,
+            )
+
+
+def new_entity_classes():
+    """Return new (families, persons) entity classes, so that each synthetic tax-benefit system has its own columns."""
+    class Familles(AbstractEntity):
+        column_by_name = collections.OrderedDict()
+        index_for_person_variable_name = 'id_famille'
+        key_plural = 'familles'
+        key_singular = 'famille'
+        label = u'Famille'
+        max_cardinality_by_role_key = {'parents': 2}
+        role_for_person_variable_name = 'role_dans_famille'
+        roles_key = ['parents', 'enfants']
+        label_by_role_key = {
+            'enfants': u'Enfants',
+            'parents': u'Parents',
+            }
+        symbol = 'fam'
+
+        def iter_member_persons_role_and_id(self, member):
+            role = 0
+            parents_id = member['parents']
+            assert 1 <= len(parents_id) <= 2
+            for parent_role, parent_id in enumerate(parents_id, role):
+                yield parent_role, parent_id
+            role += 2
+            enfants_id = member.get('enfants')
+            if enfants_id is not None:
+                for enfant_role, enfant_id in enumerate(enfants_id, role):
+                    yield enfant_role, enfant_id
+
+    class Individus(AbstractEntity):
+        column_by_name = collections.OrderedDict()
+        is_persons_entity = True
+        key_plural = 'individus'
+        key_singular = 'individu'
+        label = u'Personne'
+        symbol = 'ind'
+
+    return Familles, Individus
+
+
+def new_formula_function(variable, dependencies, parameter_name, tax_scale_name, factor = 1):
+    """Return the function of a formula: a weighted sum of its dependencies, using legislation parameters."""
+    others_weight = 0.5 / max(len(dependencies) - 1, 1)
+
+    def function(self, simulation, period):
+        period = period.start.period(u'month' if variable.is_monthly else u'year').offset('first-of')
+        law = simulation.legislation_at(period.start).synthetic
+        first_array = dependencies[0].calculate(simulation, period)
+        if tax_scale_name is None:
+            array = first_array * getattr(law, parameter_name)
+        else:
+            array = getattr(law, tax_scale_name).calc(first_array * (12 if variable.is_monthly else 1)) \
+                / (12 if variable.is_monthly else 1)
+        for dependency in dependencies[1:]:
+            array += dependency.calculate(simulation, period) * others_weight
+        return period, array * factor
+
+    return function
+
+
+def new_legislation_json(parameters_count = 10, tax_scales_count = 1, brackets_count = 5, values_count = 1):
+    """Return a legislation containing a node "synthetic" with rates and marginal rate tax scales.
+
+    Each parameter (and each bracket) has ``values_count`` values, changing over time.
+    """
+    def new_values_json(value):
+        return [
+            collections.OrderedDict((
+                ('start', start),
+                ('stop', stop),
+                ('value', value * (1 + 0.01 * index)),
+                ))
+            for start, stop, index in iter_dated_values(values_count)
+            ]
+
+    children_json = collections.OrderedDict()
+    for parameter_index in range(parameters_count):
+        children_json['taux_{}'.format(parameter_index)] = collections.OrderedDict((
+            ('@type', u'Parameter'),
+            ('format', u'rate'),
+            ('values', new_values_json(0.1 + 0.8 * parameter_index / parameters_count)),
+            ))
+    for tax_scale_index in range(tax_scales_count):
+        children_json['bareme_{}'.format(tax_scale_index)] = collections.OrderedDict((
+            ('@type', u'Scale'),
+            ('unit', u'currency'),
+            ('brackets', [
+                collections.OrderedDict((
+                    ('threshold', new_values_json(10000.0 * bracket_index)),
+                    ('rate', new_values_json(0.1 * bracket_index / (1 + tax_scale_index))),
+                    ))
+                for bracket_index in range(brackets_count)
+                ]),
+            ))
+    return collections.OrderedDict((
+        ('@context', u'http://openfisca.fr/contexts/legislation.jsonld'),
+        ('@type', u'Node'),
+        ('start', datetime.date(legislation_start_year, 1, 1).isoformat()),
+        ('stop', datetime.date(legislation_stop_year, 12, 31).isoformat()),
+        ('children', collections.OrderedDict((
+            ('synthetic', collections.OrderedDict((
+                ('@type', u'Node'),
+                ('children', children_json),
+                ))),
+            ))),
+        ))
+
+
+def new_legislation_xml(parameters_count = 10, tax_scales_count = 1, brackets_count = 5, values_count = 1):
+    """Return the XML of the legislation returned by new_legislation_json()."""
+    legislation_json = new_legislation_json(parameters_count = parameters_count, tax_scales_count = tax_scales_count,
+        brackets_count = brackets_count, values_count = values_count)
+    root_element = xml.etree.ElementTree.Element('NODE', code = 'root', deb = legislation_json['start'],
+        fin = legislation_json['stop'])
+    for node_code, node_json in legislation_json['children'].iteritems():
+        node_element = xml.etree.ElementTree.SubElement(root_element, 'NODE', code = node_code)
+        for code, child_json in node_json['children'].iteritems():
+            if child_json['@type'] == u'Parameter':
+                parameter_element = xml.etree.ElementTree.SubElement(node_element, 'CODE', code = code,
+                    format = 'percent')
+                new_values_xml(parameter_element, child_json['values'])
+            else:
+                scale_element = xml.etree.ElementTree.SubElement(node_element, 'BAREME', code = code,
+                    type = 'monetary')
+                for bracket_index, bracket_json in enumerate(child_json['brackets']):
+                    bracket_element = xml.etree.ElementTree.SubElement(scale_element, 'TRANCHE',
+                        code = 'tranche{}'.format(bracket_index))
+                    new_values_xml(xml.etree.ElementTree.SubElement(bracket_element, 'SEUIL'),
+                        bracket_json['threshold'])
+                    new_values_xml(xml.etree.ElementTree.SubElement(bracket_element, 'TAUX'), bracket_json['rate'])
+    return xml.etree.ElementTree.tostring(root_element, encoding = 'utf-8').decode('utf-8')
+
+
+def new_simulation(tax_benefit_system, persons_count = 1000, period = 2013, debug = False, optimize_memory = False,
+        seed = 0, trace = False):
+    """Return a simulation of a random population, with yearly inputs.
+
+    Family sizes follow ``family_size_probabilities``. A family has 1 or 2 parents (roles 0 and 1) and its other
+    members are children (roles 2 and more). Incomes are log-normal for parents and null for children. Categorical
+    inputs are uniform.
+    """
+    if not isinstance(period, periods.Period):
+        period = periods.period(period)
+    random_state = np.random.RandomState(seed)
+
+    # Draw more families than needed, then truncate the last family.
+    family_sizes = random_state.choice(np.arange(1, len(family_size_probabilities) + 1),
+        size = persons_count // 2 + 1, p = family_size_probabilities)
+    family_sizes[-1] += random_state.poisson(0.5) if family_sizes[-1] == len(family_size_probabilities) else 0
+    families_count = np.searchsorted(np.cumsum(family_sizes), persons_count) + 1
+    family_sizes = family_sizes[:families_count]
+    family_sizes[-1] -= family_sizes.sum() - persons_count
+    parents_counts = np.where((family_sizes >= 2) & (random_state.uniform(size = families_count) < 0.7), 2, 1)
+    parents_counts = np.minimum(parents_counts, family_sizes)
+    id_famille = np.repeat(np.arange(families_count, dtype = np.int32), family_sizes)
+    position = np.arange(persons_count) - np.repeat(np.cumsum(family_sizes) - family_sizes, family_sizes)
+    person_parents_count = parents_counts[id_famille]
+    role_dans_famille = np.where(position < person_parents_count, position, 2 + position - person_parents_count)
+    is_parent = position < person_parents_count
+
+    simulation = simulations.Simulation(debug = debug, optimize_memory = optimize_memory, period = period,
+        tax_benefit_system = tax_benefit_system, trace = trace)
+    familles = simulation.entity_by_key_plural['familles']
+    familles.count = families_count
+    familles.roles_count = int(role_dans_famille.max()) + 1
+    persons = simulation.persons
+    persons.count = persons_count
+    persons.get_or_new_holder('id_famille').array = id_famille
+    role_holder = persons.get_or_new_holder('role_dans_famille')
+    role_holder.array = role_dans_famille.astype(role_holder.dtype)
+    for variable_name in tax_benefit_system.input_variables_name:
+        holder = simulation.get_or_new_holder(variable_name)
+        if isinstance(holder.column, EnumCol):
+            array = random_state.randint(len(holder.column.enum), size = persons_count)
+        elif isinstance(holder.column, AgeCol):
+            array = random_state.randint(0, 100, size = persons_count)
+        elif holder.entity.is_persons_entity:
+            array = random_state.lognormal(np.log(20000), 0.8, persons_count) * is_parent \
+                * (random_state.uniform(size = persons_count) < 0.8)
+        else:
+            array = random_state.uniform(0, 12000, families_count)
+        holder.set_input(period, array.astype(holder.dtype))
+    return simulation
+
+
+def new_tax_benefit_system(variables_count = 100, depth = 10, fan_out = 2, inputs_count = 5, parameters_count = 10,
+        tax_scales_count = 1, values_count = 1, families_share = 0.2, monthly_share = 0.3, dated_share = 0.2,
+        projections_share = 0.2, categorical_inputs_count = 0, seed = 0):
+    """Return a new synthetic tax-benefit system.
+
+    Its ``variables_count`` formulas are spread over ``depth`` layers. Each formula depends on ``fan_out`` variables.
+    The ``..._share`` arguments are the probabilities that a formula belongs to families, is computed by month, is a
+    dated formula or is a projection between persons and families.
+    The ``categorical_inputs_count`` ages and enumerations of persons are inputs used by no formula.
+    Names of input variables are listed in ``input_variables_name`` and output variables (the formulas of the last
+    layer) in ``output_variables_name``.
+    """
+    assert 1 <= depth <= variables_count, (depth, variables_count)
+    assert fan_out >= 1, fan_out
+    assert inputs_count >= 1, inputs_count
+    assert parameters_count >= 1, parameters_count
+    random_state = np.random.RandomState(seed)
+    Familles, Individus = new_entity_classes()
+    entity_class_by_symbol = dict(
+        fam = Familles,
+        ind = Individus,
+        )
+    reference_formula = formulas.make_reference_formula_decorator(entity_class_by_symbol = entity_class_by_symbol)
+
+    for name in ('id_famille', 'role_dans_famille'):
+        formulas.reference_input_variable(
+            column = IntCol,
+            entity_class = Individus,
+            is_permanent = True,
+            name = name,
+            )
+    input_variables = [
+        SyntheticVariable(name = 'input_{}'.format(input_index), entity_symbol = 'ind')
+        for input_index in range(inputs_count)
+        ] + [SyntheticVariable(name = 'input_famille', entity_symbol = 'fam')]
+    for variable in input_variables:
+        formulas.reference_input_variable(
+            column = FloatCol,
+            entity_class = entity_class_by_symbol[variable.entity_symbol],
+            name = variable.name,
+            set_input = formulas.set_input_divide_by_period,
+            )
+    categorical_inputs_name = [
+        'categorical_input_{}'.format(input_index)
+        for input_index in range(categorical_inputs_count)
+        ]
+    for input_index, name in enumerate(categorical_inputs_name):
+        formulas.reference_input_variable(
+            column = AgeCol if input_index % 2 == 0 else EnumCol(
+                enum = Enum([u'category_{}'.format(index) for index in range(categories_count)])),
+            entity_class = Individus,
+            name = name,
+            )
+
+    # Each layer is a list of variables by entity symbol.
+    layers = [dict(
+        (entity_symbol, [variable for variable in input_variables if variable.entity_symbol == entity_symbol])
+        for entity_symbol in entity_class_by_symbol
+        )]
+    reform_instant = periods.instant(reform_year)
+    for variable_index in range(variables_count):
+        layer_index = variable_index * depth // variables_count
+        if layer_index + 1 >= len(layers):
+            layers.append(dict((entity_symbol, []) for entity_symbol in entity_class_by_symbol))
+        previous_layer = layers[layer_index]
+        name = 'variable_{}'.format(variable_index)
+        # Output variables (of the last layer) are yearly, so that they can be calculated for a year.
+        is_output = layer_index == depth - 1
+        entity_symbol = 'fam' if random_state.uniform() < families_share else 'ind'
+        other_entity_symbol = 'ind' if entity_symbol == 'fam' else 'fam'
+        projected_candidates = [
+            candidate
+            for candidate in previous_layer[other_entity_symbol]
+            if not (is_output and candidate.is_monthly)
+            ]
+        if not previous_layer[entity_symbol] and not projected_candidates:
+            entity_symbol, other_entity_symbol = other_entity_symbol, entity_symbol
+            projected_candidates = []
+        entity_class = entity_class_by_symbol[entity_symbol]
+        if projected_candidates and (random_state.uniform() < projections_share or not previous_layer[entity_symbol]):
+            # Projection of a variable of the other entity
+            dependency = projected_candidates[random_state.randint(len(projected_candidates))]
+            variable = SyntheticVariable(name = name, entity_symbol = entity_symbol,
+                is_monthly = dependency.is_monthly)
+            attributes = dict(
+                entity_class = entity_class,
+                variable = entity_class_by_symbol[other_entity_symbol].column_by_name[dependency.name],
+                __module__ = __name__,
+                )
+            if entity_symbol == 'fam':
+                attributes['operation'] = 'add'
+                base_class = formulas.PersonToEntityColumn
+            else:
+                base_class = formulas.EntityToPersonColumn
+        else:
+            variable = SyntheticVariable(name = name, entity_symbol = entity_symbol,
+                is_monthly = not is_output and random_state.uniform() < monthly_share)
+            candidates = [
+                candidate
+                for layer in layers[:layer_index + 1]
+                for candidate in layer[entity_symbol]
+                ]
+            dependencies = [previous_layer[entity_symbol][random_state.randint(len(previous_layer[entity_symbol]))]]
+            dependencies.extend(candidates[index] for index in random_state.randint(len(candidates),
+                size = fan_out - 1))
+            parameter_name = 'taux_{}'.format(random_state.randint(parameters_count))
+            tax_scale_name = 'bareme_{}'.format(random_state.randint(tax_scales_count)) \
+                if tax_scales_count and random_state.uniform() < 0.1 else None
+            attributes = dict(
+                column = FloatCol,
+                entity_class = entity_class,
+                __module__ = __name__,
+                )
+            if random_state.uniform() < dated_share:
+                base_class = formulas.DatedFormulaColumn
+                attributes['function_before_reform'] = formulas.dated_function(
+                    start = datetime.date(legislation_start_year, 1, 1),
+                    stop = reform_instant.offset(-1, 'day').date,
+                    )(new_formula_function(variable, dependencies,
+                        parameter_name, tax_scale_name))
+                attributes['function_after_reform'] = formulas.dated_function(start = reform_instant.date)(
+                    new_formula_function(variable, dependencies, parameter_name, tax_scale_name, factor = 1.1))
+            else:
+                base_class = formulas.SimpleFormulaColumn
+                attributes['function'] = new_formula_function(variable, dependencies, parameter_name,
+                    tax_scale_name)
+        reference_formula(type(name, (base_class,), attributes))
+        layers[layer_index + 1][entity_symbol].append(variable)
+
+    class TaxBenefitSystem(AbstractTaxBenefitSystem):
+        CURRENCY = u'€'
+        DECOMP_DIR = None
+        DEFAULT_DECOMP_FILE = None
+        entity_class_by_key_plural = dict(
+            (entity_class.key_plural, entity_class)
+            for entity_class in entity_class_by_symbol.itervalues()
+            )
+    TaxBenefitSystem.input_variables_name = [input_variable.name for input_variable in input_variables] \
+        + categorical_inputs_name
+    TaxBenefitSystem.output_variables_name = sorted(
+        output_variable.name
+        for output_variables in layers[-1].itervalues()
+        for output_variable in output_variables
+        )
+    TaxBenefitSystem.Scenario = Scenario
+
+    return TaxBenefitSystem(legislation_json = new_legislation_json(parameters_count = parameters_count,
+        tax_scales_count = tax_scales_count, values_count = values_count))
+
+
+def new_values_xml(parent_element, values_json):
+    for value_json in values_json:
+        xml.etree.ElementTree.SubElement(parent_element, 'VALUE', deb = value_json['start'], fin = value_json['stop'],
+            valeur = repr(value_json['value']))
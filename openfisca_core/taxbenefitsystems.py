@@ -26,7 +26,7 @@
 import collections
 # import weakref
 
-from . import conv, legislations, legislationsxml
+from . import conv, dependencies, legislations, legislationsxml
 
 
 __all__ = [
@@ -41,6 +41,7 @@ class AbstractTaxBenefitSystem(object):
     _real_reference = None
     column_by_name = None  # computed at instance initialization from entities column_by_name
     compact_legislation_by_instant_cache = None
+    dependency_graph = None
     entity_class_by_key_plural = None
     legislation_json = None
     person_key_plural = None
@@ -66,9 +67,8 @@ class AbstractTaxBenefitSystem(object):
         # Now that classes of entities are defined, build a column_by_name by aggregating the column_by_name of each
         # entity class.
         assert self.column_by_name is None
-        self.column_by_name = column_by_name = collections.OrderedDict()
+        self.column_by_name = self.new_column_by_name()
         for entity_class in self.entity_class_by_key_plural.itervalues():
-            column_by_name.update(entity_class.column_by_name)
             if entity_class.is_persons_entity:
                 self.person_key_plural = entity_class.key_plural
 
@@ -80,6 +80,16 @@ class AbstractTaxBenefitSystem(object):
             self.compact_legislation_by_instant_cache[instant] = compact_legislation
         return compact_legislation
 
+    def get_dependency_graph(self, cache_file_path = None):
+        """Return the static dependency graph of the formulas, see module dependencies."""
+        dependency_graph = self.dependency_graph
+        if dependency_graph is None:
+            self.dependency_graph = dependency_graph = dependencies.DependencyGraph(
+                cache_file_path = cache_file_path,
+                tax_benefit_system = self,
+                )
+        return dependency_graph
+
     def get_reference_compact_legislation(self, instant):
         reference = self.reference
         if reference is None:
@@ -96,6 +106,12 @@ class AbstractTaxBenefitSystem(object):
             return attributes, error
         return cls(**attributes), None
 
+    def new_column_by_name(self):
+        column_by_name = collections.OrderedDict()
+        for entity_class in self.entity_class_by_key_plural.itervalues():
+            column_by_name.update(entity_class.column_by_name)
+        return column_by_name
+
     def new_scenario(self):
         scenario = self.Scenario()
         scenario.tax_benefit_system = self
@@ -33,6 +33,7 @@ import itertools
 import numpy as np
 from numpy import maximum as max_, minimum as min_
 
+from . import stepvectors
 from .tools import empty_clone
 
 
@@ -217,10 +218,30 @@ class MarginalRateTaxScale(AbstractRateTaxScale):
         base1 = np.tile(base, (len(self.thresholds), 1)).T
         if isinstance(factor, (float, int)):
             factor = np.ones(len(base)) * factor
-        thresholds1 = np.outer(factor, np.array(self.thresholds + [np.inf]))
+        is_vector_valued = any(
+            stepvectors.is_step_vector(value)
+            for value in itertools.chain([factor], self.thresholds, self.rates)
+            )
+        if is_vector_valued:
+            # Thresholds and rates vary with the steps of the simulation: use a (base, bracket) matrix for each one.
+            count = len(base)
+            thresholds1 = np.column_stack([
+                np.broadcast_to(stepvectors.expand(threshold, count), (count,))
+                for threshold in self.thresholds + [np.inf]
+                ]) * stepvectors.expand(factor, count)[:, np.newaxis]
+        else:
+            thresholds1 = np.outer(factor, np.array(self.thresholds + [np.inf]))
         if round_base_decimals is not None:
             thresholds1 = np.round(thresholds1, round_base_decimals)
         a = max_(min_(base1, thresholds1[:, 1:]) - thresholds1[:, :-1], 0)
+        if is_vector_valued:
+            rates1 = np.column_stack([
+                np.broadcast_to(stepvectors.expand(rate, count), (count,))
+                for rate in self.rates
+                ])
+            if round_base_decimals is None:
+                return (rates1 * a).sum(axis = 1)
+            return np.round(rates1 * np.round(a, round_base_decimals), round_base_decimals).sum(axis = 1)
         if round_base_decimals is None:
             return np.dot(self.rates, a.T)
         else:
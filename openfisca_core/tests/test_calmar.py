@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+
+
+# OpenFisca -- A versatile microsimulation software
+# By: OpenFisca Team <contact@openfisca.fr>
+#
+# Copyright (C) 2011, 2012, 2013, 2014, 2015 OpenFisca Team
+# https://github.com/openfisca
+#
+# This file is part of OpenFisca.
+#
+# OpenFisca is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# OpenFisca is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import numpy as np
+
+from openfisca_core.calmar import calmar
+from openfisca_core.tools import assert_near
+
+
+def build_data():
+    random_state = np.random.RandomState(0)
+    return dict(
+        age = random_state.randint(0, 5, size = 1000),
+        salaire = random_state.uniform(0, 1000, size = 1000),
+        sexe = random_state.randint(0, 2, size = 1000).astype(bool),
+        wprm_init = np.concatenate(([0], random_state.uniform(0.5, 1.5, size = 999))),
+        )
+
+
+def check_margins(data, weights, margins):
+    for variable_name in ('age', 'sexe'):
+        for category, population in margins[variable_name].iteritems():
+            assert_near(weights[data[variable_name] == category].sum(), population, absolute_error_margin = 0.01)
+    assert weights[0] == 0
+    assert_near((weights * data['salaire']).sum(), margins['salaire'], absolute_error_margin = 0.01)
+    assert_near(weights.sum(), margins['total_population'], absolute_error_margin = 0.01)
+
+
+def test_calmar_newton():
+    for method in ('linear', 'raking ratio', 'logit'):
+        data = build_data()
+        margins = dict(
+            age = {0: 220, 1: 180, 2: 200, 3: 210, 4: 190},
+            salaire = 520000,
+            sexe = {False: 490, True: 510},
+            total_population = 1000,
+            )
+        parameters = dict(lo = 0.5, method = method, return_diagnostics = True, up = 2)
+        weights, lambdasol, margins_new_dict, diagnostics = calmar(data, margins.copy(),
+            parameters = dict(parameters, solver = 'newton'))
+        check_margins(data, weights, margins)
+        assert diagnostics['solver'] == 'newton'
+        assert diagnostics['converged'] and diagnostics['max_rel_error'] < 1e-6
+
+        # fsolve remains the default solver. Both solvers agree.
+        reference_weights, _, _, reference_diagnostics = calmar(data, margins.copy(), parameters = parameters)
+        assert reference_diagnostics['solver'] == 'fsolve' and reference_diagnostics['converged']
+        assert_near(weights, reference_weights, absolute_error_margin = 1e-6)
+        if method == 'logit':
+            ratio = weights[1:] / data['wprm_init'][1:]
+            assert ratio.min() >= 0.5 and ratio.max() <= 2
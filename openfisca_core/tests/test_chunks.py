@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+
+
+# OpenFisca -- A versatile microsimulation software
+# By: OpenFisca Team <contact@openfisca.fr>
+#
+# Copyright (C) 2011, 2012, 2013, 2014, 2015 OpenFisca Team
+# https://github.com/openfisca
+#
+# This file is part of OpenFisca.
+#
+# OpenFisca is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# OpenFisca is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from openfisca_core import chunks, columnstores, periods, reducers, simulations
+from openfisca_core.tools import assert_near
+
+from . import test_countries
+
+
+def test_simulate_by_chunk():
+    year = 2013
+    directory = tempfile.mkdtemp()
+    try:
+        # Family 1 is split between first and last persons => chunks are not slices of the store.
+        column_store = columnstores.write_column_store(os.path.join(directory, 'inputs'),
+            test_countries.tax_benefit_system, dict(
+                depcom = {None: np.array(['75101', '75101', '97123'])},
+                id_famille = {None: np.array([0, 1, 0, 2, 2, 1])},
+                role_dans_famille = {None: np.array([0, 0, 1, 0, 1, 1])},
+                salaire_brut = {year: np.array([0.0, 50000.0, 0.0, 100000.0, 0.0, 0.0])},
+                ))
+        chunks_list = list(chunks.iter_chunks(column_store, test_countries.tax_benefit_system, max_persons_count = 3))
+        assert len(chunks_list) == 3
+        assert_near(chunks_list[1].rows_by_entity_key_plural['individus'], [1, 5], absolute_error_margin = 0)
+
+        writer = chunks.ChunkWriter(os.path.join(directory, 'outputs'), column_store = column_store,
+            period = periods.period(year), tax_benefit_system = test_countries.tax_benefit_system,
+            variables_name = ['revenu_disponible', 'revenu_disponible_famille'])
+        reducer = reducers.WeightedSum('revenu_disponible')
+        chunks.simulate_by_chunk(column_store, test_countries.tax_benefit_system, period = periods.period(year),
+            consumers = [writer, reducer], max_persons_count = 3)
+        output_store = writer.close()
+
+        simulation = simulations.Simulation(period = periods.period(year),
+            tax_benefit_system = test_countries.tax_benefit_system)
+        column_store.fill_simulation(simulation)
+        revenu_disponible = simulation.calculate('revenu_disponible')
+        assert_near(output_store.get_array('revenu_disponible', year), revenu_disponible, absolute_error_margin = 0)
+        assert_near(output_store.get_array('revenu_disponible_famille', year),
+            simulation.calculate('revenu_disponible_famille'), absolute_error_margin = 0)
+        assert_near(reducer.result, revenu_disponible.sum(), absolute_error_margin = 0.01)
+    finally:
+        shutil.rmtree(directory)
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+
+
+# OpenFisca -- A versatile microsimulation software
+# By: OpenFisca Team <contact@openfisca.fr>
+#
+# Copyright (C) 2011, 2012, 2013, 2014, 2015 OpenFisca Team
+# https://github.com/openfisca
+#
+# This file is part of OpenFisca.
+#
+# OpenFisca is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# OpenFisca is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import shutil
+import tempfile
+
+import numpy as np
+
+from openfisca_core import columnstores, periods, simulations
+from openfisca_core.tools import assert_near
+
+from . import test_countries
+
+
+def test_memory_mapped_inputs():
+    year = 2013
+    directory = tempfile.mkdtemp()
+    try:
+        column_store = columnstores.write_column_store(directory, test_countries.tax_benefit_system, dict(
+            depcom = {None: np.array(['75101', '75101', '97123'])},
+            id_famille = {None: np.array([0, 0, 1, 1, 2, 2])},
+            role_dans_famille = {None: np.array([0, 1, 0, 1, 0, 1])},
+            salaire_brut = {year: np.array([0.0, 0.0, 50000.0, 0.0, 100000.0, 0.0])},
+            ))
+        simulation = simulations.Simulation(period = periods.period(year),
+            tax_benefit_system = test_countries.tax_benefit_system)
+        column_store.fill_simulation(simulation)
+        assert simulation.entity_by_key_plural['familles'].count == 3
+        assert simulation.persons.count == 6
+
+        salaire_brut = simulation.calculate('salaire_brut')
+        assert isinstance(salaire_brut, np.memmap)
+        assert not salaire_brut.flags.writeable
+        assert_near(simulation.calculate('revenu_disponible'), [3600, 3600, 25200, 3600, 50330, 3530],
+            absolute_error_margin = 0.005)
+
+        assert_near(column_store.get_array('salaire_brut', year, start = 2, stop = 5), [50000, 0, 100000],
+            absolute_error_margin = 0)
+        empty_array = column_store.get_array('salaire_brut', year, start = 3, stop = 3)
+        assert empty_array.shape == (0,) and empty_array.dtype == salaire_brut.dtype
+        assert column_store.get_array('salaire_brut', year, start = 6).shape == (0,)
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_persons_only_inputs():
+    year = 2013
+    directory = tempfile.mkdtemp()
+    try:
+        column_store = columnstores.write_column_store(directory, test_countries.tax_benefit_system, dict(
+            id_famille = {None: np.array([0, 0, 1, 1, 2, 2])},
+            role_dans_famille = {None: np.array([0, 1, 0, 1, 0, 1])},
+            salaire_brut = {year: np.array([0.0, 0.0, 50000.0, 0.0, 100000.0, 0.0])},
+            ))
+        assert 'familles' not in column_store.count_by_entity_key_plural
+        column_store = columnstores.ColumnStore(directory = directory)
+        simulation = simulations.Simulation(period = periods.period(year),
+            tax_benefit_system = test_countries.tax_benefit_system)
+        column_store.fill_simulation(simulation)
+        assert simulation.entity_by_key_plural['familles'].count == 3
+        assert simulation.persons.count == 6
+        assert_near(simulation.calculate('salaire_brut'), [0, 0, 50000, 0, 100000, 0], absolute_error_margin = 0)
+        assert simulation.calculate('revenu_disponible').shape == (6,)
+    finally:
+        shutil.rmtree(directory)
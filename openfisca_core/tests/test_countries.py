@@ -269,6 +269,9 @@ class Scenario(AbstractScenario):
 
 def init_country():
     class TaxBenefitSystem(AbstractTaxBenefitSystem):
+        CURRENCY = u'€'
+        DECOMP_DIR = None
+        DEFAULT_DECOMP_FILE = None
         entity_class_by_key_plural = {
             entity_class.key_plural: entity_class
             for entity_class in entity_class_by_symbol.itervalues()
@@ -352,8 +355,7 @@ class age(SimpleFormulaColumn):
             age_en_mois = simulation.get_array('age_en_mois', period)
             if age_en_mois is not None:
                 return period, age_en_mois // 12
-            birth = simulation.calculate('birth', period)
-        return period, (np.datetime64(period.date) - birth).astype('timedelta64[Y]')
+        return period, simulation.calculate_age('birth', period)
 
 
 @reference_formula
@@ -551,6 +553,75 @@ def test_age():
     assert_near(simulation.calculate('age'), [40], absolute_error_margin = 0.005)
 
 
+def test_age_cache():
+    year = 2013
+    simulation = tax_benefit_system.new_scenario().init_single_entity(
+        period = year,
+        parent1 = dict(
+            birth = datetime.date(year - 40, 6, 1),
+            ),
+        ).new_simulation()
+    period = periods.period(year)
+    age = simulation.calculate_age('birth', period)
+    assert_near(age, [39])
+    assert simulation.calculate_age('birth', period) is age
+    assert_near(simulation.calculate_age('birth', period, unit = u'month'), [39 * 12 + 7])
+    simulation.get_holder('birth').set_array(period, np.array(['1950-01-01'], dtype = 'datetime64[D]'))
+    assert_near(simulation.calculate_age('birth', period), [63])
+
+
+def test_dated_formula_dispatch():
+    formula_class = tax_benefit_system.column_by_name['rsa'].formula_class
+    formula_2010_class, formula_2011_2012_class, formula_2013_class = [
+        dated_formula_class['formula_class']
+        for dated_formula_class in formula_class.dated_formulas_class
+        ]
+    assert formula_class.at_instant(periods.instant('2009-12-31'), default = None) is None
+    assert formula_class.at_instant(periods.instant('2010-1-1')) is formula_2010_class
+    assert formula_class.at_instant(periods.instant('2012-12-31')) is formula_2011_2012_class
+    assert formula_class.at_instant(periods.instant('2042-1-1')) is formula_2013_class
+    assert formula_class.find_dated_formula(periods.period('year', 2009)) is None
+    assert formula_class.find_dated_formula(periods.period('month', '2009-12', 2)) == (0, periods.period('2010-01'))
+    assert formula_class.find_dated_formula(periods.period('year', '2012-07')) == (1, periods.period('month',
+        '2012-07', 6))
+    assert formula_class.find_dated_formula(periods.period('year', 2014)) == (2, periods.period('year', 2014))
+
+
+def test_dated_formula_dispatch_cache_size():
+    formula_class = tax_benefit_system.column_by_name['rsa'].formula_class
+    start = periods.instant('2010-01-01')
+    for offset in xrange(periods.parsing_cache_max_size + 10):
+        period = periods.period('day', start.offset(offset, 'day'))
+        assert formula_class.find_dated_formula(period) is not None
+    assert len(formula_class.found_dated_formula_by_period) <= periods.parsing_cache_max_size
+
+
+def test_optimize_memory():
+    scenario = tax_benefit_system.new_scenario().init_single_entity(
+        axes = [
+            dict(
+                count = 3,
+                name = 'salaire_brut',
+                max = 100000,
+                min = 0,
+                ),
+            ],
+        period = 2013,
+        parent1 = dict(birth = datetime.date(1973, 1, 1)),
+        parent2 = dict(),
+        )
+    simulation = scenario.new_simulation()
+    optimized_simulation = scenario.new_simulation(optimize_memory = True)
+    assert simulation.get_or_new_holder('role_dans_famille').dtype == np.int32
+    assert optimized_simulation.get_or_new_holder('role_dans_famille').dtype == np.int8
+    assert optimized_simulation.calculate('role_dans_famille').dtype == np.int8
+    assert_near(optimized_simulation.calculate('revenu_disponible_famille'),
+        simulation.calculate('revenu_disponible_famille'), absolute_error_margin = 0.005)
+    output_array = optimized_simulation.get_or_new_holder('revenu_disponible').formula.new_output_array(0)
+    assert output_array.dtype == np.float32
+    assert_near(output_array, np.zeros(6))
+
+
 def check_revenu_disponible(year, depcom, expected_revenu_disponible):
     global tax_benefit_system
     simulation = tax_benefit_system.new_scenario().init_single_entity(
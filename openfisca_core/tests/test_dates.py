@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+
+
+# OpenFisca -- A versatile microsimulation software
+# By: OpenFisca Team <contact@openfisca.fr>
+#
+# Copyright (C) 2011, 2012, 2013, 2014, 2015 OpenFisca Team
+# https://github.com/openfisca
+#
+# This file is part of OpenFisca.
+#
+# OpenFisca is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# OpenFisca is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import datetime
+
+import numpy as np
+
+from openfisca_core import dates, periods
+from openfisca_core.columns import DateCol
+from openfisca_core.tools import assert_near
+
+
+def test_age_matches_dates():
+    random_state = np.random.RandomState(0)
+    first_ordinal = datetime.date(1900, 1, 1).toordinal()
+    birth_dates = [
+        datetime.date.fromordinal(first_ordinal + day)
+        for day in random_state.randint(40000, size = 2000).tolist()
+        ]
+    birth = np.array(birth_dates, dtype = 'datetime64[D]')
+    for instant_str in ('2013-01-01', '2013-02-28', '2016-02-29', '2016-03-01', '2014-12-31'):
+        instant = periods.instant(instant_str)
+        date = instant.date
+        expected_months = [
+            (date.year - birth_date.year) * 12 + date.month - birth_date.month - (date.day < birth_date.day)
+            for birth_date in birth_dates
+            ]
+        assert_near(dates.get_age(birth, instant, unit = u'month'), expected_months)
+        assert_near(dates.get_age(birth, instant), [
+            months // 12
+            for months in expected_months
+            ])
+
+
+def test_is_in_period():
+    days = np.arange('2013-12-01', '2015-02-01', dtype = 'datetime64[D]')
+    in_period = dates.is_in_period(days, periods.period('year', 2014))
+    assert in_period.sum() == 365
+    assert days[in_period][0] == np.datetime64('2014-01-01')
+
+
+def test_date_column_json_to_array():
+    column = DateCol()
+    values = [u'2014-02-03', u'1973-05', u'2013']
+    array, error = column.json_to_array(values)
+    assert error is None
+    assert array.dtype == np.dtype('datetime64[D]')
+    assert array.tolist() == [datetime.date(2014, 2, 3), datetime.date(1973, 5, 1), datetime.date(2013, 1, 1)]
+    # Values that are not ISO 8601 strings are converted cell by cell.
+    array, error = column.json_to_array([u'2014-02-03', 1980])
+    assert error is None
+    assert array.tolist() == [datetime.date(2014, 2, 3), datetime.date(1980, 1, 1)]
+    array, error = column.json_to_array([u'2014-02-03', u'2014-02-30', u'1850-01-01'])
+    assert error is not None and sorted(error) == [1, 2]
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+
+
+# OpenFisca -- A versatile microsimulation software
+# By: OpenFisca Team <contact@openfisca.fr>
+#
+# Copyright (C) 2011, 2012, 2013, 2014, 2015 OpenFisca Team
+# https://github.com/openfisca
+#
+# This file is part of OpenFisca.
+#
+# OpenFisca is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# OpenFisca is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import numpy as np
+
+from openfisca_core import decompositions
+from openfisca_core.tools import assert_near
+
+from . import test_countries
+
+
+def test_calculate_with_axes():
+    scenario = test_countries.tax_benefit_system.new_scenario().init_single_entity(
+        axes = [dict(count = 5, max = 100000, min = 0, name = 'salaire_brut')],
+        parent1 = {},
+        parent2 = {},
+        period = 2013,
+        )
+    simulations = [scenario.new_simulation(), scenario.new_simulation()]
+    response_json = decompositions.calculate(simulations, [
+        dict(code = 'revenu_disponible', children = [
+            dict(code = 'rsa'),
+            dict(code = 'salaire_imposable', children = [dict(code = 'salaire_net')]),
+            ]),
+        dict(code = 'salaire_brut'),
+        ])
+    revenu_disponible_json, salaire_brut_json = response_json
+    rsa_json, salaire_imposable_json = revenu_disponible_json['children']
+    assert len(revenu_disponible_json['values']) == 2 * 5
+    assert_near(salaire_brut_json['values'], [0, 25000, 50000, 75000, 100000] * 2, absolute_error_margin = 0.01)
+    assert_near(salaire_imposable_json['values'], salaire_imposable_json['children'][0]['values'],
+        absolute_error_margin = 0)
+    assert_near(revenu_disponible_json['values'], [
+        rsa + salaire_imposable
+        for rsa, salaire_imposable in zip(rsa_json['values'], salaire_imposable_json['values'])
+        ], absolute_error_margin = 0)
+
+
+def test_calculate_with_integer_leaves():
+    scenario = test_countries.tax_benefit_system.new_scenario().init_single_entity(
+        parent1 = dict(age_en_mois = 2 ** 31 - 1),
+        parent2 = dict(age_en_mois = 2 ** 31 - 1),
+        period = 2013,
+        )
+    simulation = scenario.new_simulation()
+    decomposition_json = dict(code = 'total', children = [dict(code = 'age_en_mois'), dict(code = 'dom_tom_individu'),
+        dict(code = 'age_en_mois')])
+    leaf_array_by_index = {}
+    nodes, values_matrix, computed = decompositions.calculate_matrix([simulation], decomposition_json,
+        leaf_array_by_index = leaf_array_by_index)
+    assert values_matrix.dtype == np.int64
+    assert sorted(leaf_array_by_index) == [1, 2, 3]
+    assert leaf_array_by_index[1].dtype.kind == 'i' and leaf_array_by_index[1].tolist() == [2 * (2 ** 31 - 1)]
+    # Integer leaves are summed without overflowing their int32 dtype.
+    assert values_matrix[0].tolist() == [4 * (2 ** 31 - 1)]
+    total_json = decompositions.calculate([simulation], decomposition_json)
+    assert total_json['values'] == [4 * (2 ** 31 - 1)]
+    # Leaves are serialized by their column, even when summed with float leaves.
+    total_json = decompositions.calculate([simulation], dict(code = 'total', children = [dict(code = 'age_en_mois'),
+        dict(code = 'salaire_brut')]))
+    assert isinstance(total_json['values'][0], float)
+    assert isinstance(total_json['children'][0]['values'][0], (int, long))
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+
+
+# OpenFisca -- A versatile microsimulation software
+# By: OpenFisca Team <contact@openfisca.fr>
+#
+# Copyright (C) 2011, 2012, 2013, 2014, 2015 OpenFisca Team
+# https://github.com/openfisca
+#
+# This file is part of OpenFisca.
+#
+# OpenFisca is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# OpenFisca is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import datetime
+import json
+import os
+import shutil
+import tempfile
+
+from openfisca_core import decompositions, dependencies, reforms
+from openfisca_core.accessors import law
+from openfisca_core.tools import assert_near
+
+from . import test_countries
+
+
+def formula_function(self, simulation, period, plafond = law.rsa.plafond):
+    period = period.start.period(u'year').offset('first-of')
+    salaire_net = simulation.calculate('salaire_net', period)
+    legislation = simulation.legislation_at(period.start).impot
+    taux = getattr(legislation, 'taux')
+    impot = legislation.bareme.calc(salaire_net) + simulation.legislation_at(period.start).csg.taux * salaire_net
+    return period, (impot + taux * salaire_net) * (salaire_net < plafond)
+
+
+def dynamic_formula_function(self, simulation, period):
+    return period, sum(
+        simulation.calculate(variable_name, period)
+        for variable_name in ('salaire_brut', 'salaire_net')
+        )
+
+
+def calculate_taxable_income(simulation, period):
+    return simulation.calculate('salaire_net', period) * simulation.legislation_at(period.start).impot.taux
+
+
+def helper_formula_function(self, simulation, period):
+    return period, calculate_taxable_income(simulation, period) + simulation.calculate('salaire_brut', period)
+
+
+def alias_formula_function(self, simulation, period):
+    calculate = simulation.calculate
+    return period, calculate('salaire_net', period)
+
+
+def test_extract_function_dependencies():
+    variables_name, legislation_paths = dependencies.extract_function_dependencies(formula_function)
+    assert variables_name == set([u'salaire_net']), variables_name
+    assert legislation_paths == set([u'csg.taux', u'impot.bareme', u'impot.taux', u'rsa.plafond']), \
+        legislation_paths
+
+    variables_name, legislation_paths = dependencies.extract_function_dependencies(dynamic_formula_function)
+    assert variables_name is None
+    assert legislation_paths == set()
+
+    # When the simulation is given to a helper or aliased, nothing can be known statically.
+    assert dependencies.extract_function_dependencies(helper_formula_function) == (None, None)
+    assert dependencies.extract_function_dependencies(alias_formula_function) == (None, None)
+
+
+def test_dependency_graph():
+    directory = tempfile.mkdtemp()
+    try:
+        cache_file_path = os.path.join(directory, 'dependencies.json')
+        dependency_graph = dependencies.DependencyGraph(cache_file_path = cache_file_path,
+            tax_benefit_system = test_countries.tax_benefit_system)
+        with open(cache_file_path) as cache_file:
+            assert json.load(cache_file)['dependencies_by_key']
+        cached_dependency_graph = dependencies.DependencyGraph(cache_file_path = cache_file_path,
+            tax_benefit_system = test_countries.tax_benefit_system)
+        assert cached_dependency_graph.variables_name_by_variable_name \
+            == dependency_graph.variables_name_by_variable_name
+    finally:
+        shutil.rmtree(directory)
+
+    column_by_name = test_countries.tax_benefit_system.column_by_name
+    assert dependency_graph.get_input_variables(column_by_name['revenu_disponible']) \
+        == set(['rsa', 'salaire_imposable'])
+    assert dependency_graph.get_input_variables(column_by_name['dom_tom_individu']) == set(['dom_tom'])
+    evaluation_order = dependency_graph.get_evaluation_order(['revenu_disponible_famille'])
+    assert evaluation_order[-1] == 'revenu_disponible_famille'
+    assert evaluation_order.index('salaire_brut') < evaluation_order.index('salaire_net') \
+        < evaluation_order.index('salaire_imposable') < evaluation_order.index('rsa')
+    assert 'age' not in evaluation_order
+    assert dependency_graph.get_dependent_variables(['depcom']) == set(['depcom', 'dom_tom', 'dom_tom_individu',
+        'revenu_disponible', 'revenu_disponible_famille', 'rsa', 'salaire_imposable'])
+
+
+def test_output_driven_simulation():
+    scenario = test_countries.tax_benefit_system.new_scenario().init_single_entity(
+        parent1 = dict(birth = datetime.date(1980, 1, 1), salaire_brut = 50000),
+        parent2 = dict(birth = datetime.date(1985, 1, 1)),
+        period = 2013,
+        )
+    simulation = scenario.new_simulation(output_variables_name = ['revenu_disponible'])
+    assert simulation.get_holder('birth', None) is None
+    assert simulation.get_holder('salaire_brut', None) is not None
+    response_json = decompositions.calculate([simulation], [
+        dict(code = 'revenu_disponible', children = [dict(code = 'rsa'), dict(code = 'salaire_imposable')]),
+        dict(code = 'age'),
+        ], output_variables_name = ['revenu_disponible'])
+    assert response_json[1]['values'] is None
+    assert simulation.get_holder('age', None) is None
+    assert_near(response_json[0]['values'],
+        [(simulation.calculate_add('rsa') + simulation.calculate('salaire_imposable')).sum()],
+        absolute_error_margin = 0.01)
+
+
+def calculate_salaire_net(simulation, period):
+    return simulation.calculate('salaire_brut', period) * 0.8
+
+
+def test_output_driven_simulation_with_helper():
+    Reform = reforms.make_reform(name = u'Helper', reference = test_countries.tax_benefit_system)
+
+    @Reform.formula
+    class salaire_net(test_countries.SimpleFormulaColumn):
+        column = test_countries.FloatCol
+        entity_class = test_countries.Individus
+        label = u"Salaire net"
+        reference = test_countries.tax_benefit_system.column_by_name['salaire_net']
+
+        def function(self, simulation, period):
+            period = period.start.period(u'year').offset('first-of')
+            return period, calculate_salaire_net(simulation, period)
+
+    reform = Reform()
+    assert reform.get_dependency_graph().get_required_variables(['revenu_disponible']) is None
+    scenario = reform.new_scenario().init_single_entity(
+        parent1 = dict(birth = datetime.date(1980, 1, 1), salaire_brut = 50000),
+        period = 2013,
+        )
+    simulation = scenario.new_simulation(output_variables_name = ['revenu_disponible'])
+    # The input read by the helper is kept.
+    assert simulation.get_holder('salaire_brut', None) is not None
+    assert_near(simulation.calculate('salaire_net'), [40000], absolute_error_margin = 0.01)
@@ -23,6 +23,10 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
+import datetime
+import json
+import StringIO
+
 import numpy
 
 from . import test_countries
@@ -48,3 +52,54 @@ def test_new_test_case_array():
     salaire_brut = simulation.get_holder('salaire_brut').new_test_case_array(simulation.period)
     assert (salaire_brut - numpy.linspace(axis_min, axis_max, axis_count) == 0).all(), \
         u'salaire_brut: {}'.format(salaire_brut)
+
+
+def test_value_json():
+    simulation = test_countries.tax_benefit_system.new_scenario().init_single_entity(
+        parent1 = dict(birth = datetime.date(1980, 1, 5), salaire_brut = 1000.123),
+        parent2 = dict(salaire_brut = 2000),
+        period = 2014,
+        ).new_simulation()
+    birth_holder = simulation.get_holder('birth')
+    birth_holder.array = numpy.array(['1980-01-05', 'NaT'], dtype = 'datetime64[D]')
+    assert birth_holder.to_value_json() == {'2014': [u'1980-01-05', None]}
+    salaire_brut_holder = simulation.get_holder('salaire_brut')
+    assert salaire_brut_holder.to_value_json(decimals = 2) == {'2014': [1000.12, 2000.0]}
+
+    for holder in (birth_holder, salaire_brut_holder, simulation.compute('salaire_net')):
+        value_file = StringIO.StringIO()
+        holder.write_value_json(value_file)
+        assert json.loads(value_file.getvalue()) == holder.to_value_json()
+
+
+def test_delete_arrays():
+    simulation = test_countries.tax_benefit_system.new_scenario().init_single_entity(
+        parent1 = dict(salaire_brut = 1000),
+        period = 2014,
+        ).new_simulation()
+    revenu_disponible = simulation.calculate('revenu_disponible')
+    holder = simulation.get_holder('revenu_disponible')
+    holder.delete_arrays()
+    # Deleted arrays leave the slots of the holder set (to None), so that it can be used again.
+    assert holder.get_array(simulation.period) is None
+    assert (simulation.calculate('revenu_disponible') == revenu_disponible).all()
+    id_famille_holder = simulation.get_holder('id_famille')
+    id_famille_holder.delete_arrays()
+    assert id_famille_holder.array is None
+
+
+def test_delete_computed_arrays():
+    simulation = test_countries.tax_benefit_system.new_scenario().init_single_entity(
+        parent1 = dict(salaire_net = 1000),
+        period = 2014,
+        ).new_simulation()
+    simulation.calculate('salaire_imposable')
+    simulation.calculate('salaire_net', 2013)
+    salaire_net_holder = simulation.get_holder('salaire_net')
+    salaire_net_holder.delete_computed_arrays()
+    # Only the array computed by the formula is deleted.
+    assert (salaire_net_holder.get_array(simulation.period) == 1000).all()
+    assert salaire_net_holder.get_array(simulation.period.offset(-1)) is None
+    salaire_imposable_holder = simulation.get_holder('salaire_imposable')
+    salaire_imposable_holder.delete_computed_arrays()
+    assert salaire_imposable_holder.get_array(simulation.period) is None
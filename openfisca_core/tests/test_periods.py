@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+
+
+# OpenFisca -- A versatile microsimulation software
+# By: OpenFisca Team <contact@openfisca.fr>
+#
+# Copyright (C) 2011, 2012, 2013, 2014, 2015 OpenFisca Team
+# https://github.com/openfisca
+#
+# This file is part of OpenFisca.
+#
+# OpenFisca is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# OpenFisca is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import datetime
+
+from openfisca_core import periods
+
+
+def test_instant_day_offsets_match_dates():
+    date = datetime.date(1799, 12, 25)
+    instant = periods.instant(date)
+    while date.year < 2201:
+        assert instant.ordinal == date.toordinal()
+        assert instant == periods.instant_from_ordinal(date.toordinal())
+        for offset in (-366, -31, -1, 1, 29, 400):
+            offset_date = date + datetime.timedelta(days = offset)
+            assert instant.offset(offset, 'day') == periods.instant(offset_date)
+        date += datetime.timedelta(days = 13)
+        instant = periods.instant(date)
+
+
+def test_month_end_offsets_and_stops():
+    assert periods.instant('2014-1-31').offset(1, 'month') == periods.instant('2014-2-28')
+    assert periods.instant('2012-2-29').offset(1, 'year') == periods.instant('2013-2-28')
+    assert periods.instant('2012-2-15').offset('last-of', 'month') == periods.instant('2012-2-29')
+    assert periods.period('month', '2014-1-31').stop == periods.instant('2014-3-2')
+    assert periods.period('year', '2012-2-29', 2).stop == periods.instant('2014-2-28')
+    assert periods.period('day', '2014-12-30', 3).stop == periods.instant('2015-1-1')
+    assert periods.period('year', 2012).days == 366
+    assert periods.period('month', '2014-1', 2).intersection(periods.instant('2014-1-15'), None) == \
+        periods.period('day', '2014-1-15', 45)
+
+
+def test_subperiods():
+    assert len(periods.period('year', 2012).get_subperiods('month')) == 12
+    months = periods.period('year', '2012-1-31').get_subperiods('month')
+    assert [month.start.day for month in months[:4]] == [31, 29, 29, 29]
+    assert periods.period('month', '2014-1', 3).get_subperiods('year') == (periods.period('year', '2014-1'),)
+    days = periods.period('year', 2016).get_subperiods('day')
+    assert len(days) == 366
+    assert days[-1] == periods.period('day', '2016-12-31')
+    assert (periods.get_subperiods_start_ordinals(periods.period('year', 2016), 'day') == [
+        day.start.ordinal
+        for day in days
+        ]).all()
+
+
+def test_subperiods_cache_size():
+    for day in range(periods.parsing_cache_max_size + 10):
+        periods.period('day', periods.instant(2000).offset(day, 'day'), 2).get_subperiods('day')
+        assert len(periods.subperiods_by_unit_by_period_cache) <= periods.parsing_cache_max_size
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+
+
+# OpenFisca -- A versatile microsimulation software
+# By: OpenFisca Team <contact@openfisca.fr>
+#
+# Copyright (C) 2011, 2012, 2013, 2014, 2015 OpenFisca Team
+# https://github.com/openfisca
+#
+# This file is part of OpenFisca.
+#
+# OpenFisca is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# OpenFisca is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from openfisca_core import periods
+
+from . import test_countries
+
+
+def test_profiler():
+    year = 2013
+    simulation = test_countries.tax_benefit_system.new_scenario().init_single_entity(
+        parent1 = dict(salaire_brut = 50000),
+        parent2 = {},
+        period = year,
+        ).new_simulation(profile = True)
+    simulation.calculate('revenu_disponible_famille')
+    simulation.calculate('revenu_disponible')
+    profiler = simulation.profiler
+    stats_by_key = dict(
+        ((stats['variable'], stats['period']), stats)
+        for stats in profiler.to_json()
+        )
+    revenu_disponible_stats = stats_by_key[('revenu_disponible', unicode(periods.period(year)))]
+    assert revenu_disponible_stats['calls'] == 1
+    assert revenu_disponible_stats['cache_hits'] == 1
+    assert revenu_disponible_stats['bytes'] == 2 * 4
+    assert revenu_disponible_stats['inclusive_time'] >= revenu_disponible_stats['exclusive_time'] >= 0
+    assert stats_by_key[('rsa', u'2013-02')]['calls'] == 1
+
+    folded_stacks = profiler.to_folded_stacks()
+    assert any(
+        line.startswith(u'revenu_disponible_famille<2013>;revenu_disponible<2013>;rsa<2013-02>;')
+        for line in folded_stacks
+        ), folded_stacks
+    assert not profiler.frames
+    assert simulation.clone().profiler is None
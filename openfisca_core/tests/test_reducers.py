@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+
+
+# OpenFisca -- A versatile microsimulation software
+# By: OpenFisca Team <contact@openfisca.fr>
+#
+# Copyright (C) 2011, 2012, 2013, 2014, 2015 OpenFisca Team
+# https://github.com/openfisca
+#
+# This file is part of OpenFisca.
+#
+# OpenFisca is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# OpenFisca is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import numpy as np
+
+from openfisca_core import reducers
+from openfisca_core.tools import assert_near
+
+from . import test_countries
+
+
+def new_simulation():
+    year = 2013
+    return test_countries.tax_benefit_system.new_scenario().init_single_entity(
+        axes = [
+            dict(
+                count = 5,
+                name = 'salaire_brut',
+                max = 100000,
+                min = 0,
+                ),
+            ],
+        parent1 = {},
+        parent2 = {},
+        period = year,
+        ).new_simulation()
+
+
+def test_reducers():
+    simulation = new_simulation()
+    revenu_disponible = simulation.calculate('revenu_disponible')
+    salaire_brut = simulation.calculate('salaire_brut')
+    role_dans_famille = simulation.calculate('role_dans_famille')
+    total, count, mean, weighted_mean, deciles, histogram = simulation.reduce([
+        reducers.WeightedSum('revenu_disponible', group_by_variable_name = 'role_dans_famille'),
+        reducers.WeightedCount('revenu_disponible'),
+        reducers.WeightedMean('revenu_disponible'),
+        reducers.WeightedMean('revenu_disponible', weight_variable_name = 'salaire_brut'),
+        reducers.WeightedQuantiles('revenu_disponible', quantiles = [0.5]),
+        reducers.WeightedHistogram('revenu_disponible', bins = [0, 10000, 1000000],
+            group_by_variable_name = 'role_dans_famille'),
+        ])
+    assert_near(total, [revenu_disponible[role_dans_famille == role].sum() for role in (0, 1)],
+        absolute_error_margin = 0.01)
+    assert count == 10
+    assert_near(mean, revenu_disponible.mean(), absolute_error_margin = 0.01)
+    assert_near(weighted_mean, np.average(revenu_disponible, weights = salaire_brut), absolute_error_margin = 0.01)
+    assert_near(deciles, [np.sort(revenu_disponible)[4]], absolute_error_margin = 0)
+    assert_near(histogram, [
+        [
+            (revenu_disponible[role_dans_famille == role] < 10000).sum(),
+            (revenu_disponible[role_dans_famille == role] >= 10000).sum(),
+            ]
+        for role in (0, 1)
+        ], absolute_error_margin = 0)
+
+
+def test_merged_reducers():
+    simulation = new_simulation()
+    revenu_disponible = simulation.calculate('revenu_disponible')
+    first_quantiles, first_mean = [
+        reducers.WeightedQuantiles('revenu_disponible', bins = np.linspace(0, 100000, 1001)),
+        reducers.WeightedMean('revenu_disponible', group_by_variable_name = 'role_dans_famille'),
+        ]
+    second_quantiles, second_mean = [
+        reducers.WeightedQuantiles('revenu_disponible', bins = np.linspace(0, 100000, 1001)),
+        reducers.WeightedMean('revenu_disponible', group_by_variable_name = 'role_dans_famille'),
+        ]
+    simulation.reduce([first_quantiles, first_mean])
+    simulation.reduce([second_quantiles, second_mean])
+    first_quantiles.merge(second_quantiles)
+    first_mean.merge(second_mean)
+    assert_near(first_mean.result, [revenu_disponible[::2].mean(), revenu_disponible[1::2].mean()],
+        absolute_error_margin = 0.01)
+    assert_near(first_quantiles.result[4], np.median(revenu_disponible), absolute_error_margin = 100)
@@ -23,11 +23,12 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
+import collections
 import datetime
 
 from nose.tools import assert_equal, assert_is
 
-from .. import periods, reforms
+from .. import columns, legislations, periods, reforms, synthetics
 
 
 def test_find_item_at_date():
@@ -175,3 +176,122 @@ def test_updated_legislation_items():
                 },
             ],
         )
+
+
+def test_layered_ordered_dict():
+    parent = collections.OrderedDict([('a', 1), ('b', 2)])
+    layered = reforms.LayeredOrderedDict(parent)
+    layered['b'] = 20
+    layered['c'] = 3
+    assert_equal(layered.items(), [('a', 1), ('b', 20), ('c', 3)])
+    assert_equal(len(layered), 3)
+    # Changes of a plain parent are seen, even when they don't change its length.
+    parent['a'] = 10
+    assert_equal(layered.items(), [('a', 10), ('b', 20), ('c', 3)])
+    assert_equal(layered.values(), [10, 20, 3])
+    del parent['a']
+    parent['d'] = 4
+    assert_equal(layered.keys(), ['b', 'd', 'c'])
+    assert_equal(layered.copy(), collections.OrderedDict([('b', 20), ('d', 4), ('c', 3)]))
+
+
+def test_legislation_patches():
+    tax_benefit_system = synthetics.new_tax_benefit_system(variables_count = 10, depth = 2, parameters_count = 3,
+        tax_scales_count = 2)
+    Reform = reforms.make_reform(
+        legislation_patches = [
+            dict(path = ('children', 'synthetic', 'children', 'taux_1', 'values'),
+                period = periods.period('year', 2010, 3), value = 0.5),
+            dict(path = ('children', 'synthetic', 'children', 'bareme_0', 'brackets', 2, 'rate'), start = '2012-01-01',
+                stop = '2020-12-31', value = 0.75),
+            ],
+        name = u'Patches',
+        reference = tax_benefit_system,
+        )
+    reform = Reform()
+    for year in (2005, 2011, 2013):
+        instant = periods.instant(year)
+        reference_legislation = tax_benefit_system.get_compact_legislation(instant)
+        reform_legislation = reform.get_compact_legislation(instant)
+        assert reform.get_compact_legislation(instant) is reform_legislation
+        # Compact legislations derived from the patched legislation JSON must be the same.
+        expected_legislation = legislations.compact_dated_node_json(
+            legislations.generate_dated_legislation_json(reform.legislation_json, instant))
+        assert_equal(reform_legislation.instant, instant)
+        assert_equal(reform_legislation.synthetic.taux_1, expected_legislation.synthetic.taux_1)
+        assert_equal(reform_legislation.synthetic.bareme_0.rates, expected_legislation.synthetic.bareme_0.rates)
+        # Unpatched nodes are shared with the reference.
+        assert_is(reform_legislation.synthetic.bareme_1, reference_legislation.synthetic.bareme_1)
+        if year == 2005:
+            assert_is(reform_legislation, reference_legislation)
+        elif year == 2011:
+            assert_equal(reform_legislation.synthetic.taux_1, 0.5)
+            assert_is(reform_legislation.synthetic.bareme_0, reference_legislation.synthetic.bareme_0)
+        else:
+            assert_equal(reform_legislation.synthetic.taux_1, reference_legislation.synthetic.taux_1)
+            assert_equal(reform_legislation.synthetic.bareme_0.rates[2], 0.75)
+            assert reference_legislation.synthetic.bareme_0.rates[2] != 0.75
+
+
+def test_legislation_patches_of_brackets():
+    tax_benefit_system = synthetics.new_tax_benefit_system(variables_count = 10, depth = 2, parameters_count = 3,
+        tax_scales_count = 1)
+    brackets_json = tax_benefit_system.legislation_json['children']['synthetic']['children']['bareme_0']['brackets']
+    # Bracket 1 has a base and bracket 2 has no rate before 2012.
+    brackets_json[1]['base'] = [dict(start = u'2000-01-01', stop = u'2030-12-31', value = 0.5)]
+    brackets_json[2]['rate'] = [dict(start = u'2012-01-01', stop = u'2030-12-31', value = 0.3)]
+    bracket_path = ('children', 'synthetic', 'children', 'bareme_0', 'brackets')
+    Reform = reforms.make_reform(
+        legislation_patches = [
+            dict(path = bracket_path + (1, 'rate'), period = periods.period('year', 2010, 5), value = 0.4),
+            dict(path = bracket_path + (3, 'rate'), period = periods.period('year', 2010, 5), value = 0.8),
+            # Bracket 2 appears in 2010 and 2011.
+            dict(path = bracket_path + (2, 'rate'), period = periods.period('year', 2010, 2), value = 0.25),
+            dict(path = bracket_path + (4, 'threshold'), period = periods.period('year', 2013), value = 15000.0),
+            ],
+        name = u'Brackets',
+        reference = tax_benefit_system,
+        )
+    reform = Reform()
+    for year in (2005, 2010, 2011, 2013, 2015):
+        instant = periods.instant(year)
+        reform_tax_scale = reform.get_compact_legislation(instant).synthetic.bareme_0
+        # The patched compact legislation must be the one compiled from the patched legislation JSON.
+        expected_tax_scale = legislations.compact_dated_node_json(
+            legislations.generate_dated_legislation_json(reform.legislation_json, instant)).synthetic.bareme_0
+        assert_equal(reform_tax_scale.thresholds, expected_tax_scale.thresholds)
+        assert_equal(reform_tax_scale.rates, expected_tax_scale.rates)
+    assert_equal(len(reform.get_compact_legislation(periods.instant(2010)).synthetic.bareme_0.rates), 5)
+    assert_equal(len(tax_benefit_system.get_compact_legislation(periods.instant(2010)).synthetic.bareme_0.rates), 4)
+    assert_equal(reform.get_compact_legislation(periods.instant(2013)).synthetic.bareme_0.rates[1], 0.2)
+
+
+def test_layered_column_by_name():
+    tax_benefit_system = synthetics.new_tax_benefit_system(variables_count = 10, depth = 2)
+    input_variable_name = tax_benefit_system.input_variables_name[0]
+    input_column = tax_benefit_system.column_by_name[input_variable_name]
+    individus_class = tax_benefit_system.entity_class_by_key_plural['individus']
+
+    def build_reform(reference, name):
+        Reform = reforms.make_reform(name = name, reference = reference)
+        Reform.input_variable(column = columns.FloatCol, entity_class = individus_class, label = name, name = name)
+        Reform.input_variable(column = columns.FloatCol, entity_class = individus_class, label = name,
+            name = input_variable_name)
+        return Reform()
+
+    reform = reforms.compose_reforms(
+        [
+            lambda reference: build_reform(reference, u'reform_variable_1'),
+            lambda reference: build_reform(reference, u'reform_variable_2'),
+            ],
+        tax_benefit_system,
+        )
+    column_by_name = reform.column_by_name
+    assert_equal(sorted(column_by_name.own), [input_variable_name, u'reform_variable_2'])
+    assert_equal(column_by_name.keys(),
+        tax_benefit_system.column_by_name.keys() + [u'reform_variable_1', u'reform_variable_2'])
+    assert_equal(column_by_name[input_variable_name].label, u'reform_variable_2')
+    assert_equal(column_by_name[u'reform_variable_1'].label, u'reform_variable_1')
+    assert u'reform_variable_2' not in reform.reference.column_by_name
+    assert_is(tax_benefit_system.column_by_name[input_variable_name], input_column)
+    assert u'reform_variable_1' not in individus_class.column_by_name
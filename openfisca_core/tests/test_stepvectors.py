@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+
+
+# OpenFisca -- A versatile microsimulation software
+# By: OpenFisca Team <contact@openfisca.fr>
+#
+# Copyright (C) 2011, 2012, 2013, 2014, 2015 OpenFisca Team
+# https://github.com/openfisca
+#
+# This file is part of OpenFisca.
+#
+# OpenFisca is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# OpenFisca is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import numpy as np
+
+from openfisca_core import conv, legislations, periods, reforms, scenarios, synthetics
+from openfisca_core.stepvectors import StepVector
+from openfisca_core.tools import assert_near
+
+
+def test_step_vector_broadcast():
+    step_vector = StepVector([0.1, 0.2])
+    array = np.arange(4.0)
+    assert isinstance(1 - step_vector * 2, StepVector)
+    assert_near(1 - step_vector * 2, [0.8, 0.6], absolute_error_margin = 1e-10)
+    assert not isinstance(array * step_vector, StepVector)
+    assert_near(array * step_vector, [0, 0.1, 0.4, 0.6], absolute_error_margin = 1e-10)
+    assert_near(np.maximum(array, step_vector), [0.1, 1, 2, 3], absolute_error_margin = 0)
+    array += step_vector
+    assert_near(array, [0.1, 1.1, 2.2, 3.2], absolute_error_margin = 1e-10)
+
+
+def test_parameter_axis():
+    year = 2013
+    tax_benefit_system = synthetics.new_tax_benefit_system(variables_count = 20, depth = 3, parameters_count = 3,
+        tax_scales_count = 1)
+    test_case = dict(
+        familles = [dict(id = 0, parents = [0, 1], enfants = [2])],
+        individus = [
+            dict(id = 0, input_0 = 30000.0, input_1 = 1000.0),
+            dict(id = 1, input_0 = 10000.0),
+            dict(id = 2),
+            ],
+        )
+    values = [0.1, 0.3, 0.5]
+    scenario = tax_benefit_system.new_scenario()
+    scenario.axes = conv.check(scenarios.make_json_or_python_to_axes(tax_benefit_system))([
+        [
+            dict(count = 3, max = 0.5, min = 0.1, parameter = u'synthetic.taux_1'),
+            dict(count = 3, max = 0.7, min = 0.3, parameter = u'synthetic.bareme_0.brackets.2.rate'),
+            ],
+        ])
+    scenario.period = periods.period(year)
+    scenario.test_case = test_case
+    simulation = scenario.new_simulation()
+    assert simulation.entity_by_key_plural['individus'].count == 9
+    for step_index, value in enumerate(values):
+        Reform = reforms.make_reform(
+            legislation_patches = [
+                dict(path = ('children', 'synthetic', 'children', 'taux_1', 'values'), period = year, value = value),
+                dict(path = ('children', 'synthetic', 'children', 'bareme_0', 'brackets', 2, 'rate'), period = year,
+                    value = value + 0.2),
+                ],
+            name = u'Reform',
+            reference = tax_benefit_system,
+            )
+        step_scenario = Reform().new_scenario()
+        step_scenario.period = periods.period(year)
+        step_scenario.test_case = test_case
+        step_simulation = step_scenario.new_simulation()
+        for variable_name in tax_benefit_system.output_variables_name:
+            entity = simulation.get_or_new_holder(variable_name).entity
+            step_size = entity.count // 3
+            assert_near(
+                simulation.calculate(variable_name)[step_index * step_size:(step_index + 1) * step_size],
+                step_simulation.calculate(variable_name),
+                absolute_error_margin = 0.01,
+                )
+    assert simulation.legislation_at(periods.instant(year), reference = True).synthetic.taux_1 \
+        == tax_benefit_system.get_compact_legislation(periods.instant(year)).synthetic.taux_1
+
+
+def test_parameter_axis_validation():
+    tax_benefit_system = synthetics.new_tax_benefit_system(variables_count = 10, depth = 2, parameters_count = 3,
+        tax_scales_count = 1)
+    json_or_python_to_axes = scenarios.make_json_or_python_to_axes(tax_benefit_system)
+    for parameter in (u'synthetic.taux_1', u'synthetic.bareme_0.brackets.4.threshold',
+            u'synthetic.bareme_0.brackets.1.base'):
+        axes, error = json_or_python_to_axes([dict(count = 2, max = 1, min = 0, parameter = parameter)])
+        assert error is None, error
+    # Invalid paths are rejected when the scenario is converted, before any computation.
+    for parameter in (u'synthetic', u'synthetic.taux_9', u'synthetic.taux_1.values', u'synthetic.bareme_0',
+            u'synthetic.bareme_0.brackets.5.rate', u'synthetic.bareme_0.brackets.x.rate',
+            u'synthetic.bareme_0.brackets.1.value'):
+        axes, error = json_or_python_to_axes([dict(count = 2, max = 1, min = 0, parameter = parameter)])
+        assert error is not None, parameter
+
+
+def test_bracket_parameter_axes():
+    year = 2013
+    tax_benefit_system = synthetics.new_tax_benefit_system(variables_count = 10, depth = 2, parameters_count = 3,
+        tax_scales_count = 1)
+    # Bracket 1 has a base and bracket 2 has no rate before 2014.
+    brackets_json = tax_benefit_system.legislation_json['children']['synthetic']['children']['bareme_0']['brackets']
+    brackets_json[1]['base'] = [dict(start = u'2000-01-01', stop = u'2030-12-31', value = 0.5)]
+    brackets_json[2]['rate'] = [dict(start = u'2014-01-01', stop = u'2030-12-31', value = 0.3)]
+    scenario = tax_benefit_system.new_scenario()
+    scenario.axes = conv.check(scenarios.make_json_or_python_to_axes(tax_benefit_system))([
+        [
+            dict(count = 3, max = 0.5, min = 0.1, parameter = u'synthetic.bareme_0.brackets.1.rate'),
+            dict(count = 3, max = 0.6, min = 0.2, parameter = u'synthetic.bareme_0.brackets.3.rate'),
+            dict(count = 3, max = 45000, min = 41000, parameter = u'synthetic.bareme_0.brackets.4.threshold'),
+            ],
+        ])
+    scenario.period = periods.period(year)
+    scenario.test_case = dict(
+        familles = [dict(id = 0, parents = [0])],
+        individus = [dict(id = 0, input_0 = 30000.0)],
+        )
+    simulation = scenario.new_simulation()
+    instant = periods.instant(year)
+    tax_scale = simulation.legislation_at(instant).synthetic.bareme_0
+    bracket_path = ('children', 'synthetic', 'children', 'bareme_0', 'brackets')
+    for step_index, (rate_1, rate_3, threshold_4) in enumerate(zip([0.1, 0.3, 0.5], [0.2, 0.4, 0.6],
+            [41000, 43000, 45000])):
+        Reform = reforms.make_reform(
+            legislation_patches = [
+                dict(path = bracket_path + (1, 'rate'), period = year, value = rate_1),
+                dict(path = bracket_path + (3, 'rate'), period = year, value = rate_3),
+                dict(path = bracket_path + (4, 'threshold'), period = year, value = threshold_4),
+                ],
+            name = u'Reform',
+            reference = tax_benefit_system,
+            )
+        expected_tax_scale = legislations.compact_dated_node_json(
+            legislations.generate_dated_legislation_json(Reform().legislation_json, instant)).synthetic.bareme_0
+        assert len(tax_scale.rates) == len(expected_tax_scale.rates) == 4
+        for values, expected_values in ((tax_scale.rates, expected_tax_scale.rates),
+                (tax_scale.thresholds, expected_tax_scale.thresholds)):
+            assert_near(
+                [value[step_index] if isinstance(value, StepVector) else value for value in values],
+                expected_values,
+                absolute_error_margin = 1e-10,
+                )
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+
+
+# OpenFisca -- A versatile microsimulation software
+# By: OpenFisca Team <contact@openfisca.fr>
+#
+# Copyright (C) 2011, 2012, 2013, 2014, 2015 OpenFisca Team
+# https://github.com/openfisca
+#
+# This file is part of OpenFisca.
+#
+# OpenFisca is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# OpenFisca is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import numpy as np
+
+from openfisca_core import periods, reforms, sweeps, synthetics
+from openfisca_core.tools import assert_near
+
+
+def test_run_sweep():
+    tax_benefit_system = synthetics.new_tax_benefit_system(variables_count = 40, depth = 4, parameters_count = 4,
+        tax_scales_count = 2, seed = 1)
+    output_variables_name = tax_benefit_system.output_variables_name
+    legislation_patches_by_variant = [
+        [],
+        [dict(path = ('children', 'synthetic', 'children', 'taux_2', 'values'), period = 2013, value = 0.9)],
+        [
+            dict(path = ('children', 'synthetic', 'children', 'bareme_1', 'brackets', 3, 'rate'),
+                period = periods.period('year', 2010, 5), value = 0.6),
+            dict(path = ('children', 'synthetic', 'children', 'taux_0', 'values'), period = 2013, value = 0.01),
+            ],
+        ]
+    for processes_count in (1, 2):
+        simulation = synthetics.new_simulation(tax_benefit_system, persons_count = 200)
+        array_by_variable_name = sweeps.run_sweep(simulation, legislation_patches_by_variant, output_variables_name,
+            processes_count = processes_count)
+        assert array_by_variable_name.keys() == output_variables_name
+        for variant_index, legislation_patches in enumerate(legislation_patches_by_variant):
+            Reform = reforms.make_reform(legislation_patches = legislation_patches, name = u'Reform',
+                reference = tax_benefit_system)
+            Reform.input_variables_name = tax_benefit_system.input_variables_name
+            reform_simulation = synthetics.new_simulation(Reform(), persons_count = 200)
+            for variable_name in output_variables_name:
+                array = array_by_variable_name[variable_name]
+                assert array.shape[0] == len(legislation_patches_by_variant)
+                assert_near(array[variant_index], reform_simulation.calculate(variable_name),
+                    absolute_error_margin = 0.01)
+
+
+def test_run_sweep_with_brackets_and_inputs():
+    tax_benefit_system = synthetics.new_tax_benefit_system(variables_count = 40, depth = 4, parameters_count = 4,
+        tax_scales_count = 2, seed = 1)
+    # Bracket 1 of bareme_0 has a base and bracket 2 has no rate before 2014.
+    brackets_json = tax_benefit_system.legislation_json['children']['synthetic']['children']['bareme_0']['brackets']
+    brackets_json[1]['base'] = [dict(start = u'2000-01-01', stop = u'2030-12-31', value = 0.5)]
+    brackets_json[2]['rate'] = [dict(start = u'2014-01-01', stop = u'2030-12-31', value = 0.3)]
+    bracket_path = ('children', 'synthetic', 'children', 'bareme_0', 'brackets')
+    legislation_patches_by_variant = [
+        [],
+        [dict(path = bracket_path + (1, 'rate'), period = 2013, value = 0.6)],
+        [
+            dict(path = bracket_path + (2, 'rate'), period = 2013, value = 0.5),
+            dict(path = bracket_path + (3, 'rate'), period = 2013, value = 0.05),
+            ],
+        ]
+    output_variables_name = tax_benefit_system.output_variables_name
+    # Variable with a formula (using bareme_0), set as an input: variants must keep its input.
+    input_variable_name = 'variable_12'
+
+    def new_simulation(tax_benefit_system):
+        simulation = synthetics.new_simulation(tax_benefit_system, persons_count = 200)
+        holder = simulation.get_or_new_holder(input_variable_name)
+        holder.set_input(simulation.period, np.linspace(0, 50000, holder.entity.count).astype(holder.dtype))
+        return simulation
+
+    array_by_variable_name = sweeps.run_sweep(new_simulation(tax_benefit_system), legislation_patches_by_variant,
+        output_variables_name, processes_count = 1)
+    for variant_index, legislation_patches in enumerate(legislation_patches_by_variant):
+        Reform = reforms.make_reform(legislation_patches = legislation_patches, name = u'Reform',
+            reference = tax_benefit_system)
+        Reform.input_variables_name = tax_benefit_system.input_variables_name
+        reform_simulation = new_simulation(Reform())
+        for variable_name in output_variables_name:
+            assert_near(array_by_variable_name[variable_name][variant_index],
+                reform_simulation.calculate(variable_name), absolute_error_margin = 0.01)
+    variable_35_array = array_by_variable_name['variable_35']
+    assert not np.allclose(variable_35_array[0], variable_35_array[1])
+    assert not np.allclose(variable_35_array[0], variable_35_array[2])
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+
+
+# OpenFisca -- A versatile microsimulation software
+# By: OpenFisca Team <contact@openfisca.fr>
+#
+# Copyright (C) 2011, 2012, 2013, 2014, 2015 OpenFisca Team
+# https://github.com/openfisca
+#
+# This file is part of OpenFisca.
+#
+# OpenFisca is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# OpenFisca is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import json
+
+import numpy as np
+
+from openfisca_core import conv, formulas, legislationsxml, synthetics
+
+
+def test_synthetic_legislation():
+    legislation_json = synthetics.new_legislation_json(parameters_count = 3, tax_scales_count = 2, values_count = 4)
+    xml_legislation_json = conv.check(legislationsxml.xml_legislation_str_to_json)(synthetics.new_legislation_xml(
+        parameters_count = 3, tax_scales_count = 2, values_count = 4))
+    assert json.loads(json.dumps(xml_legislation_json)) == json.loads(json.dumps(legislation_json))
+
+
+def test_synthetic_population():
+    tax_benefit_system = synthetics.new_tax_benefit_system(variables_count = 10, depth = 2)
+    simulation = synthetics.new_simulation(tax_benefit_system, persons_count = 10000)
+    id_famille = simulation.calculate('id_famille')
+    role_dans_famille = simulation.calculate('role_dans_famille')
+    family_sizes = np.bincount(id_famille)
+    assert family_sizes.sum() == 10000
+    assert len(family_sizes) == simulation.entity_by_key_plural['familles'].count
+    assert abs((family_sizes == 1).mean() - synthetics.family_size_probabilities[0]) < 0.05
+    assert (role_dans_famille[family_sizes[id_famille] == 1] == 0).all()
+    assert (simulation.calculate('input_0')[role_dans_famille >= 2] == 0).all()
+
+
+def test_synthetic_tax_benefit_system():
+    tax_benefit_system = synthetics.new_tax_benefit_system(variables_count = 200, depth = 10, fan_out = 3,
+        inputs_count = 3, tax_scales_count = 2, values_count = 3)
+    assert len(tax_benefit_system.column_by_name) == 2 + 3 + 1 + 200
+    formula_classes = set(
+        column.formula_class.__bases__[0]
+        for column in tax_benefit_system.column_by_name.itervalues()
+        )
+    assert formula_classes >= set([formulas.DatedFormula, formulas.EntityToPerson, formulas.PersonToEntity,
+        formulas.SimpleFormula])
+    simulation = synthetics.new_simulation(tax_benefit_system, persons_count = 101)
+    for name in tax_benefit_system.output_variables_name:
+        array = simulation.calculate(name)
+        assert len(array) == simulation.entity_by_column_name[name].count
+        assert np.isfinite(array).all()
+
+
+def test_synthetic_categorical_inputs():
+    tax_benefit_system = synthetics.new_tax_benefit_system(variables_count = 10, depth = 2,
+        categorical_inputs_count = 2)
+    assert len(tax_benefit_system.column_by_name) == 2 + 5 + 1 + 2 + 10
+    for optimize_memory, age_dtype, enum_dtype in ((False, np.int32, np.int16), (True, np.int16, np.int8)):
+        simulation = synthetics.new_simulation(tax_benefit_system, optimize_memory = optimize_memory,
+            persons_count = 100)
+        age = simulation.calculate('categorical_input_0')
+        category = simulation.calculate('categorical_input_1')
+        assert age.dtype == age_dtype and ((0 <= age) & (age < 100)).all()
+        assert category.dtype == enum_dtype and ((0 <= category) & (category < synthetics.categories_count)).all()
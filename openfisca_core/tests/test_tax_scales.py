@@ -25,6 +25,7 @@
 
 import numpy as np
 
+from openfisca_core.stepvectors import StepVector
 from openfisca_core.taxscales import MarginalRateTaxScale
 from openfisca_core.tools import assert_near
 
@@ -85,3 +86,22 @@ if __name__ == '__main__':
     import logging
     import sys
     logging.basicConfig(level = logging.ERROR, stream = sys.stdout)
+
+
+def test_step_vector_marginal_tax_scale():
+    # 2 steps of 3 members each
+    base = np.array([50, 150, 250, 50, 150, 250])
+    thresholds = StepVector([100, 200])
+    rates = StepVector([0.1, 0.3])
+
+    marginal_tax_scale = MarginalRateTaxScale()
+    marginal_tax_scale.add_bracket(0, 0)
+    marginal_tax_scale.add_bracket(100, 0.1)
+    marginal_tax_scale.thresholds[1] = thresholds
+    marginal_tax_scale.rates[1] = rates
+    for step_index in range(2):
+        step_tax_scale = MarginalRateTaxScale()
+        step_tax_scale.add_bracket(0, 0)
+        step_tax_scale.add_bracket(thresholds[step_index], rates[step_index])
+        assert_near(marginal_tax_scale.calc(base)[step_index * 3:(step_index + 1) * 3],
+            step_tax_scale.calc(base[step_index * 3:(step_index + 1) * 3]), absolute_error_margin = 1e-10)
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+
+
+# OpenFisca -- A versatile microsimulation software
+# By: OpenFisca Team <contact@openfisca.fr>
+#
+# Copyright (C) 2011, 2012, 2013, 2014, 2015 OpenFisca Team
+# https://github.com/openfisca
+#
+# This file is part of OpenFisca.
+#
+# OpenFisca is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# OpenFisca is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from openfisca_core import tracers
+
+from . import test_countries
+
+
+def test_structured_trace():
+    year = 2013
+    simulation = test_countries.tax_benefit_system.new_scenario().init_single_entity(
+        parent1 = dict(salaire_brut = 50000),
+        parent2 = {},
+        period = year,
+        ).new_simulation(structured_trace = True)
+    simulation.calculate('revenu_disponible_famille')
+    tracer = simulation.profiler
+    assert isinstance(tracer, tracers.Tracer)
+    assert not tracer.node_indexes_stack
+    node_json_by_key = dict(
+        ((node_json['variable'], node_json['period']), node_json)
+        for node_json in tracer.to_json(with_summaries = True)
+        )
+    revenu_disponible_json = node_json_by_key[('revenu_disponible', u'2013')]
+    assert revenu_disponible_json['entity'] == u'individus'
+    assert revenu_disponible_json['calls'] == 1
+    dependencies_name = set(
+        tracer.nodes[node_index][0].column.name
+        for node_index in revenu_disponible_json['dependencies']
+        )
+    assert set(['rsa', 'salaire_imposable']) <= dependencies_name, dependencies_name
+    summary = revenu_disponible_json['summary']
+    assert summary['count'] == 2
+    assert summary['nonzero_count'] == 2
+    assert summary['min'] <= summary['mean'] <= summary['max']
+
+    salaire_brut_json = node_json_by_key[('salaire_brut', u'2013')]
+    assert salaire_brut_json['calls'] == 0
+    assert salaire_brut_json['cache_hits'] >= 1
+    assert salaire_brut_json['summary']['max'] == 50000
+    assert simulation.clone(structured_trace = True).profiler is not tracer
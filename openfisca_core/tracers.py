@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+
+
+# OpenFisca -- A versatile microsimulation software
+# By: OpenFisca Team <contact@openfisca.fr>
+#
+# Copyright (C) 2011, 2012, 2013, 2014, 2015 OpenFisca Team
+# https://github.com/openfisca
+#
+# This file is part of OpenFisca.
+#
+# OpenFisca is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# OpenFisca is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""Structured tracing of simulations, cheap enough for production-size populations
+
+Unlike the ``trace`` mode of simulations, a tracer never copies nor stringifies arrays: it only keeps references to
+the computed (variable, period) couples and to their dependencies. Summaries of arrays are computed on demand.
+"""
+
+
+import array
+import collections
+
+import numpy as np
+
+from . import profilers
+
+
+__all__ = ['Tracer']
+
+
+class Tracer(profilers.Profiler):
+    """A profiler that also keeps the graph of the computations of a simulation
+
+    Each node is a (variable, period) couple, either computed by a formula or found in cache (for example an input
+    variable). Edges go from a formula to the variables it requested.
+    """
+    edges = None  # Flat buffer of (caller node index, callee node index) couples
+    node_index_by_key = None
+    node_indexes_stack = None  # Indexes of the nodes being computed
+    nodes = None  # List of [holder, requested period, output period or None when not computed] by node index
+    summary_by_node_index = None
+
+    def __init__(self):
+        super(Tracer, self).__init__()
+        self.edges = array.array('l')
+        self.node_index_by_key = {}
+        self.node_indexes_stack = []
+        self.nodes = []
+        self.summary_by_node_index = {}
+
+    def add_edge(self, node_index):
+        node_indexes_stack = self.node_indexes_stack
+        if node_indexes_stack:
+            self.edges.append(node_indexes_stack[-1])
+            self.edges.append(node_index)
+
+    def get_or_new_node_index(self, holder, period):
+        key = (holder.column.name, period)
+        node_index = self.node_index_by_key.get(key)
+        if node_index is None:
+            self.node_index_by_key[key] = node_index = len(self.nodes)
+            self.nodes.append([holder, period, None])
+        return node_index
+
+    def iter_dependencies(self, node_index):
+        """Iterate the indexes of the nodes requested by the formula of a node."""
+        edges = self.edges
+        for index in xrange(0, len(edges), 2):
+            if edges[index] == node_index:
+                yield edges[index + 1]
+
+    def record_cache_hit(self, holder, period):
+        super(Tracer, self).record_cache_hit(holder, period)
+        self.add_edge(self.get_or_new_node_index(holder, period))
+
+    def start(self, holder, period):
+        super(Tracer, self).start(holder, period)
+        node_index = self.get_or_new_node_index(holder, period)
+        self.add_edge(node_index)
+        self.node_indexes_stack.append(node_index)
+
+    def stop(self, dated_holder = None):
+        super(Tracer, self).stop(dated_holder)
+        node_index = self.node_indexes_stack.pop()
+        if dated_holder is not None and not dated_holder.column.is_permanent:
+            self.nodes[node_index][2] = dated_holder.period
+
+    def summarize(self, node_index):
+        """Return the summary (count, min, max, mean, non zero count) of the array of a node. Summaries are cached."""
+        summary = self.summary_by_node_index.get(node_index)
+        if summary is None:
+            holder, period, output_period = self.nodes[node_index]
+            node_array = holder.at_period(period if output_period is None else output_period).array
+            summary = collections.OrderedDict()
+            if node_array is not None:
+                summary['count'] = node_array.size
+                if node_array.size and (node_array.dtype == np.bool_ or np.issubdtype(node_array.dtype, np.number)):
+                    summary['min'] = node_array.min().item()
+                    summary['max'] = node_array.max().item()
+                    summary['mean'] = float(node_array.mean(dtype = np.float64))
+                    summary['nonzero_count'] = int(np.count_nonzero(node_array))
+            self.summary_by_node_index[node_index] = summary
+        return summary
+
+    def to_json(self, with_summaries = False):
+        """Return the nodes of the trace with their dependencies and statistics, in order of first request."""
+        stats_by_key = self.stats_by_key
+        dependencies_by_node_index = collections.defaultdict(list)
+        edges = self.edges
+        for index in xrange(0, len(edges), 2):
+            dependencies = dependencies_by_node_index[edges[index]]
+            if edges[index + 1] not in dependencies:
+                dependencies.append(edges[index + 1])
+        nodes_json = []
+        for node_index, (holder, period, output_period) in enumerate(self.nodes):
+            calls, cache_hits, inclusive_time, exclusive_time, bytes_count = stats_by_key[(holder.column.name,
+                period)]
+            node_json = collections.OrderedDict((
+                ('variable', holder.column.name),
+                ('entity', holder.entity.key_plural),
+                ('period', None if period is None else unicode(period)),
+                ('output_period', None if output_period is None else unicode(output_period)),
+                ('calls', calls),
+                ('cache_hits', cache_hits),
+                ('inclusive_time', inclusive_time),
+                ('exclusive_time', exclusive_time),
+                ('dependencies', dependencies_by_node_index.get(node_index, [])),
+                ))
+            if with_summaries:
+                node_json['summary'] = self.summarize(node_index)
+            nodes_json.append(node_json)
+        return nodes_json
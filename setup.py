@@ -63,7 +63,7 @@ setup(
     install_requires = [
         'Babel >= 0.9.4',
         'Biryani[datetimeconv] >= 0.10.4dev',
-        'numpy',
+        'numpy >= 1.13',
         ],
     message_extractors = {
         'openfisca_core': [